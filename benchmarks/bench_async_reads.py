@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+"""
+Benchmarks the read routes of the Flask app against the async ASGI tier.
+
+Both apps are started with the same number of worker processes, pinned
+to the same CPU cores: gunicorn with threaded workers for
+web_flask/app.py and uvicorn for web_asgi/app.py. The same mix of GET
+requests is sent to each by a pool of concurrent clients, running on
+the remaining cores when there are any. It needs a MongoDB server,
+configured as for the API, and the packages of requirements-async.txt.
+Test data is seeded into a separate database, dropped afterwards:
+
+    python benchmarks/bench_async_reads.py --cores 0-1 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import httpx
+
+# The application is imported from the repository root, wherever the
+# benchmark is run from
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_NAME = 'bench_async_reads'
+
+
+def parse_cores(spec):
+    """Return the set of CPU numbers of a spec like '0-1,4'"""
+    cores = set()
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return cores
+
+
+def seed(communities, posts_per_community, therapists):
+    """Fill the benchmark database and return the paths to request"""
+    from models.user_model import User
+    from models.community_model import Community
+    from models.post_model import Post
+    from models.therapist_model import Therapist
+
+    users = [
+        User(username=f"bench{i}", email=f"bench{i}@example.com",
+             password_hash='x', status='active').save()
+        for i in range(20)
+    ]
+    community_ids, post_ids = [], []
+    for i in range(communities):
+        community = Community(
+            name=f"Community {i}", moderators=users[:3],
+            created_by=users[0], updated_by=users[0]
+        ).save()
+        community_ids.append(community.id)
+        for j in range(posts_per_community):
+            post = Post(
+                title=f"Post {j}", body='x' * 500,
+                community_id=community, user_id=random.choice(users),
+                created_by=users[0], updated_by=users[0]
+            ).save()
+            post_ids.append((community.id, post.id))
+    therapist_ids = [
+        Therapist(
+            user_id=random.choice(users), first_name=f"First{i}",
+            last_name=f"Last{i}", specialty=random.choice(['cbt', 'family']),
+            availability=['available'], acceptance_status='accepted',
+            created_by=users[0], updated_by=users[0]
+        ).save().id
+        for i in range(therapists)
+    ]
+
+    paths = ['/api/v1/community/view-all-communities',
+             '/api/v1/therapists/view-all-therapist?per_page=20',
+             '/api/v1/posts/feed?communities=' + ','.join(community_ids[:5])]
+    for community_id in community_ids:
+        paths.append(f'/api/v1/posts/community/{community_id}?per_page=20')
+        paths.append(f'/api/v1/posts/community/{community_id}?cursor=')
+        paths.append(f'/api/v1/community/view-single-communities/'
+                     f'{community_id}')
+    sampled = random.sample(post_ids, min(20, len(post_ids)))
+    for community_id, post_id in sampled:
+        paths.append(f'/api/v1/posts/community/{community_id}/post/{post_id}')
+        paths.append(f'/api/v1/like/post-like/{post_id}')
+    for therapist_id in therapist_ids[:20]:
+        paths.append(
+            f'/api/v1/therapists/view-single-therapist/{therapist_id}'
+        )
+    return paths
+
+
+def start_server(command, cores, env):
+    """Start a server process pinned to `cores`"""
+    return subprocess.Popen(
+        command, cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        preexec_fn=lambda: os.sched_setaffinity(0, cores)
+    )
+
+
+def wait_ready(base_url, path, timeout=30):
+    """Wait until the server at `base_url` answers `path`"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + path, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not start")
+
+
+async def load(base_url, paths, concurrency, duration):
+    """Request random paths from `concurrency` clients for `duration`
+    seconds and return the latencies in ms and the error count"""
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(random.choice(paths))
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def summarize(latencies, errors, duration):
+    """Return the throughput and latency percentiles of a run"""
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[int(len(latencies) * p / 100)], 2)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "p50_ms": percentile(50),
+        "p99_ms": percentile(99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async read tier benchmark")
+    parser.add_argument('--cores', default='0',
+                        help="CPU cores of the servers, e.g. 0-1")
+    parser.add_argument('--threads', type=int, default=8,
+                        help="threads per gunicorn worker")
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--communities', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=200,
+                        help="posts per community")
+    parser.add_argument('--therapists', type=int, default=200)
+    parser.add_argument(
+        '--json', action='store_true', help="print machine-readable results"
+    )
+    args = parser.parse_args()
+
+    cores = parse_cores(args.cores)
+    workers = str(len(cores))
+    env = dict(os.environ, DB_NAME=DB_NAME, PYTHONPATH=os.getcwd())
+    os.environ['DB_NAME'] = DB_NAME
+
+    # Keep the load generator off the cores of the servers when possible
+    others = os.sched_getaffinity(0) - cores
+    if others:
+        os.sched_setaffinity(0, others)
+
+    from mongoengine.connection import get_db
+    from models.engines.db_storage import DBStorage
+    storage = DBStorage()
+    get_db().client.drop_database(DB_NAME)
+    paths = seed(args.communities, args.posts, args.therapists)
+
+    servers = {
+        'flask': [sys.executable, '-m', 'gunicorn', '-w', workers,
+                  '--threads', str(args.threads), '-b', '127.0.0.1:8101',
+                  'web_flask.app:app'],
+        'asgi': [sys.executable, '-m', 'uvicorn', '--workers', workers,
+                 '--port', '8102', '--log-level', 'warning',
+                 'web_asgi.app:app']
+    }
+    results = {"cores": sorted(cores), "concurrency": args.concurrency}
+    try:
+        for (name, command), port in zip(servers.items(), (8101, 8102)):
+            base_url = f'http://127.0.0.1:{port}'
+            process = start_server(command, cores, env)
+            try:
+                wait_ready(base_url, paths[0])
+                asyncio.run(load(base_url, paths, args.concurrency, 2))
+                latencies, errors = asyncio.run(load(
+                    base_url, paths, args.concurrency, args.duration
+                ))
+                results[name] = summarize(latencies, errors, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        get_db().client.drop_database(DB_NAME)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"{workers} workers on cores {args.cores}, "
+          f"{args.concurrency} concurrent clients")
+    for name in servers:
+        r = results[name]
+        print(
+            f"  {name:<6} {r['throughput_rps']:>9.1f} req/s"
+            f"  p50 {r['p50_ms']:>8.2f} ms  p99 {r['p99_ms']:>8.2f} ms"
+            f"  {r['errors']} errors"
+        )
+
+
+if __name__ == '__main__':
+    main()
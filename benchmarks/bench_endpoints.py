@@ -0,0 +1,621 @@
+#!/usr/bin/python3
+"""
+Benchmarks every route of the API through the Flask test client.
+
+Users, communities, posts, comments, likes and therapists are seeded
+into an in-memory mongomock database, or with `--local` into a separate
+database of the MongoDB server configured as for the API, dropped
+afterwards. Every route registered in web_flask/app.py is then requested
+`--requests` times by a scenario of SCENARIOS, and its latency
+percentiles, throughput, status codes and database queries per request
+are reported, as counted by utils/query_stats.py. Endpoints over their
+query budget fail the run. Routes without a scenario are listed as
+uncovered.
+
+mongomock has no indexes, so its latencies grow with the seeded volumes
+and are only comparable between runs of the same volumes; the query
+counts do not depend on the database. Install the packages of
+requirements-bench.txt and run from the root of the repository:
+
+    python benchmarks/bench_endpoints.py --output bench.json
+    python benchmarks/bench_endpoints.py --baseline bench.json
+
+With `--baseline`, endpoints that make more queries per request, or
+whose p99 latency grew by more than `--tolerance`, are reported and the
+exit status is 1.
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# The application is imported from the repository root, wherever the
+# benchmark is run from
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_NAME = 'bench_endpoints'
+PASSWORD = 'bench-password'
+
+# Keep password hashing cheap and the login throttle out of the way,
+# unless configured otherwise
+BENCH_ENV = {
+    'PASSWORD_HASH_METHOD': 'pbkdf2',
+    'PASSWORD_HASH_COST': '1000',
+    'AUTH_RATE_LIMIT_PER_IP': '1000000000',
+    'AUTH_RATE_LIMIT_PER_USERNAME': '1000000000',
+}
+
+# Methods of mongomock collections that send a command to the server
+COUNTED_METHODS = (
+    'find', 'find_one', 'find_one_and_update', 'find_one_and_replace',
+    'find_one_and_delete', 'insert_one', 'insert_many', 'update_one',
+    'update_many', 'replace_one', 'delete_one', 'delete_many', 'aggregate',
+    'count_documents', 'estimated_document_count', 'distinct', 'bulk_write'
+)
+
+# Routes that are not part of the API
+SKIPPED = {'static'}
+
+
+def count_mongomock_commands():
+    """Record the calls of the collection methods of mongomock, which has
+    no command listeners, as the commands of the current request. Calls
+    these methods make to each other are not counted."""
+    import mongomock
+    from utils.query_stats import record
+    local = threading.local()
+
+    def counted(name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            depth = getattr(local, 'depth', 0)
+            local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                local.depth = depth
+                if not depth:
+                    record(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+
+    for name in COUNTED_METHODS:
+        setattr(mongomock.Collection, name,
+                counted(name, getattr(mongomock.Collection, name)))
+
+
+class Fixture:
+    """The seeded documents and access tokens the scenarios use"""
+
+    def __init__(self, users, admin, communities, posts, comments,
+                 therapists):
+        from flask_jwt_extended import create_access_token
+        from web_flask.app import app
+
+        self.users = users
+        self.admin = admin
+        self.communities = communities
+        self.posts = posts
+        self.comments = comments
+        self.therapists = therapists
+        with app.app_context():
+            self.tokens = {
+                user_id: create_access_token(
+                    identity=user_id, expires_delta=False
+                ) for user_id in users + [admin]
+            }
+        self.run = uuid.uuid4().hex[:8]
+
+    def user(self, i):
+        return self.users[i % len(self.users)]
+
+    def auth(self, user_id):
+        """Return the headers authenticating requests as `user_id`"""
+        if user_id not in self.tokens:
+            from flask_jwt_extended import create_access_token
+            from web_flask.app import app
+            with app.app_context():
+                self.tokens[user_id] = create_access_token(
+                    identity=user_id, expires_delta=False
+                )
+        return {'Authorization': f'Bearer {self.tokens[user_id]}'}
+
+    def vote(self, user_id, i):
+        """Cast a vote of `user_id` on a therapist and return its id"""
+        from models.like_model import Like
+        therapist_id = self.therapists[i % len(self.therapists)]
+        Like.set_vote(user_id, 'therapist_id', therapist_id, 1)
+        return Like._get_collection().find_one(
+            {'user_id': user_id, 'therapist_id': therapist_id}
+        )['_id']
+
+    def new_user(self, i):
+        """Create a user and return its id"""
+        from models.user_model import User
+        name = f'bench-{self.run}-{i}'
+        return User(username=name, email=f'{name}@example.com',
+                    password_hash='x', status='active').save().id
+
+
+def request(method, path, user_id=None, fx=None, **kwargs):
+    """Return the arguments of a test client request"""
+    if user_id:
+        kwargs['headers'] = fx.auth(user_id)
+    return dict(method=method, path=path, **kwargs)
+
+
+def create_community(fx, i):
+    from models.community_model import Community
+    return Community(name=f'Bench {fx.run} {i}').save().id
+
+
+def create_therapist(fx, i):
+    from models.therapist_model import Therapist
+    return Therapist(user_id=fx.user(i), first_name='Bench',
+                     last_name=str(i)).save().id
+
+
+# One request of each route and method, for the i-th iteration. Setup
+# done in a scenario is neither timed nor counted.
+SCENARIOS = {
+    ('auth.register', 'POST'): lambda fx, i: request(
+        'POST', '/api/v1/auth/register', json={
+            'username': f'new-{fx.run}-{i}',
+            'email': f'new-{fx.run}-{i}@example.com', 'password': PASSWORD
+        }),
+    ('auth.login', 'POST'): lambda fx, i: request(
+        'POST', '/api/v1/auth/login',
+        json={'username': 'bench0', 'password': PASSWORD}),
+    ('user.user_list', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/users/view-all', fx.admin, fx),
+    ('user.user_view', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/users/{fx.user(i)}'),
+    ('user02.user_update', 'PUT'): lambda fx, i: request(
+        'PUT', f'/api/v1/users/update/{fx.user(i)}', fx.user(i), fx,
+        json={'username': f'bench{i % len(fx.users)}'}),
+    ('user02.user_delete', 'DELETE'): lambda fx, i: (
+        lambda user_id: request(
+            'DELETE', f'/api/v1/users/delete/{user_id}', user_id, fx)
+    )(fx.new_user(i)),
+    ('roles.user_view', 'PUT'): lambda fx, i: request(
+        'PUT', f'/api/v1/assign-role/{fx.user(i)}', fx.admin, fx,
+        json={'role': 'user'}),
+    ('community00.create_community', 'POST'): lambda fx, i: request(
+        'POST', '/api/v1/community/create-community', fx.admin, fx,
+        json={'name': f'New {fx.run} {i}', 'description': 'x' * 200,
+              'moderators': [fx.user(i), fx.user(i + 1)]}),
+    ('community00.view_all_communities', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/community/view-all-communities'),
+    ('community00.view_single_community', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/community/view-single-communities/'
+        f'{random.choice(fx.communities)}'),
+    ('community01.update_community', 'PUT'): lambda fx, i: request(
+        'PUT', '/api/v1/community/update-community/'
+        f'{random.choice(fx.communities)}', fx.admin, fx,
+        json={'description': f'Updated {i}'}),
+    ('community01.delete_community', 'DELETE'): lambda fx, i: request(
+        'DELETE', '/api/v1/community/delete-community/'
+        f'{create_community(fx, i)}', fx.admin, fx),
+    ('community01.manage_community_moderators', 'PUT'): lambda fx, i: (
+        request(
+            'PUT', '/api/v1/community/manage-community-moderators/'
+            f'{random.choice(fx.communities)}', fx.admin, fx,
+            json={'add_moderators': [fx.user(i)],
+                  'remove_moderators': [fx.user(i + 1)]})),
+    ('community01.bulk_manage_moderators', 'PUT'): lambda fx, i: request(
+        'PUT', '/api/v1/community/manage-moderators-bulk', fx.admin, fx,
+        json={'changes': [
+            {'community_id': community_id, 'add_moderators': [fx.user(i)]}
+            for community_id in random.sample(
+                fx.communities, min(10, len(fx.communities)))
+        ]}),
+    ('post.create_post', 'POST'): lambda fx, i: request(
+        'POST', '/api/v1/posts', fx.user(i), fx,
+        json={'title': f'Post {i}', 'body': 'x' * 1000,
+              'community_id': random.choice(fx.communities)}),
+    ('post.edit_delete_post', 'PUT'): lambda fx, i: (
+        lambda post: request(
+            'PUT', f'/api/v1/posts/{post[1]}', post[2], fx,
+            json={'title': f'Edited {i}'})
+    )(random.choice(fx.posts)),
+    ('post.edit_delete_post', 'DELETE'): lambda fx, i: (
+        lambda post: request(
+            'DELETE', f'/api/v1/posts/{post[1]}', post[2], fx)
+    )(random.choice(fx.posts)),
+    ('fetch_post.feedresource', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/posts/feed', query_string={
+            'communities': ','.join(random.sample(
+                fx.communities, min(5, len(fx.communities))))}),
+    ('fetch_post.postsbycommunityresource', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/posts/community/{random.choice(fx.communities)}',
+        query_string={'per_page': 20}),
+    ('fetch_post.postbycommunityandpostresource', 'GET'): lambda fx, i: (
+        lambda post: request(
+            'GET', f'/api/v1/posts/community/{post[0]}/post/{post[1]}')
+    )(random.choice(fx.posts)),
+    ('fetch_post.postsbyuserresource', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/posts/user/{fx.user(i)}',
+        query_string={'per_page': 20}),
+    ('like.like_create', 'POST'): lambda fx, i: request(
+        'POST', '/api/v1/like/create-like', fx.user(i), fx,
+        json={'post_id': random.choice(fx.posts)[1], 'value': 1,
+              'mode': 'set'}),
+    ('like.like_update', 'PUT'): lambda fx, i: request(
+        'PUT', f'/api/v1/like/update-like/{fx.vote(fx.user(i), i)}',
+        fx.user(i), fx, json={'value': -1}),
+    ('like.like_delete', 'DELETE'): lambda fx, i: request(
+        'DELETE', f'/api/v1/like/delete-like/{fx.vote(fx.user(i), i)}',
+        fx.user(i), fx),
+    ('like.like_list', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/all-likes', fx.admin, fx),
+    ('like.vote_buffer', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/like/vote-buffer', fx.admin, fx),
+    ('like.like_by_user', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/like/user-like/{fx.user(i)}', fx.user(i), fx),
+    ('like.my_votes', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/like/my-votes', fx.user(i), fx, query_string={
+            'post_ids': ','.join(p[1] for p in random.sample(
+                fx.posts, min(20, len(fx.posts))))}),
+    ('like.like_by_post', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/like/post-like/{random.choice(fx.posts)[1]}'),
+    ('like.like_by_comment', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/like/comment-like/{random.choice(fx.comments)}'),
+    ('like.like_by_therapist', 'GET'): lambda fx, i: request(
+        'GET', f'/api/v1/like/therapist-like/'
+        f'{random.choice(fx.therapists)}'),
+    ('therapist.create_therapist', 'POST'): lambda fx, i: request(
+        'POST', '/api/v1/therapists/create-therapist', fx.user(i), fx,
+        json={'first_name': 'New', 'last_name': str(i), 'specialty': 'cbt',
+              'availability': ['available']}),
+    ('therapist.read_therapist', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/therapists/view-single-therapist/'
+        f'{random.choice(fx.therapists)}'),
+    ('therapist.view_all_therapists', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/therapists/view-all-therapist',
+        query_string={'per_page': 20}),
+    ('therapist.update_acceptance_status', 'PUT'): lambda fx, i: request(
+        'PUT', '/api/v1/therapists/update-therapist-status/'
+        f'{random.choice(fx.therapists)}', fx.admin, fx,
+        json={'acceptance_status': 'accepted'}),
+    ('therapist.delete_therapist', 'DELETE'): lambda fx, i: request(
+        'DELETE', '/api/v1/therapists/delete-therapist/'
+        f'{create_therapist(fx, i)}', fx.admin, fx),
+    ('diagnostics.queries', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/diagnostics/queries', fx.admin, fx),
+    ('diagnostics.slow_operations', 'GET'): lambda fx, i: request(
+        'GET', '/api/v1/diagnostics/slow-operations', fx.admin, fx),
+    ('health.health', 'GET'): lambda fx, i: request('GET', '/api/v1/health'),
+    ('metrics.metrics', 'GET'): lambda fx, i: request('GET', '/metrics'),
+    ('health.ready', 'GET'): lambda fx, i: request('GET', '/api/v1/ready'),
+    ('flasgger.apispec_1', 'GET'): lambda fx, i: request(
+        'GET', '/apispec_1.json'),
+    ('flasgger.apidocs', 'GET'): lambda fx, i: request('GET', '/apidocs/'),
+    ('flasgger.<lambda>', 'GET'): lambda fx, i: request(
+        'GET', '/apidocs/index.html'),
+    ('flasgger.oauth_redirect', 'GET'): lambda fx, i: request(
+        'GET', '/oauth2-redirect.html'),
+    ('flasgger.static', 'GET'): lambda fx, i: request(
+        'GET', '/flasgger_static/swagger-ui.css'),
+}
+
+
+def seed(users, communities, posts, comments, likes, therapists):
+    """Fill the database with synthetic documents and return a Fixture"""
+    from models.user_model import User
+    from models.community_model import Community
+    from models.post_model import Post, hot_score
+    from models.comment_model import Comment
+    from models.like_model import Like
+    from models.therapist_model import Therapist
+    from utils.passwords import hash_password
+
+    def insert(model, documents):
+        if documents:
+            model._get_collection().insert_many(
+                [document.to_mongo() for document in documents]
+            )
+        return [document.id for document in documents]
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def created_at():
+        return now - timedelta(seconds=random.randrange(30 * 24 * 3600))
+
+    password_hash = hash_password(PASSWORD)
+    user_ids = insert(User, [
+        User(username=f'bench{i}', email=f'bench{i}@example.com',
+             password_hash=password_hash, status='active')
+        for i in range(users)
+    ])
+    admin = insert(User, [User(
+        username='bench-admin', email='bench-admin@example.com',
+        password_hash=password_hash, status='active', role=['admin'],
+        is_superuser=True
+    )])[0]
+    community_ids = insert(Community, [
+        Community(name=f'Community {i}', description='x' * 200,
+                  moderators=random.sample(user_ids, min(3, users)),
+                  created_by=admin, updated_by=admin)
+        for i in range(communities)
+    ])
+    therapist_ids = insert(Therapist, [
+        Therapist(
+            user_id=random.choice(user_ids), first_name=f'First{i}',
+            last_name=f'Last{i}',
+            specialty=random.choice(['cbt', 'family', 'trauma']),
+            availability=[random.choice(['available', 'not available'])],
+            acceptance_status=random.choice(
+                ['accepted'] * 8 + ['pending', 'suspended']),
+            created_at=created_at(), created_by=admin, updated_by=admin
+        ) for i in range(therapists)
+    ])
+
+    post_docs, post_refs = [], []
+    for i in range(posts):
+        author = random.choice(user_ids)
+        community_id = random.choice(community_ids)
+        post_docs.append(Post(
+            title=f'Post {i}', body='x' * random.randrange(100, 3000),
+            community_id=community_id, user_id=author,
+            created_at=created_at(), created_by=author, updated_by=author
+        ))
+        post_refs.append((community_id, post_docs[-1].id, author))
+    comment_docs = [
+        Comment(user_id=random.choice(user_ids),
+                post_id=random.choice(post_docs).id, body='x' * 200)
+        for _ in range(comments)
+    ]
+
+    # Votes are unique per user and target, and counted on the target
+    targets = (
+        [('post_id', doc) for doc in post_docs]
+        + [('comment_id', doc) for doc in comment_docs]
+        + [('therapist_id', Therapist(id=t)) for t in therapist_ids]
+    )
+    votes = {}
+    for _ in range(likes):
+        field, target = random.choice(targets)
+        votes[random.choice(user_ids), field, target.id] = (
+            random.choice([1, 1, 1, -1]), target
+        )
+    like_docs = []
+    for (user_id, field, _), (value, target) in votes.items():
+        like_docs.append(Like(user_id=user_id, value=value,
+                              **{field: target.id}))
+        if not isinstance(target, Therapist):
+            target.vote_count += value
+    for doc in post_docs:
+        doc.hot_score = hot_score(doc.vote_count, doc.created_at)
+
+    post_ids = insert(Post, post_docs)
+    comment_ids = insert(Comment, comment_docs)
+    insert(Like, like_docs)
+
+    return Fixture(
+        user_ids, admin, community_ids,
+        post_refs,
+        comment_ids or [str(uuid.uuid4())], therapist_ids
+    ) if post_ids else None
+
+
+def route_methods(app):
+    """Return the (endpoint, method) pairs of the routes of `app`"""
+    return sorted({
+        (rule.endpoint, method)
+        for rule in app.url_map.iter_rules()
+        if rule.endpoint not in SKIPPED
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    })
+
+
+def percentile(latencies, p):
+    return round(latencies[min(int(len(latencies) * p / 100),
+                               len(latencies) - 1)], 3)
+
+
+def bench(client, scenario, fx, requests, warmup, time_limit):
+    """Run a scenario and return its results. A scenario stops early,
+    after at least one request, once it has run for `time_limit` seconds,
+    so a slow endpoint is reported without holding up the others."""
+    latencies, queries, db_times, statuses = [], [], [], {}
+    over_budget = 0
+    deadline = time.monotonic() + time_limit
+    for i in range(warmup + requests):
+        if latencies and time.monotonic() > deadline:
+            break
+        kwargs = scenario(fx, i)
+        start = time.perf_counter()
+        response = client.open(**kwargs)
+        elapsed = time.perf_counter() - start
+        if i < warmup and time.monotonic() < deadline:
+            continue
+        latencies.append(elapsed * 1000)
+        count = int(response.headers['X-DB-Queries'])
+        budget = response.headers.get('X-DB-Query-Budget')
+        queries.append(count)
+        db_times.append(float(response.headers['X-DB-Time-Ms']))
+        if budget and count > int(budget):
+            over_budget += 1
+        status = str(response.status_code)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    done = len(latencies)
+    total = sum(latencies) / 1000
+    latencies.sort()
+    return {
+        "path": kwargs['path'],
+        "requests": done,
+        "statuses": statuses,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "throughput_rps": round(done / total, 1) if total else None,
+        "queries": round(sum(queries) / done, 2),
+        "max_queries": max(queries),
+        "db_ms": round(sum(db_times) / done, 3),
+        "query_budget": int(budget) if budget else None,
+        "over_budget": over_budget
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of `results` over `baseline`"""
+    regressions = []
+    for name, result in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        if result["queries"] > before["queries"]:
+            regressions.append(
+                f"{name}: {before['queries']} -> {result['queries']} "
+                "queries per request"
+            )
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {before['p99_ms']} -> {result['p99_ms']} ms"
+            )
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpoint benchmark")
+    parser.add_argument('--requests', type=int, default=50,
+                        help="requests per endpoint")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--time-limit', type=float, default=10,
+                        help="seconds after which an endpoint stops early")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--communities', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=1000)
+    parser.add_argument('--likes', type=int, default=5000)
+    parser.add_argument('--therapists', type=int, default=200)
+    parser.add_argument('--endpoint', action='append',
+                        help="only run the endpoints containing this text")
+    parser.add_argument('--local', action='store_true',
+                        help="use the configured MongoDB server")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the synthetic data")
+    parser.add_argument('--output', help="write the results to this file")
+    parser.add_argument('--baseline',
+                        help="results of a previous run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative p99 latency increase")
+    parser.add_argument(
+        '--json', action='store_true', help="print machine-readable results"
+    )
+    args = parser.parse_args()
+    random.seed(args.seed)
+    volumes = {
+        name: getattr(args, name) for name in (
+            'users', 'communities', 'posts', 'comments', 'likes',
+            'therapists')
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("volumes") != volumes:
+            parser.error("the baseline was seeded with other volumes: "
+                         f"{baseline.get('volumes')}")
+
+    for variable, value in BENCH_ENV.items():
+        os.environ.setdefault(variable, value)
+    os.environ['DB_NAME'] = DB_NAME
+    os.environ.setdefault('JWT_SECRET_KEY', uuid.uuid4().hex)
+    os.environ.setdefault('FLASK_SECRET_KEY', uuid.uuid4().hex)
+
+    # The app reports the commands of each request in its headers
+    os.environ['QUERY_STATS_HEADERS'] = 'true'
+    from models.engines.db_storage import storage
+    if not args.local:
+        import mongomock
+        count_mongomock_commands()
+        storage.client_options['mongo_client_class'] = mongomock.MongoClient
+        storage.reconnect()
+
+    from mongoengine.connection import get_db
+    from web_flask.app import app
+    get_db().client.drop_database(DB_NAME)
+
+    try:
+        fx = seed(args.users, args.communities, args.posts, args.comments,
+                  args.likes, args.therapists)
+        client = app.test_client()
+        results = {
+            "commit": git_commit(),
+            "database": 'mongodb' if args.local else 'mongomock',
+            "volumes": volumes,
+            "endpoints": {},
+            "uncovered": []
+        }
+        for endpoint, method in route_methods(app):
+            name = f'{method} {endpoint}'
+            if args.endpoint and not any(e in name for e in args.endpoint):
+                continue
+            scenario = SCENARIOS.get((endpoint, method))
+            if not scenario:
+                results["uncovered"].append(name)
+                continue
+            results["endpoints"][name] = bench(
+                client, scenario, fx, args.requests, args.warmup,
+                args.time_limit
+            )
+    finally:
+        get_db().client.drop_database(DB_NAME)
+
+    regressions = []
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        results["regressions"] = regressions
+    over_budget = [
+        f"{name}: {r['max_queries']} queries, budget {r['query_budget']}"
+        for name, r in results["endpoints"].items() if r["over_budget"]
+    ]
+    results["over_budget"] = over_budget
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+    else:
+        print(f"{results['database']}, {args.requests} requests per "
+              f"endpoint, commit {results['commit']}")
+        for name, r in results["endpoints"].items():
+            statuses = ' '.join(f'{s}x{n}' for s, n in r['statuses'].items())
+            print(f"  {name:<55} {r['requests']:>5} requests"
+                  f"  p50 {r['p50_ms']:>8.2f} ms"
+                  f"  p99 {r['p99_ms']:>8.2f} ms"
+                  f"  {r['throughput_rps'] or 0:>8.1f} req/s"
+                  f"  {r['queries']:>6.2f} queries  {statuses}")
+        for name in results["uncovered"]:
+            print(f"  {name:<55} no scenario")
+        for regression in regressions:
+            print(f"  regression: {regression}")
+        for line in over_budget:
+            print(f"  over budget: {line}")
+    if regressions or over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Benchmarks the per-request cost of building a page of the post listing.
+
+It compares the previous read path, which decoded whole post documents
+and built a Post document for each of them, with the projected raw path
+used by views/fetch_post.py. Both paths start from BSON bytes, as they
+come off the wire, so the decoding work saved by the projection counts.
+No database is needed:
+
+    python benchmarks/bench_post_listing.py --per-page 100
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+import bson
+
+# The application is imported from the repository root, wherever the
+# benchmark is run from
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.post_model import Post  # noqa: E402
+from views.fetch_post import POST_LIST_FIELDS, serialize_post  # noqa: E402
+
+
+def make_raw_posts(count):
+    """Return `count` post documents as stored in MongoDB"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    author = str(uuid.uuid4())
+    community = str(uuid.uuid4())
+    return [{
+        '_id': str(uuid.uuid4()),
+        'created_at': now,
+        'updated_at': now,
+        'created_by': author,
+        'updated_by': author,
+        'title': f"Post title number {i}",
+        'body': 'x' * 5000,
+        'user_id': author,
+        'community_id': community,
+        'vote_count': i
+    } for i in range(count)]
+
+
+def document_path(payloads):
+    """Previous path: decode whole documents and hydrate Post objects"""
+    posts = [Post._from_son(bson.decode(payload)) for payload in payloads]
+    return [{
+        "id": str(post.id),
+        "title": post.title,
+        "content": post.body,
+        "created_at": post.created_at.isoformat()
+    } for post in posts]
+
+
+def raw_path(payloads):
+    """Current path: decode projected documents and serialize the dicts"""
+    return [serialize_post(bson.decode(payload)) for payload in payloads]
+
+
+def measure(func, payloads, iterations):
+    """Return the CPU time per call in ms and the peak memory in KiB"""
+    func(payloads)  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        func(payloads)
+    cpu_ms = (time.process_time() - start) * 1000 / iterations
+
+    tracemalloc.start()
+    func(payloads)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"cpu_ms": round(cpu_ms, 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post listing benchmark")
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument(
+        '--json', action='store_true', help="print machine-readable results"
+    )
+    args = parser.parse_args()
+
+    docs = make_raw_posts(args.per_page)
+    projected = {'_id'} | set(POST_LIST_FIELDS)
+    full_payloads = [bson.encode(doc) for doc in docs]
+    raw_payloads = [
+        bson.encode({k: v for k, v in doc.items() if k in projected})
+        for doc in docs
+    ]
+
+    results = {
+        "per_page": args.per_page,
+        "document": measure(document_path, full_payloads, args.iterations),
+        "raw": measure(raw_path, raw_payloads, args.iterations)
+    }
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"{args.per_page} posts per page")
+    for path in ('document', 'raw'):
+        print(
+            f"  {path:<9} {results[path]['cpu_ms']:>9.3f} ms CPU/request"
+            f"  {results[path]['peak_kib']:>9.1f} KiB peak"
+        )
+
+
+if __name__ == '__main__':
+    main()
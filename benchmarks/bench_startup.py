@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+"""
+Benchmarks the startup time of the API, for autoscaling.
+
+Three times are measured, over several runs each:
+
+- import: a fresh interpreter importing web_flask/app.py, which is what a
+  cold start or a worker without `preload_app` pays
+- first spec: the first request for the OpenAPI spec in that process,
+  served from the file of management/build_openapi.py when it was built
+- boot and respawn: gunicorn started with the production configuration
+  until it answers /api/v1/health, then a worker killed until its
+  replacement answers
+
+None of them needs the database, since connections are only opened on
+first use. Run from the root of the repository:
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+# The application is imported from the repository root, wherever the
+# benchmark is run from
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from web_flask.app import app
+imported = time.perf_counter()
+app.test_client().get('/apispec_1.json')
+served = time.perf_counter()
+print(json.dumps([imported - start, served - imported]))
+"""
+
+
+def time_import():
+    """Return the import time and the first spec request time, in ms, of
+    a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT], cwd=ROOT,
+        check=True, capture_output=True, text=True
+    ).stdout
+    return [t * 1000 for t in json.loads(output.splitlines()[-1])]
+
+
+def wait_healthy(url, timeout=60):
+    """Wait until `url` answers with a 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not answer")
+
+
+def worker_pids(master_pid):
+    """Return the pids of the worker processes of a gunicorn master"""
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def time_server(port):
+    """Return the boot time of gunicorn and the respawn time of a killed
+    worker, in ms"""
+    url = f'http://127.0.0.1:{port}/api/v1/health'
+    env = dict(os.environ, WEB_CONCURRENCY='1',
+               GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_ACCESS_LOG=os.devnull)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'web_flask/gunicorn.conf.py',
+         'web_flask.app:app'],
+        cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_healthy(url)
+        boot = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for pid in worker_pids(process.pid):
+            os.kill(pid, signal.SIGKILL)
+        wait_healthy(url)
+        respawn = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return boot * 1000, respawn * 1000
+
+
+def summarize(times):
+    """Return the median and the slowest of `times`"""
+    return {
+        "median_ms": round(statistics.median(times), 2),
+        "max_ms": round(max(times), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8103)
+    parser.add_argument('--no-server', action='store_true',
+                        help="skip the gunicorn boot and respawn runs")
+    parser.add_argument(
+        '--json', action='store_true', help="print machine-readable results"
+    )
+    args = parser.parse_args()
+    os.environ['PYTHONPATH'] = os.getcwd()
+
+    imports = [time_import() for _ in range(args.runs)]
+    results = {
+        "runs": args.runs,
+        "import": summarize([t[0] for t in imports]),
+        "first_spec": summarize([t[1] for t in imports])
+    }
+    if not args.no_server:
+        servers = [time_server(args.port) for _ in range(args.runs)]
+        results["boot"] = summarize([t[0] for t in servers])
+        results["respawn"] = summarize([t[1] for t in servers])
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"{args.runs} runs")
+    for name in ('import', 'first_spec', 'boot', 'respawn'):
+        if name in results:
+            r = results[name]
+            print(f"  {name:<11} median {r['median_ms']:>8.2f} ms"
+                  f"  max {r['max_ms']:>8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ from flask import jsonify
 from functools import wraps
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from flask import flash
+from utils.auth_context import auth_claims
 
 
 def owner_required(f):
@@ -16,5 +17,10 @@ def owner_required(f):
             flash("You are not authorized to perform this action.", "warning")
             return jsonify({"error": "Unauthorized"}), 403
 
+        # Ensure the logged-in user still exists and is not blocked
+        claims = auth_claims()
+        if not claims or claims['status'] == 'blocked':
+            return jsonify({"error": "Unauthorized"}), 403
+
         return f(*args, **kwargs)
     return decorated_function
@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+"""
+Contains the script to build the OpenAPI spec of the API ahead of time.
+
+flasgger otherwise builds the spec by parsing the YAML docstring of every
+view, once per worker, on the first request for it. The spec written here
+is served as-is instead (see web_flask/app.py). Run it on every build,
+as the Dockerfile does, since a stale file hides later docstring changes:
+
+    python management/build_openapi.py [output]
+"""
+
+import json
+import os
+import sys
+from web_flask.app import app, swagger, OPENAPI_SPEC
+
+
+def build_openapi(output):
+    """
+    Write the spec flasgger builds from the view docstrings to `output`.
+    """
+    with app.test_request_context():
+        spec = swagger.get_apispecs()
+    # web_flask/static is not tracked, so a clean checkout has none
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(spec, f, sort_keys=True)
+    print(f"OpenAPI spec of {len(spec['paths'])} paths written to {output}.")
+
+
+if __name__ == '__main__':
+    build_openapi(sys.argv[1] if len(sys.argv) > 1 else OPENAPI_SPEC)
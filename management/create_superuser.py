@@ -3,9 +3,9 @@
 Contains the script to create a superuser in the system.
 """
 
-from werkzeug.security import generate_password_hash
 from models.engines.db_storage import DBStorage
 from models.user_model import User
+from utils.passwords import hash_password
 
 
 def create_superuser():
@@ -23,7 +23,7 @@ def create_superuser():
         return
 
     # Hash the password
-    password_hash = generate_password_hash(password)
+    password_hash = hash_password(password)
 
     # Create the user with the hashed password and role
     admin_user = User(
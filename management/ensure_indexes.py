@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Contains the script to build and verify the declared MongoDB indexes.
+
+Run it before (or while) rolling out a release that declares new indexes,
+so the builds happen here instead of on the first request of a worker:
+
+    python management/ensure_indexes.py           # build, then report
+    python management/ensure_indexes.py --check   # report only
+"""
+
+import argparse
+from pymongo.errors import OperationFailure
+from models.engines.db_storage import DBStorage
+from models.user_model import User
+from models.community_model import Community
+from models.post_model import Post
+from models.comment_model import Comment
+from models.therapist_model import Therapist
+from models.like_model import Like
+from models.rate_limit_model import RateLimit
+
+MODELS = (User, Community, Post, Comment, Therapist, Like, RateLimit)
+
+
+def format_index(keys):
+    """Return a readable form of an index key specification"""
+    return ', '.join(f"{field}: {direction}" for field, direction in keys)
+
+
+def unused_indexes(model):
+    """Return the names of the indexes of `model` that have not served
+    a single operation since the server started"""
+    stats = model._get_collection().aggregate([{'$indexStats': {}}])
+    return [
+        stat['name'] for stat in stats
+        if stat['name'] != '_id_' and not stat['accesses']['ops']
+    ]
+
+
+def ensure_indexes(check_only=False):
+    """
+    Build the indexes declared on every model in the background and
+    report the missing, undeclared and unused ones.
+    Returns False if an index is missing or could not be built.
+    """
+    healthy = True
+    for model in MODELS:
+        name = model._get_collection_name()
+
+        if not check_only:
+            try:
+                model.ensure_indexes()
+            except OperationFailure as e:
+                # e.g. duplicate values under a new unique index
+                print(f"[{name}] index build failed: {e}")
+                healthy = False
+
+        diff = model.compare_indexes()
+        for keys in diff['missing']:
+            print(f"[{name}] missing index: {format_index(keys)}")
+            healthy = False
+        for keys in diff['extra']:
+            print(f"[{name}] undeclared index: {format_index(keys)}")
+        for index_name in unused_indexes(model):
+            print(f"[{name}] unused index: {index_name}")
+
+    print("Indexes are up to date." if healthy else "Indexes need attention.")
+    return healthy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--check', action='store_true',
+        help="only report missing and unused indexes, do not build"
+    )
+    args = parser.parse_args()
+
+    # Establish the database connection
+    storage = DBStorage()
+
+    # Build and verify the indexes
+    if not ensure_indexes(check_only=args.check):
+        raise SystemExit(1)
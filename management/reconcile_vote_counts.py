@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""
+Contains the script to reconcile the denormalized vote counters.
+
+Posts, comments and therapists keep the sum of their likes in
+`vote_count`, updated atomically on every vote. This recomputes the sums
+from the likes, in batches, and fixes any counter that has drifted:
+
+    python management/reconcile_vote_counts.py [--dry-run]
+"""
+
+import argparse
+from pymongo import UpdateOne
+from models.engines.db_storage import DBStorage
+from models.post_model import Post, HOT_SCORE_EXPRESSION
+from models.like_model import Like, TARGET_MODELS
+
+BATCH_SIZE = 1000
+
+
+def batches(cursor, size):
+    """Yield lists of up to `size` documents from `cursor`"""
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def vote_sums(field, target_ids):
+    """Return the sum of the like values of each target, computed by
+    an aggregation over the likes index on `field`"""
+    pipeline = [
+        {'$match': {field: {'$in': target_ids}}},
+        {'$group': {'_id': f'${field}', 'votes': {'$sum': '$value'}}}
+    ]
+    return {
+        row['_id']: row['votes']
+        for row in Like._get_collection().aggregate(pipeline)
+    }
+
+
+def fix_counter(model, target_id, stored, votes):
+    """Return the write setting the counter of a target to `votes`.
+
+    The write only applies if the counter still holds the value that was
+    read, so a vote landing during the reconciliation is never undone.
+    """
+    update = {'$set': {'vote_count': votes}}
+    if model is Post:
+        update = [update, {'$set': {'hot_score': HOT_SCORE_EXPRESSION}}]
+    return UpdateOne({'_id': target_id, 'vote_count': stored}, update)
+
+
+def reconcile_vote_counts(dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Recompute the vote counter of every post, comment and therapist.
+    """
+    for field, model in TARGET_MODELS.items():
+        collection = model._get_collection()
+        checked = drifted = 0
+        targets = collection.find({}, {'vote_count': 1}).sort('_id', 1)
+
+        for batch in batches(targets.batch_size(batch_size), batch_size):
+            sums = vote_sums(field, [doc['_id'] for doc in batch])
+            writes = []
+            for doc in batch:
+                stored = doc.get('vote_count')
+                votes = sums.get(doc['_id'], 0)
+                if stored != votes:
+                    writes.append(
+                        fix_counter(model, doc['_id'], stored, votes)
+                    )
+            checked += len(batch)
+            drifted += len(writes)
+            if writes and not dry_run:
+                collection.bulk_write(writes, ordered=False)
+
+        action = "found" if dry_run else "fixed"
+        print(
+            f"{model.__name__}: {checked} checked, "
+            f"{drifted} drifted counters {action}."
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--dry-run', action='store_true',
+        help="only report the drifted counters, do not fix them"
+    )
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    # Establish the database connection
+    storage = DBStorage()
+
+    # Reconcile the counters
+    reconcile_vote_counts(dry_run=args.dry_run, batch_size=args.batch_size)
@@ -0,0 +1,30 @@
+#!/usr/bin/python3
+"""
+Contains the script to recompute the "hot" ranking score of every post.
+
+Scores are kept up to date as posts are created and voted on, so this is
+only needed to backfill posts created before the score existed or after
+changing the ranking constants in models/post_model.py.
+"""
+
+from models.engines.db_storage import DBStorage
+from models.post_model import Post, HOT_SCORE_EXPRESSION
+
+
+def refresh_hot_scores():
+    """
+    Recompute the hot score of every post in a single server-side update.
+    """
+    result = Post._get_collection().update_many({}, [
+        {'$set': {'vote_count': {'$ifNull': ['$vote_count', 0]}}},
+        {'$set': {'hot_score': HOT_SCORE_EXPRESSION}}
+    ])
+    print(f"Hot score refreshed for {result.modified_count} posts.")
+
+
+if __name__ == '__main__':
+    # Establish the database connection
+    storage = DBStorage()
+
+    # Recompute the scores
+    refresh_hot_scores()
@@ -3,9 +3,9 @@
 Contains the script to reset a user's password in the system.
 """
 
-from werkzeug.security import generate_password_hash
 from models.engines.db_storage import DBStorage
 from models.user_model import User
+from utils.passwords import hash_password
 
 
 def reset_password():
@@ -24,7 +24,7 @@ def reset_password():
     new_password = input("Enter the new password: ")
 
     # Hash the new password
-    user.password_hash = generate_password_hash(new_password)
+    user.password_hash = hash_password(new_password)
 
     # Save the user with the updated password hash
     user.save()
@@ -6,6 +6,7 @@ Contains the BaseModel class for MongoDB models.
 from datetime import datetime, timezone
 import uuid
 from mongoengine import Document, StringField, DateTimeField, ReferenceField
+from models.engines.db_storage import AUTO_CREATE_INDEX
 
 
 class BaseModel(Document):
@@ -16,7 +17,15 @@ class BaseModel(Document):
     created_by = ReferenceField('User', required=False)
     updated_by = ReferenceField('User', required=False)
 
-    meta = {'abstract': True}
+    # Fields read when the document is batch-loaded as a reference by
+    # utils/dataloader.py, None for all of them
+    loader_fields = None
+
+    meta = {
+        'abstract': True,
+        'index_background': True,
+        'auto_create_index': AUTO_CREATE_INDEX
+    }
 
     def save(self, *args, **kwargs):
         """Override save to update `updated_at` and `updated_by` fields"""
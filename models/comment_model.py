@@ -2,7 +2,7 @@
 Contains the Comment model.
 """
 
-from mongoengine import StringField, ReferenceField
+from mongoengine import StringField, ReferenceField, IntField
 from models.base_model import BaseModel
 from models.user_model import User
 from models.post_model import Post
@@ -21,6 +21,28 @@ class Comment(BaseModel):
         'self', required=False, reverse_delete_rule='CASCADE'
         )
     body = StringField(required=True, max_length=1000)
+    vote_count = IntField(default=0)
+
+    meta = {
+        'indexes': [
+            # Comments of a post and replies to a comment, oldest first
+            ('post_id', 'created_at'),
+            ('comment_id', 'created_at'),
+            'user_id',
+        ]
+    }
+
+    @staticmethod
+    def vote_update(delta):
+        """Return the update adding `delta` to the vote count of a comment"""
+        return {'$inc': {'vote_count': delta}}
+
+    @classmethod
+    def apply_vote(cls, comment_id, delta):
+        """Atomically add `delta` to the vote count of a comment"""
+        cls._get_collection().update_one(
+            {'_id': comment_id}, cls.vote_update(delta)
+        )
 
     def __str__(self):
         return (
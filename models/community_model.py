@@ -3,12 +3,25 @@
 Contains the Community model.
 """
 
-from mongoengine import StringField, ListField, ReferenceField
+from datetime import datetime, timezone
+from mongoengine import (
+    StringField, ListField, ReferenceField, IntField, DateTimeField
+)
+from pymongo import ReturnDocument
 from models.base_model import BaseModel
 from models.user_model import User
 from models.engines.db_storage import storage
 
 
+def start_feed_update():
+    """Return the update setting `feed_updated_at` to now if it is unset.
+    Any change to the posts before now is older, and any change after it
+    bumps the feed, so now is a valid Last-Modified date of the feed."""
+    return [{'$set': {'feed_updated_at': {
+        '$ifNull': ['$feed_updated_at', datetime.now(timezone.utc)]
+    }}}]
+
+
 class Community(BaseModel):
     """Model representing a Community (like a subreddit)"""
     name = StringField(required=True, unique=True, max_length=100)
@@ -16,6 +29,39 @@ class Community(BaseModel):
     moderators = ListField(
         ReferenceField(User, reverse_delete_rule='CASCADE')
         )
+    # Bumped whenever a post of the community is created, edited or
+    # deleted, to validate cached copies of the community feed
+    feed_version = IntField(default=0)
+    feed_updated_at = DateTimeField(
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+    meta = {
+        'indexes': [
+            # `name` is indexed by its unique constraint. Communities of a
+            # moderator are looked up when a user is deleted.
+            'moderators',
+        ]
+    }
+
+    @classmethod
+    def bump_feed(cls, community_id):
+        """Record that the posts of a community have changed"""
+        cls.objects(id=community_id).update_one(
+            inc__feed_version=1,
+            set__feed_updated_at=datetime.now(timezone.utc)
+        )
+
+    @classmethod
+    def start_feed(cls, community_id):
+        """Return when the posts of a community last changed, recording
+        now for a community whose feed was never bumped"""
+        community = cls._get_collection().find_one_and_update(
+            {'_id': community_id}, start_feed_update(),
+            projection={'feed_updated_at': True},
+            return_document=ReturnDocument.AFTER
+        )
+        return community and community['feed_updated_at']
 
     def __str__(self):
         return f"<Community {self.name}>"
@@ -2,44 +2,121 @@
 Contains the class DBStorage for MongoDB connections.
 """
 
-from mongoengine import connect
+from mongoengine import disconnect
+from mongoengine.connection import (
+    DEFAULT_CONNECTION_NAME, get_db, register_connection
+)
 from os import getenv
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file
 load_dotenv()
 
+# Whether documents build their declared indexes on first use. Deploys
+# that build indexes ahead of time with management/ensure_indexes.py can
+# turn this off so workers never wait on an index build.
+AUTO_CREATE_INDEX = getenv('DB_AUTO_CREATE_INDEX', 'true').lower() == 'true'
+
+# Connection pool settings of the MongoDB client, read from the variable
+# named after the setting (e.g. DB_MAX_POOL_SIZE). Unset ones keep the
+# driver's defaults.
+POOL_SETTINGS = {
+    'maxPoolSize': 'DB_MAX_POOL_SIZE',
+    'minPoolSize': 'DB_MIN_POOL_SIZE',
+    'maxIdleTimeMS': 'DB_MAX_IDLE_TIME_MS',
+    'waitQueueTimeoutMS': 'DB_WAIT_QUEUE_TIMEOUT_MS',
+    'connectTimeoutMS': 'DB_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'DB_SOCKET_TIMEOUT_MS',
+    'serverSelectionTimeoutMS': 'DB_SERVER_SELECTION_TIMEOUT_MS',
+}
+
+# Connection alias of the client that read-heavy routes may read through
+# (see utils/read_routing.py). It is only created when DB_READ_PREFERENCE
+# allows reading from secondaries, e.g. `secondaryPreferred`.
+READ_ALIAS = 'read'
+READ_PREFERENCE = getenv('DB_READ_PREFERENCE', 'primary')
+READ_MAX_STALENESS = int(getenv('DB_READ_MAX_STALENESS_SECONDS', -1))
+
+
+def pool_settings():
+    """Return the configured connection pool settings"""
+    return {
+        option: int(getenv(variable))
+        for option, variable in POOL_SETTINGS.items() if getenv(variable)
+    }
+
 
 class DBStorage:
     """Interacts with the MongoDB database"""
 
-    def __init__(self):
+    def __init__(self, alias=DEFAULT_CONNECTION_NAME, **client_options):
         """Instantiate a DBStorage object
-        and establish a connection to MongoDB"""
+        and register its connection to MongoDB"""
+        self.alias = alias
         self.db_name = getenv('DB_NAME')
         self.db_host = getenv('DB_HOST', 'localhost')
         self.db_port = int(getenv('DB_PORT', 27017))
         self.db_username = getenv('DB_USERNAME')
         self.db_password = getenv('DB_PASSWORD')
+        self.pool_settings = pool_settings()
+        self.client_options = client_options
 
-        # Establish MongoDB connection
+        # Register the MongoDB connection
         self.__connect()
 
     def __connect(self):
-        """Connect to MongoDB"""
-        connect(
+        """Register the connection to MongoDB.
+
+        Nothing is created on import: mongoengine creates the client when
+        a document first needs its database, and the client only opens its
+        sockets and monitoring threads on its first operation
+        (`connect=False`), so a process that forks worker processes before
+        serving requests hands them no connections.
+        """
+        register_connection(
             db=self.db_name,
+            alias=self.alias,
             host=self.db_host,
             port=self.db_port,
             username=self.db_username,
-            password=self.db_password
+            password=self.db_password,
+            connect=False,
+            **self.pool_settings,
+            **self.client_options
         )
 
+    def add_listener(self, listener):
+        """Register a pymongo event listener on this connection only,
+        unlike `monitoring.register`, which listens to every client. Add
+        listeners before the client is first used."""
+        listeners = self.client_options.get('event_listeners', [])
+        self.client_options['event_listeners'] = listeners + [listener]
+        self.reconnect()
+
     def close(self):
-        """Placeholder method for closing the connection if needed"""
-        # In MongoEngine, connections are handled automatically.
-        pass
+        """Close the connections of the client and unregister it"""
+        disconnect(alias=self.alias)
+
+    def reconnect(self):
+        """Replace the client with a new one, e.g. in a forked worker
+        process, which must not use the client of its parent"""
+        self.close()
+        self.__connect()
+
+    def ping(self):
+        """Check that the database answers, raises on failure"""
+        get_db(self.alias).client.admin.command('ping')
 
 
 # Create a DBStorage instance to manage MongoDB connections
 storage = DBStorage()
+
+# And one reading from replicas, if enabled. Writes made through it would
+# still go to the primary, but only reads are routed to it.
+replica_storage = None
+if READ_PREFERENCE != 'primary':
+    replica_storage = DBStorage(
+        alias=READ_ALIAS,
+        readPreference=READ_PREFERENCE,
+        maxStalenessSeconds=READ_MAX_STALENESS
+    )
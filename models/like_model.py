@@ -3,7 +3,11 @@
 Contains the Like model.
 """
 
+import uuid
+from datetime import datetime, timezone
 from mongoengine import ReferenceField, IntField
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from models.base_model import BaseModel
 from models.therapist_model import Therapist
 from models.user_model import User
@@ -11,6 +15,25 @@ from models.post_model import Post
 from models.comment_model import Comment
 from models.engines.db_storage import storage
 
+# The reference fields of a like, one of which names what is liked, and
+# the models they refer to
+TARGET_MODELS = {
+    'post_id': Post,
+    'comment_id': Comment,
+    'therapist_id': Therapist
+}
+TARGET_FIELDS = tuple(TARGET_MODELS)
+
+
+def _retry_on_duplicate(operation):
+    """Run an upsert, retrying it once if a concurrent upsert of the same
+    vote won the race to insert it (the unique index rejects the loser,
+    and the retry then matches the winner's document)"""
+    try:
+        return operation()
+    except DuplicateKeyError:
+        return operation()
+
 
 class Like(BaseModel):
     """Model representing a Like on a post or comment or a Therapist"""
@@ -20,6 +43,132 @@ class Like(BaseModel):
     therapist_id = ReferenceField(Therapist, reverse_delete_rule='CASCADE')
     value = IntField(choices=[1, -1], required=True)
 
+    meta = {
+        'indexes': [
+            # One like per user per target. A like only stores the
+            # reference of its own target, so each index only covers the
+            # likes of one target type.
+            {
+                'fields': ['user_id', 'post_id'],
+                'unique': True,
+                'partialFilterExpression': {'post_id': {'$exists': True}}
+            },
+            {
+                'fields': ['user_id', 'comment_id'],
+                'unique': True,
+                'partialFilterExpression': {'comment_id': {'$exists': True}}
+            },
+            {
+                'fields': ['user_id', 'therapist_id'],
+                'unique': True,
+                'partialFilterExpression': {
+                    'therapist_id': {'$exists': True}
+                }
+            },
+            # Likes of a user, and likes of a target
+            ('user_id', '-created_at'),
+            'post_id',
+            'comment_id',
+            'therapist_id',
+        ]
+    }
+
+    @classmethod
+    def apply_vote_delta(cls, field, target_id, delta):
+        """Atomically add `delta` to the vote count of a like target"""
+        if field and delta:
+            TARGET_MODELS[field].apply_vote(target_id, delta)
+
+    @staticmethod
+    def _new_vote(value):
+        """Return the fields of a vote document being inserted"""
+        now = datetime.now(timezone.utc)
+        return {
+            '_id': str(uuid.uuid4()),
+            'created_at': now,
+            'updated_at': now,
+            'value': value
+        }
+
+    @classmethod
+    def insert_vote(cls, user_id, field, target_id, value):
+        """Insert a vote of a user on a target in a single upsert, unless
+        the user has already voted on it. Returns True if inserted."""
+        vote = {'user_id': user_id, field: target_id}
+        result = _retry_on_duplicate(
+            lambda: cls._get_collection().update_one(
+                vote, {'$setOnInsert': cls._new_vote(value)}, upsert=True
+            )
+        )
+        return result.upserted_id is not None
+
+    @classmethod
+    def set_vote(cls, user_id, field, target_id, value):
+        """Create or change the vote of a user on a target in a single
+        upsert. Returns the previous value, None if there was no vote."""
+        vote = {'user_id': user_id, field: target_id}
+        inserted = cls._new_vote(value)
+        del inserted['value'], inserted['updated_at']
+        previous = _retry_on_duplicate(
+            lambda: cls._get_collection().find_one_and_update(
+                vote,
+                {
+                    '$set': {
+                        'value': value,
+                        'updated_at': datetime.now(timezone.utc)
+                    },
+                    '$setOnInsert': inserted
+                },
+                projection={'value': True},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        )
+        return previous['value'] if previous else None
+
+    @classmethod
+    def remove_vote(cls, query):
+        """Delete the vote matching a raw query. Returns the deleted
+        document (with its target and value) or None."""
+        return cls._get_collection().find_one_and_delete(
+            query, projection=('value',) + TARGET_FIELDS
+        )
+
+    @classmethod
+    def change_vote(cls, query, value):
+        """Set the value of the vote matching a raw query. Returns the
+        document before the change (with its target and value) or None."""
+        return cls._get_collection().find_one_and_update(
+            query,
+            {'$set': {
+                'value': value,
+                'updated_at': datetime.now(timezone.utc)
+            }},
+            projection=('value',) + TARGET_FIELDS,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    @classmethod
+    def votes_of(cls, user_id, field, target_ids):
+        """Return the votes of a user on the given targets as a mapping of
+        target id to value, read with one `$in` query on the unique
+        (user, target) index. Targets without a vote are left out."""
+        if not target_ids:
+            return {}
+        cursor = cls._get_collection().find(
+            {'user_id': user_id, field: {'$in': list(target_ids)}},
+            projection={field: True, 'value': True, '_id': False}
+        )
+        return {doc[field]: doc['value'] for doc in cursor}
+
+    @staticmethod
+    def raw_target(doc):
+        """Return the field and id of the target of a raw like document"""
+        for field in TARGET_FIELDS:
+            if doc.get(field):
+                return field, doc[field]
+        return None, None
+
     def __str__(self):
         return (f"<Like {self.user_id} -> "
                 f"{self.post_id or self.comment_id or self.therapist_id}>")
@@ -2,12 +2,60 @@
 Contains the Post model.
 """
 
-from mongoengine import StringField, IntField, ReferenceField
+from datetime import datetime, timezone
+from math import log10
+from mongoengine import (
+    StringField, IntField, FloatField, ReferenceField, QuerySet
+)
 from models.base_model import BaseModel
 from models.user_model import User
 from models.community_model import Community
 from models.engines.db_storage import storage
 
+# A post needs ten times the votes of a post HOT_DECAY_SECONDS younger
+# to rank at the same place in the "hot" feed.
+HOT_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HOT_DECAY_SECONDS = 45000
+
+# Server-side form of `hot_score()`, used in pipeline updates so the score
+# is recomputed in the same atomic write that changes the vote count.
+HOT_SCORE_EXPRESSION = {
+    '$add': [
+        {'$multiply': [
+            {'$cond': [{'$gt': ['$vote_count', 0]}, 1,
+                       {'$cond': [{'$lt': ['$vote_count', 0]}, -1, 0]}]},
+            {'$log10': {'$max': [{'$abs': '$vote_count'}, 1]}}
+        ]},
+        {'$divide': [
+            {'$subtract': ['$created_at', HOT_EPOCH]},
+            HOT_DECAY_SECONDS * 1000
+        ]}
+    ]
+}
+
+
+def hot_score(vote_count, created_at):
+    """Return the time-decayed ranking score of a post"""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    sign = (vote_count > 0) - (vote_count < 0)
+    order = log10(max(abs(vote_count), 1))
+    age = (created_at - HOT_EPOCH).total_seconds()
+    return sign * order + age / HOT_DECAY_SECONDS
+
+
+class PostQuerySet(QuerySet):
+    """Bumps the feed of the communities of the posts it deletes, whether
+    through `Post.delete` or a bulk delete like `Post.objects(...).delete()`
+    """
+
+    def delete(self, *args, **kwargs):
+        communities = self._collection.distinct('community_id', self._query)
+        deleted = super().delete(*args, **kwargs)
+        for community_id in communities:
+            Community.bump_feed(community_id)
+        return deleted
+
 
 class Post(BaseModel):
     """Model representing a Post"""
@@ -18,6 +66,46 @@ class Post(BaseModel):
         )
     community_id = ReferenceField(Community, required=True)
     vote_count = IntField(default=0)
+    hot_score = FloatField(default=0)
+
+    meta = {
+        'queryset_class': PostQuerySet,
+        'indexes': [
+            # Keyset pagination of community and user feeds, newest first
+            ('community_id', '-created_at', '-id'),
+            ('user_id', '-created_at', '-id'),
+            # "Hot" community feed
+            ('community_id', '-hot_score', '-id'),
+        ]
+    }
+
+    def save(self, *args, **kwargs):
+        """Override save to give a new post its `hot_score`. Votes keep
+        it up to date afterwards, in the write that changes the vote
+        count, so saving an edit must not recompute it from a vote count
+        read before the edit."""
+        if self._created:
+            self.hot_score = hot_score(self.vote_count, self.created_at)
+        return super().save(*args, **kwargs)
+
+    @staticmethod
+    def vote_update(delta):
+        """Return the update adding `delta` to the vote count of a post
+        and recomputing its hot score in the same write"""
+        return [
+            {'$set': {'vote_count': {
+                '$add': [{'$ifNull': ['$vote_count', 0]}, delta]
+            }}},
+            {'$set': {'hot_score': HOT_SCORE_EXPRESSION}}
+        ]
+
+    @classmethod
+    def apply_vote(cls, post_id, delta):
+        """Atomically add `delta` to the vote count of a post and
+        recompute its hot score"""
+        cls._get_collection().update_one(
+            {'_id': post_id}, cls.vote_update(delta)
+        )
 
     def __str__(self):
         return f"<Post {self.title}>"
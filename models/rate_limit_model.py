@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+"""
+Contains the RateLimit model.
+"""
+
+from mongoengine import Document, StringField, IntField, DateTimeField
+from models.engines.db_storage import AUTO_CREATE_INDEX
+
+
+class RateLimit(Document):
+    """The request counters of one rate limited key, shared by every
+    worker (see utils/rate_limit.py)"""
+    id = StringField(primary_key=True)
+    bucket = IntField(required=True)
+    count = IntField(default=0)
+    prev = IntField(default=0)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'rate_limit',
+        'index_background': True,
+        'auto_create_index': AUTO_CREATE_INDEX,
+        'indexes': [
+            # Let the server drop the counters of idle keys
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+        ]
+    }
@@ -3,7 +3,7 @@
 Contains the Therapist model.
 """
 
-from mongoengine import StringField, ListField, ReferenceField
+from mongoengine import StringField, ListField, ReferenceField, IntField
 from models.base_model import BaseModel
 from models.engines.db_storage import storage
 from models.user_model import User
@@ -29,6 +29,30 @@ class Therapist(BaseModel):
         choices=['accepted', 'suspended', 'pending'],
         default='pending'
     )
+    vote_count = IntField(default=0)
+
+    meta = {
+        'indexes': [
+            # Therapist directory, newest first, optionally filtered by
+            # specialty or availability (see ListTherapistsResource)
+            ('acceptance_status', '-created_at', '-id'),
+            ('acceptance_status', 'specialty', '-created_at', '-id'),
+            ('acceptance_status', 'availability', '-created_at', '-id'),
+            'user_id',
+        ]
+    }
+
+    @staticmethod
+    def vote_update(delta):
+        """Return the update adding `delta` to the vote count of a therapist"""
+        return {'$inc': {'vote_count': delta}}
+
+    @classmethod
+    def apply_vote(cls, therapist_id, delta):
+        """Atomically add `delta` to the vote count of a therapist"""
+        cls._get_collection().update_one(
+            {'_id': therapist_id}, cls.vote_update(delta)
+        )
 
     def __str__(self):
         return f"<Therapist {self.first_name} {self.last_name}>"
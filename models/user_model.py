@@ -25,5 +25,8 @@ class User(BaseModel):
         required=True
     )
 
+    # Never load credentials along with a referenced user
+    loader_fields = ('id', 'username', 'role', 'is_superuser', 'status')
+
     def __str__(self):
         return f"<User {self.username}>"
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""
+Tests of the multi-community feed merged from one stream per community,
+against a mongomock database.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+
+import mongomock
+from flask import Flask
+
+os.environ.setdefault('DB_NAME', 'test_feed')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.post_model import Post  # noqa: E402
+from utils.pagination import (  # noqa: E402
+    decode_positions, encode_positions
+)
+from views.fetch_post import FeedResource, merge_feeds  # noqa: E402
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+class TestMergeFeeds(unittest.TestCase):
+
+    def setUp(self):
+        Post._get_collection().delete_many({})
+        self.app = Flask(__name__)
+        context = self.app.test_request_context('/')
+        context.push()
+        self.addCleanup(context.pop)
+
+    def insert_posts(self, community_id, minutes):
+        Post._get_collection().insert_many([
+            {'_id': f'{community_id}-{i}', 'community_id': community_id,
+             'title': 't', 'body': 'b',
+             'created_at': START + timedelta(minutes=minute)}
+            for i, minute in enumerate(minutes)
+        ])
+
+    def walk(self, community_ids, limit):
+        """Return the pages of the feed read by following its cursors"""
+        pages, positions = [], {}
+        while True:
+            posts, cursor = merge_feeds(community_ids, positions, limit)
+            pages.append([post['_id'] for post in posts])
+            if cursor is None:
+                return pages
+            positions = decode_positions(cursor)
+
+    def test_pages_are_newest_first_and_never_repeat_a_post(self):
+        # Posts of different communities created at the same minute
+        self.insert_posts('a', [9, 7, 7, 3, 1])
+        self.insert_posts('b', [8, 7, 2])
+        self.insert_posts('c', [7, 7, 7, 7])
+        pages = self.walk(['a', 'b', 'c'], 3)
+
+        posts = sum(pages, [])
+        self.assertEqual(len(posts), 12)
+        self.assertEqual(len(set(posts)), 12)
+        stored = {
+            doc['_id']: (doc['created_at'], doc['_id'])
+            for doc in Post._get_collection().find()
+        }
+        self.assertEqual(
+            posts, sorted(posts, key=stored.get, reverse=True)
+        )
+        self.assertTrue(all(len(page) == 3 for page in pages[:-1]))
+
+    def test_exhausted_communities_keep_their_position(self):
+        self.insert_posts('a', [9])
+        self.insert_posts('b', [8, 2, 1])
+        posts, cursor = merge_feeds(['a', 'b'], {}, 2)
+        self.assertEqual([post['_id'] for post in posts], ['a-0', 'b-0'])
+
+        positions = decode_positions(cursor)
+        self.assertEqual(positions['a'], (START + timedelta(minutes=9),
+                                          'a-0'))
+        posts, cursor = merge_feeds(['a', 'b'], positions, 2)
+        self.assertEqual([post['_id'] for post in posts], ['b-1', 'b-2'])
+        # The read of `b` was cut off at the limit, so one more (empty)
+        # page is needed to find out it is over
+        posts, cursor = merge_feeds(['a', 'b'], decode_positions(cursor), 2)
+        self.assertEqual((posts, cursor), ([], None))
+
+    def test_no_posts_means_no_cursor(self):
+        self.assertEqual(merge_feeds(['a', 'b'], {}, 5), ([], None))
+
+    def test_position_round_trips_through_the_cursor(self):
+        positions = {'a': (START, 'a-0'), 'b': (START, 'b-3')}
+        self.assertEqual(
+            decode_positions(encode_positions(positions)), positions
+        )
+
+
+class TestFeedResource(unittest.TestCase):
+
+    def setUp(self):
+        Post._get_collection().delete_many({})
+        Post._get_collection().insert_many([
+            {'_id': f'p{i}', 'community_id': 'a', 'title': 't',
+             'body': 'b', 'created_at': START + timedelta(minutes=i)}
+            for i in range(3)
+        ])
+        self.app = Flask(__name__)
+
+    def get(self, query):
+        with self.app.test_request_context('/' + query):
+            return FeedResource().get()
+
+    def test_repeated_communities_are_read_once(self):
+        body, status = self.get('?communities=a,a,,a&limit=5')
+        self.assertEqual(status, 200)
+        self.assertEqual([p['id'] for p in body['posts']],
+                         ['p2', 'p1', 'p0'])
+
+    def test_invalid_requests(self):
+        for query in ('?communities=', '?communities=a&cursor=bad'):
+            body, status = self.get(query)
+            self.assertEqual(status, 400, query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""
+Tests of the "hot" ranking score of posts, against a mongomock database.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+os.environ.setdefault('DB_NAME', 'test_hot_ranking')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.post_model import (  # noqa: E402
+    HOT_DECAY_SECONDS, Post, hot_score
+)
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+CREATED_AT = datetime(2024, 6, 1, 8, 30, tzinfo=timezone.utc)
+
+
+class TestHotScore(unittest.TestCase):
+
+    def test_ten_times_the_votes_make_up_for_the_decay(self):
+        younger = CREATED_AT + timedelta(seconds=HOT_DECAY_SECONDS)
+        self.assertAlmostEqual(
+            hot_score(100, CREATED_AT), hot_score(10, younger)
+        )
+
+    def test_downvoted_posts_rank_below_unvoted_ones(self):
+        self.assertLess(hot_score(-10, CREATED_AT), hot_score(0, CREATED_AT))
+        self.assertEqual(hot_score(1, CREATED_AT), hot_score(0, CREATED_AT))
+
+    def test_naive_dates_are_taken_as_utc(self):
+        self.assertEqual(
+            hot_score(3, CREATED_AT.replace(tzinfo=None)),
+            hot_score(3, CREATED_AT)
+        )
+
+
+class TestApplyVote(unittest.TestCase):
+
+    def setUp(self):
+        self.posts = Post._get_collection()
+        self.posts.delete_many({})
+        self.posts.insert_one({
+            '_id': 'p1', 'title': 'Title', 'community_id': 'k',
+            'user_id': 'u1', 'created_at': CREATED_AT
+        })
+
+    def test_server_side_score_matches_hot_score(self):
+        for delta in (1, 4, -30, 125):
+            Post.apply_vote('p1', delta)
+            post = self.posts.find_one({'_id': 'p1'})
+            self.assertAlmostEqual(
+                post['hot_score'],
+                hot_score(post['vote_count'], post['created_at'])
+            )
+        self.assertEqual(post['vote_count'], 100)
+
+    def test_new_posts_are_saved_with_their_score(self):
+        post = Post(title='t', community_id='k', user_id='u1',
+                    created_at=CREATED_AT, vote_count=10).save()
+        self.assertEqual(
+            self.posts.find_one({'_id': post.id})['hot_score'],
+            hot_score(10, CREATED_AT)
+        )
+
+    def test_saving_an_edit_keeps_the_score_of_later_votes(self):
+        post = Post.objects(id='p1').first()
+        # Votes cast while the post is being edited
+        Post.apply_vote('p1', 50)
+        post.title = 'Edited'
+        post.save()
+
+        stored = self.posts.find_one({'_id': 'p1'})
+        self.assertEqual(stored['title'], 'Edited')
+        self.assertEqual(stored['vote_count'], 50)
+        self.assertAlmostEqual(
+            stored['hot_score'], hot_score(50, CREATED_AT)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
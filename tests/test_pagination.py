@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+Tests of keyset (cursor) pagination, against a mongomock database.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+
+import mongomock
+
+os.environ.setdefault('DB_NAME', 'test_pagination')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.post_model import Post  # noqa: E402
+from utils.pagination import (  # noqa: E402
+    InvalidCursor, encode_cursor, keyset_page
+)
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+class TestKeysetPage(unittest.TestCase):
+
+    def setUp(self):
+        Post._get_collection().delete_many({})
+
+    def insert_posts(self, created_ats):
+        """Insert one post per creation date, with ids in insertion
+        order, and return them newest first as the listing sorts them"""
+        posts = [
+            {'_id': f'p{i:02d}', 'community_id': 'k', 'created_at': at,
+             'hot_score': 0.0}
+            for i, at in enumerate(created_ats)
+        ]
+        Post._get_collection().insert_many(posts)
+        return [
+            p['_id'] for p in
+            sorted(posts, key=lambda p: (p['created_at'], p['_id']),
+                   reverse=True)
+        ]
+
+    def walk(self, limit, **kwargs):
+        """Return the ids of every page read by following the cursors"""
+        pages, cursor = [], None
+        while True:
+            docs, cursor = keyset_page(
+                Post.objects(community_id='k').as_pymongo(), cursor, limit,
+                **kwargs
+            )
+            pages.append([doc['_id'] for doc in docs])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_the_listing_once_across_ties(self):
+        # Runs of posts created at the same instant, longer than a page
+        expected = self.insert_posts(
+            [START] * 5 + [START + timedelta(seconds=1)] * 3 + [START] * 2
+        )
+        pages = self.walk(3)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_last_full_page_has_no_cursor(self):
+        expected = self.insert_posts(
+            [START + timedelta(seconds=i) for i in range(4)]
+        )
+        self.assertEqual(self.walk(2), [expected[:2], expected[2:]])
+
+    def test_other_sort_field_is_parsed_back_from_the_cursor(self):
+        posts = Post._get_collection()
+        posts.insert_many([
+            {'_id': f'p{i}', 'community_id': 'k', 'created_at': START,
+             'hot_score': score}
+            for i, score in enumerate([1.5, 2.0, 1.5, 1.5, 0.5])
+        ])
+        pages = self.walk(2, field='hot_score', parse=float)
+        self.assertEqual(pages, [['p1', 'p3'], ['p2', 'p0'], ['p4']])
+
+    def test_invalid_cursors_are_rejected(self):
+        queryset = Post.objects().as_pymongo()
+        for cursor in ('not-base64!', encode_cursor('x'),
+                       encode_cursor('not a date', 'p1')):
+            with self.assertRaises(InvalidCursor):
+                keyset_page(queryset, cursor, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Tests of the post listings read as projected raw documents, against a
+mongomock database.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import mongomock
+from flask import Flask
+
+os.environ.setdefault('DB_NAME', 'test_post_listing')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.post_model import Post  # noqa: E402
+from views.fetch_post import list_posts  # noqa: E402
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+class TestListPosts(unittest.TestCase):
+
+    def setUp(self):
+        Post._get_collection().delete_many({})
+        Post._get_collection().insert_many([
+            {'_id': f'p{i}', 'community_id': 'k', 'user_id': 'u1',
+             'title': f'Title {i}', 'body': f'Body {i}',
+             'created_at': START + timedelta(minutes=i),
+             'updated_at': START, 'created_by': 'u1', 'updated_by': 'u1',
+             'vote_count': i, 'hot_score': float(i)}
+            for i in range(5)
+        ])
+        self.app = Flask(__name__)
+
+    def list_posts(self, query, sort='new'):
+        with self.app.test_request_context('/' + query):
+            return list_posts(Post.objects(community_id='k'), sort)
+
+    def test_page_holds_only_the_listing_fields(self):
+        body, status = self.list_posts('?per_page=2')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['posts'], [
+            {'id': 'p4', 'title': 'Title 4', 'content': 'Body 4',
+             'created_at': (START + timedelta(minutes=4)).isoformat()},
+            {'id': 'p3', 'title': 'Title 3', 'content': 'Body 3',
+             'created_at': (START + timedelta(minutes=3)).isoformat()}
+        ])
+        self.assertEqual(
+            (body['total'], body['pages'], body['current_page']), (5, 3, 1)
+        )
+
+    def test_posts_are_not_built_as_documents(self):
+        with mock.patch.object(
+                Post, '_from_son', side_effect=AssertionError) as from_son:
+            body, status = self.list_posts('?page=3&per_page=2')
+        self.assertEqual(status, 200)
+        self.assertEqual([p['id'] for p in body['posts']], ['p0'])
+        from_son.assert_not_called()
+
+    def test_cursor_pages_follow_the_sort_order(self):
+        body, status = self.list_posts('?sort=hot&per_page=3&cursor=',
+                                       sort='hot')
+        self.assertEqual([p['id'] for p in body['posts']],
+                         ['p4', 'p3', 'p2'])
+        body, status = self.list_posts(
+            f'?per_page=3&cursor={body["next_cursor"]}', sort='hot'
+        )
+        self.assertEqual([p['id'] for p in body['posts']], ['p1', 'p0'])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        body, status = self.list_posts('?cursor=garbage')
+        self.assertEqual(status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
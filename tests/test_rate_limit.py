@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""
+Tests of the sliding window rate limiter, with a fake clock and the
+memory and (mongomock) MongoDB counter stores.
+"""
+
+import os
+import unittest
+from unittest import mock
+
+import mongomock
+
+os.environ.setdefault('DB_NAME', 'test_rate_limit')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.rate_limit_model import RateLimit  # noqa: E402
+from utils.rate_limit import (  # noqa: E402
+    MemoryStore, MongoStore, SlidingWindowLimiter
+)
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+WINDOW = 60
+# A window boundary, so offsets in the tests are plain seconds
+T0 = 1000 * WINDOW
+
+
+class LimiterTestCase(unittest.TestCase):
+
+    def limiter(self, limit):
+        return SlidingWindowLimiter(MemoryStore(), limit, WINDOW)
+
+    def hit(self, limiter, at, key='k'):
+        with mock.patch('utils.rate_limit.time.time', return_value=at):
+            return limiter.hit(key)
+
+    def hits(self, limiter, at, count, key='k'):
+        return [self.hit(limiter, at, key) for _ in range(count)]
+
+
+class TestSlidingWindow(LimiterTestCase):
+
+    def test_limit_is_allowed_then_requests_wait(self):
+        limiter = self.limiter(3)
+        self.assertEqual(self.hits(limiter, T0, 3), [0, 0, 0])
+        self.assertGreater(self.hit(limiter, T0 + 1), 0)
+        # Other keys have their own counters
+        self.assertEqual(self.hit(limiter, T0 + 1, key='other'), 0)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        limiter = self.limiter(4)
+        self.hits(limiter, T0, 4)
+        # 10% into the next window, 90% of the 4 requests still count
+        self.assertGreater(self.hit(limiter, T0 + WINDOW + 6), 0)
+        # Halfway, 2 of them plus the 2 of this window are the limit
+        self.assertEqual(self.hit(limiter, T0 + WINDOW + 30), 0)
+
+    def test_counters_refill_after_two_idle_windows(self):
+        limiter = self.limiter(2)
+        self.hits(limiter, T0, 5)
+        self.assertEqual(self.hits(limiter, T0 + 2 * WINDOW, 2), [0, 0])
+
+
+class TestRetryAfter(LimiterTestCase):
+    """A request sent once the returned wait is over is allowed, and one
+    sent a second earlier is not"""
+
+    def assert_wait_is_exact(self, limit, setup, at):
+        for early in (True, False):
+            limiter = self.limiter(limit)
+            for when, count in setup:
+                self.hits(limiter, when, count)
+            wait = self.hit(limiter, at)
+            self.assertGreater(wait, 0)
+            if early:
+                self.assertGreater(self.hit(limiter, at + wait - 1), 0)
+            else:
+                self.assertEqual(self.hit(limiter, at + wait), 0)
+
+    def test_over_the_limit_in_the_current_window(self):
+        self.assert_wait_is_exact(3, [(T0, 3)], T0 + 10)
+
+    def test_at_the_limit_with_a_full_previous_window(self):
+        self.assert_wait_is_exact(4, [(T0, 4), (T0 + WINDOW, 3)],
+                                  T0 + WINDOW + 40)
+
+    def test_under_the_limit_because_of_the_previous_window(self):
+        self.assert_wait_is_exact(4, [(T0, 4)], T0 + WINDOW + 6)
+
+    def test_limit_of_one(self):
+        self.assert_wait_is_exact(1, [(T0, 1)], T0 + 30)
+
+
+class TestMongoStore(unittest.TestCase):
+
+    def setUp(self):
+        RateLimit._get_collection().delete_many({})
+
+    def test_counts_like_the_memory_store(self):
+        mongo, memory = MongoStore(), MemoryStore()
+        for bucket, count in ((10, 3), (11, 2), (13, 1)):
+            for _ in range(count):
+                self.assertEqual(
+                    mongo.incr('k', bucket, WINDOW),
+                    memory.incr('k', bucket, WINDOW)
+                )
+        self.assertEqual(mongo.incr('k', 13, WINDOW), (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
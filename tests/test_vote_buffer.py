@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+"""
+Tests of the write-behind vote buffer and its journal, against a
+mongomock database.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import mongomock
+from pymongo.errors import AutoReconnect
+
+os.environ.setdefault('DB_NAME', 'test_vote_buffer')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.comment_model import Comment  # noqa: E402
+from models.like_model import Like  # noqa: E402
+from utils.vote_buffer import VoteBuffer  # noqa: E402
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+
+def journal_line(user_id, field, target_id, value):
+    return json.dumps([user_id, field, target_id, value]) + '\n'
+
+
+class VoteBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Like._get_collection().delete_many({})
+        Comment._get_collection().delete_many({})
+        Comment._get_collection().insert_many([
+            {'_id': 'c1', 'vote_count': 0},
+            {'_id': 'c2', 'vote_count': 0}
+        ])
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+
+    def buffer(self, **kwargs):
+        buffer = VoteBuffer(**kwargs)
+        if buffer._journal:
+            self.addCleanup(buffer._journal.close)
+        return buffer
+
+    def likes(self):
+        return {
+            (doc['user_id'], doc['comment_id']): doc['value']
+            for doc in Like._get_collection().find()
+        }
+
+    def vote_count(self, comment_id):
+        return Comment._get_collection().find_one(
+            {'_id': comment_id})['vote_count']
+
+    def journal(self, buffer):
+        with open(buffer._journal.name) as f:
+            return f.read()
+
+
+class TestCoalescing(VoteBufferTestCase):
+
+    def test_repeated_votes_are_written_once(self):
+        buffer = self.buffer()
+        for value in (1, -1, 1, -1):
+            buffer.submit('u1', 'comment_id', 'c1', value)
+        buffer.submit('u2', 'comment_id', 'c2', 1)
+        self.assertEqual(buffer.depth(), 2)
+
+        with mock.patch.object(
+            mongomock.Collection, 'bulk_write',
+            autospec=True, side_effect=mongomock.Collection.bulk_write
+        ) as bulk_write:
+            self.assertEqual(buffer.flush(), 2)
+        # One bulk write of likes and one of counters
+        self.assertEqual(bulk_write.call_count, 2)
+        self.assertEqual(len(bulk_write.call_args_list[0].args[1]), 2)
+
+        self.assertEqual(self.likes(), {('u1', 'c1'): -1, ('u2', 'c2'): 1})
+        self.assertEqual(self.vote_count('c1'), -1)
+        self.assertEqual(self.vote_count('c2'), 1)
+        self.assertEqual(buffer.depth(), 0)
+
+    def test_counter_delta_is_taken_against_the_stored_vote(self):
+        buffer = self.buffer()
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        buffer.flush()
+        buffer.submit('u1', 'comment_id', 'c1', -1)
+        buffer.submit('u1', 'comment_id', 'c2', 1)
+        buffer.flush()
+
+        self.assertEqual(self.likes(), {('u1', 'c1'): -1, ('u1', 'c2'): 1})
+        self.assertEqual(self.vote_count('c1'), -1)
+        self.assertEqual(self.vote_count('c2'), 1)
+
+
+class TestJournal(VoteBufferTestCase):
+
+    def write_orphan(self, name, content):
+        with open(os.path.join(self.journal_dir, name), 'w') as f:
+            f.write(content)
+
+    def test_orphaned_journal_is_replayed(self):
+        self.write_orphan('votes-999999.log', (
+            journal_line('u1', 'comment_id', 'c1', 1) +
+            journal_line('u1', 'comment_id', 'c1', -1) +
+            journal_line('u2', 'comment_id', 'c2', 1)
+        ))
+        buffer = self.buffer(journal_dir=self.journal_dir)
+
+        self.assertEqual(buffer.depth(), 2)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.journal_dir, 'votes-999999.log')))
+        # The adopted votes are in this process' journal until flushed
+        self.assertEqual(len(self.journal(buffer).splitlines()), 2)
+
+        buffer.flush()
+        self.assertEqual(self.likes(), {('u1', 'c1'): -1, ('u2', 'c2'): 1})
+        self.assertEqual(self.journal(buffer), '')
+
+    def test_journal_of_the_same_pid_is_replayed(self):
+        # A worker restarted with the pid of a dead one, as happens after
+        # a container restart, must not discard its acknowledged votes
+        self.write_orphan(
+            f'votes-{os.getpid()}.log',
+            journal_line('u1', 'comment_id', 'c1', 1)
+        )
+        buffer = self.buffer(journal_dir=self.journal_dir)
+
+        self.assertEqual(buffer.depth(), 1)
+        buffer.flush()
+        self.assertEqual(self.likes(), {('u1', 'c1'): 1})
+        self.assertEqual(self.vote_count('c1'), 1)
+
+    def test_torn_last_line_is_ignored(self):
+        torn = journal_line('u2', 'comment_id', 'c2', -1)[:-5]
+        self.write_orphan(
+            'votes-999999.log',
+            journal_line('u1', 'comment_id', 'c1', 1) + torn
+        )
+        buffer = self.buffer(journal_dir=self.journal_dir)
+
+        self.assertEqual(buffer.depth(), 1)
+        # Votes appended afterwards are not glued to the torn line
+        buffer.submit('u2', 'comment_id', 'c2', 1)
+        self.assertEqual(len(self.journal(buffer).splitlines()), 2)
+        buffer.flush()
+        self.assertEqual(self.likes(), {('u1', 'c1'): 1, ('u2', 'c2'): 1})
+
+    def test_votes_are_journaled_before_they_are_acknowledged(self):
+        buffer = self.buffer(journal_dir=self.journal_dir, fsync=False)
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        self.assertEqual(
+            self.journal(buffer), journal_line('u1', 'comment_id', 'c1', 1)
+        )
+
+
+class TestFailedFlush(VoteBufferTestCase):
+
+    def test_votes_are_requeued_when_the_likes_fail(self):
+        buffer = self.buffer(journal_dir=self.journal_dir)
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+
+        with mock.patch.object(mongomock.Collection, 'bulk_write',
+                               side_effect=AutoReconnect('down')):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.depth(), 1)
+        self.assertEqual(buffer.stats['failed_flushes'], 1)
+        self.assertEqual(len(self.journal(buffer).splitlines()), 1)
+
+        # A newer vote cast meanwhile wins over the requeued one
+        buffer.submit('u1', 'comment_id', 'c1', -1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.likes(), {('u1', 'c1'): -1})
+        self.assertEqual(self.vote_count('c1'), -1)
+        self.assertEqual(self.journal(buffer), '')
+
+    def test_counters_are_retried_when_only_they_fail(self):
+        buffer = self.buffer()
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        bulk_write = mongomock.Collection.bulk_write
+
+        def likes_only(collection, *args, **kwargs):
+            if collection.name == Comment._get_collection_name():
+                raise AutoReconnect('down')
+            return bulk_write(collection, *args, **kwargs)
+
+        with mock.patch.object(mongomock.Collection, 'bulk_write',
+                               autospec=True, side_effect=likes_only):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.likes(), {('u1', 'c1'): 1})
+        self.assertEqual(self.vote_count('c1'), 0)
+        self.assertEqual(buffer.metrics()['pending_counters'], 1)
+
+        # The like is not pending anymore, its counter delta still is
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(self.vote_count('c1'), 1)
+        self.assertEqual(buffer.metrics()['pending_counters'], 0)
+
+
+class TestSynchronousVotes(VoteBufferTestCase):
+
+    def toggle(self, buffer, user_id, comment_id, value):
+        """Cast a toggle vote as the create-like view does"""
+        buffer.settle(user_id, 'comment_id', comment_id)
+        if Like.remove_vote(
+                {'user_id': user_id, 'comment_id': comment_id,
+                 'value': value}):
+            Like.apply_vote_delta('comment_id', comment_id, -value)
+            return None
+        previous = Like.set_vote(user_id, 'comment_id', comment_id, value)
+        Like.apply_vote_delta(
+            'comment_id', comment_id, value - (previous or 0)
+        )
+        return value
+
+    def test_toggle_after_a_buffered_vote_is_not_overwritten(self):
+        buffer = self.buffer(journal_dir=self.journal_dir)
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        # The toggle sees the buffered vote, and changes it
+        self.assertEqual(self.toggle(buffer, 'u1', 'c1', -1), -1)
+        self.assertEqual(buffer.depth(), 0)
+        self.assertEqual(self.journal(buffer), '')
+
+        buffer.flush()
+        self.assertEqual(self.likes(), {('u1', 'c1'): -1})
+        self.assertEqual(self.vote_count('c1'), -1)
+
+        # Toggling the same value again takes the vote back
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        self.assertIsNone(self.toggle(buffer, 'u1', 'c1', 1))
+        buffer.flush()
+        self.assertEqual(self.likes(), {})
+        self.assertEqual(self.vote_count('c1'), 0)
+
+    def test_settle_writes_every_buffered_vote_of_the_user(self):
+        buffer = self.buffer()
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        buffer.submit('u1', 'comment_id', 'c2', -1)
+        buffer.submit('u2', 'comment_id', 'c1', 1)
+        buffer.settle('u1')
+
+        self.assertEqual(self.likes(), {('u1', 'c1'): 1, ('u1', 'c2'): -1})
+        self.assertEqual(buffer.depth(), 1)
+
+    def test_vote_written_during_a_flush_keeps_counters_exact(self):
+        buffer = self.buffer()
+        buffer.submit('u1', 'comment_id', 'c1', 1)
+        bulk_write = mongomock.Collection.bulk_write
+        raced = []
+
+        def vote_first(collection, *args, **kwargs):
+            # Another process votes after the flush read the stored likes
+            if collection.name == Like._get_collection_name() and not raced:
+                raced.append(True)
+                Like.set_vote('u1', 'comment_id', 'c1', -1)
+                Like.apply_vote_delta('comment_id', 'c1', -1)
+            return bulk_write(collection, *args, **kwargs)
+
+        with mock.patch.object(mongomock.Collection, 'bulk_write',
+                               autospec=True, side_effect=vote_first):
+            self.assertEqual(buffer.flush(), 0)
+        # The like changed under the flush, which retries the vote
+        self.assertEqual(buffer.depth(), 1)
+        self.assertEqual(self.vote_count('c1'), -1)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.likes(), {('u1', 'c1'): 1})
+        self.assertEqual(self.vote_count('c1'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
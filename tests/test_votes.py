@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""
+Tests of the single-upsert votes of the Like model, against a mongomock
+database, which enforces the unique (user, target) indexes.
+"""
+
+import os
+import unittest
+from unittest import mock
+
+import mongomock
+from pymongo.errors import DuplicateKeyError
+
+os.environ.setdefault('DB_NAME', 'test_votes')
+
+from models.engines.db_storage import storage  # noqa: E402
+from models.like_model import Like  # noqa: E402
+
+storage.client_options['mongo_client_class'] = mongomock.MongoClient
+storage.reconnect()
+
+
+class VoteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.likes = Like._get_collection()
+        self.likes.delete_many({})
+
+    def votes(self):
+        return [
+            (doc['user_id'], doc['post_id'], doc['value'])
+            for doc in self.likes.find()
+        ]
+
+    def lose_race_to(self, method, value):
+        """Make the next `method` call of the likes collection lose the
+        race to insert the vote of u1 on p1 to a concurrent request that
+        voted `value`: the concurrent vote is inserted between the
+        upsert's match and its insert, which the unique index rejects"""
+        original = getattr(self.likes, method)
+        calls = []
+
+        def racing(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                self.likes.insert_one({'_id': 'winner', 'user_id': 'u1',
+                                       'post_id': 'p1', 'value': value})
+                raise DuplicateKeyError('E11000 duplicate key error')
+            return original(*args, **kwargs)
+
+        patcher = mock.patch.object(self.likes, method, side_effect=racing)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls
+
+
+class TestInsertVote(VoteTestCase):
+
+    def test_only_the_first_vote_is_inserted(self):
+        self.assertTrue(Like.insert_vote('u1', 'post_id', 'p1', 1))
+        self.assertFalse(Like.insert_vote('u1', 'post_id', 'p1', -1))
+        self.assertTrue(Like.insert_vote('u2', 'post_id', 'p1', -1))
+        self.assertEqual(sorted(self.votes()),
+                         [('u1', 'p1', 1), ('u2', 'p1', -1)])
+
+    def test_losing_a_concurrent_insert_keeps_the_winner(self):
+        calls = self.lose_race_to('update_one', 1)
+        self.assertFalse(Like.insert_vote('u1', 'post_id', 'p1', -1))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.votes(), [('u1', 'p1', 1)])
+
+
+class TestSetVote(VoteTestCase):
+
+    def test_previous_value_is_returned(self):
+        self.assertIsNone(Like.set_vote('u1', 'post_id', 'p1', 1))
+        self.assertEqual(Like.set_vote('u1', 'post_id', 'p1', -1), 1)
+        self.assertEqual(self.votes(), [('u1', 'p1', -1)])
+
+    def test_losing_a_concurrent_insert_changes_the_winner(self):
+        calls = self.lose_race_to('find_one_and_update', 1)
+        # The retry matches the concurrent vote, so the counters are
+        # moved from its value rather than from no vote
+        self.assertEqual(Like.set_vote('u1', 'post_id', 'p1', -1), 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.votes(), [('u1', 'p1', -1)])
+
+    def test_votes_on_other_targets_are_independent(self):
+        Like.set_vote('u1', 'post_id', 'p1', 1)
+        Like.set_vote('u1', 'comment_id', 'p1', -1)
+        self.assertEqual(self.likes.count_documents({}), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
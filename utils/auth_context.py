@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Contains the authorization context of the current request.
+
+`current_user()` loads the user of the request's access token at most
+once per request and keeps it on `g.current_user`.
+
+`auth_claims()` returns the role, superuser flag and status the
+authorization decorators check. Claims are cached per process for
+`AUTH_CACHE_TTL` seconds, so most admin requests are authorized without
+reading the user. Views that change a user's role, status or existence
+call `invalidate_auth`. That only clears the cache of the process that
+served the change, so other worker processes may act on the old claims
+until their entry expires.
+"""
+
+import os
+import threading
+import time
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from dotenv import load_dotenv
+from models.user_model import User
+
+load_dotenv()
+
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', 30))
+AUTH_CACHE_MAX_SIZE = int(os.getenv('AUTH_CACHE_MAX_SIZE', 10000))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def current_user():
+    """Return the user of the request's access token, None if it no
+    longer exists. The authorization decorators only read the user when
+    its claims are not cached, so views call this rather than query the
+    user again: it is read at most once either way."""
+    if 'current_user' not in g:
+        g.current_user = User.objects(id=get_jwt_identity()).first()
+    return g.current_user
+
+
+def claims_of(user):
+    """Return the authorization claims of a user, None for no user"""
+    if user is None:
+        return None
+    return {
+        'id': user.id,
+        'role': list(user.role),
+        'is_superuser': user.is_superuser,
+        'status': user.status
+    }
+
+
+def auth_claims():
+    """Return the authorization claims of the request's user"""
+    user_id = get_jwt_identity()
+    now = time.monotonic()
+    entry = _cache.get(user_id)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    claims = claims_of(current_user())
+    with _cache_lock:
+        if len(_cache) >= AUTH_CACHE_MAX_SIZE:
+            # Drop the expired entries, or everything if none has expired
+            expired = [k for k, (ends, _) in _cache.items() if ends <= now]
+            for key in expired or list(_cache):
+                del _cache[key]
+        _cache[user_id] = (now + AUTH_CACHE_TTL, claims)
+    return claims
+
+
+def invalidate_auth(user_id):
+    """Forget the cached claims of a user after they changed"""
+    with _cache_lock:
+        _cache.pop(str(user_id), None)
+    if g.get('current_user') and g.current_user.id == str(user_id):
+        g.pop('current_user')
+
+
+def is_admin(claims):
+    """Return True if the claims grant superuser or admin rights"""
+    return claims['is_superuser'] or 'admin' in claims['role']
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+"""
+Contains the helpers for conditional GET requests.
+
+Views derive an ETag (and optionally a Last-Modified date) from what a
+response depends on, such as a document's `updated_at`, and check it
+against the request validators before building the body. When the client
+already holds the current representation it gets an empty 304 instead.
+"""
+
+import hashlib
+from datetime import timezone
+from flask import Response, request
+from werkzeug.http import http_date
+
+
+def make_etag(*parts):
+    """Return a strong ETag value identifying the given parts"""
+    raw = '\x1f'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _to_utc(value):
+    """Return `value` as an aware UTC datetime truncated to seconds,
+    the precision of HTTP dates"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def validator_headers(etag, last_modified=None):
+    """Return the response headers advertising the validators"""
+    headers = {'ETag': f'"{etag}"'}
+    if last_modified:
+        headers['Last-Modified'] = http_date(_to_utc(last_modified))
+    return headers
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the client's cached copy is current,
+    otherwise None.
+
+    `If-None-Match` takes precedence over `If-Modified-Since`, which is
+    only considered when the request carries no entity tags.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif last_modified and request.if_modified_since:
+        fresh = _to_utc(last_modified) <= request.if_modified_since
+    else:
+        fresh = False
+
+    if fresh:
+        return Response(
+            status=304, headers=validator_headers(etag, last_modified)
+        )
+    return None
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Contains the request-scoped batch loader of referenced documents.
+
+Reading `created_by`, `updated_by` or a list of references on each of N
+documents dereferences them one query at a time. Views instead read the
+raw documents, `prime` the loader with every referenced id, and then
+`load` them: the first load of a model fetches all of its primed ids in
+a single `$in` query, and the results are cached for the rest of the
+request.
+"""
+
+from collections import defaultdict
+from flask import g
+from utils.read_routing import replica
+
+
+class RefLoader:
+    """Batches and caches the loading of referenced documents by id"""
+
+    def __init__(self):
+        self._pending = defaultdict(set)
+        self._cache = defaultdict(dict)
+
+    def prime(self, model, ids):
+        """Queue ids of `model` to be fetched with its next load"""
+        cache = self._cache[model]
+        self._pending[model].update(
+            ref_id for ref_id in ids if ref_id and ref_id not in cache
+        )
+
+    def _fetch(self, model):
+        """Fetch every pending id of `model` in one query"""
+        ids = self._pending.pop(model, None)
+        if not ids:
+            return
+        queryset = model.objects(id__in=list(ids))
+        if model.loader_fields:
+            queryset = queryset.only(*model.loader_fields)
+        found = {doc['_id']: doc for doc in replica(queryset.as_pymongo())}
+        cache = self._cache[model]
+        for ref_id in ids:
+            cache[ref_id] = found.get(ref_id)
+
+    def load(self, model, ref_id):
+        """Return the raw document of `model` with id `ref_id`, None if
+        there is no such document"""
+        if not ref_id:
+            return None
+        self.prime(model, [ref_id])
+        self._fetch(model)
+        return self._cache[model].get(ref_id)
+
+    def load_many(self, model, ids):
+        """Return the raw documents of `model` with the given ids, in
+        order, leaving out the ids of missing documents"""
+        ids = [ref_id for ref_id in ids if ref_id]
+        self.prime(model, ids)
+        self._fetch(model)
+        cache = self._cache[model]
+        return [cache[ref_id] for ref_id in ids if cache.get(ref_id)]
+
+    def ref_id(self, model, ref_id):
+        """Return `ref_id` if it refers to an existing document"""
+        return ref_id if self.load(model, ref_id) else None
+
+    def ref_ids(self, model, ids):
+        """Return the ids among `ids` that refer to existing documents"""
+        return [doc['_id'] for doc in self.load_many(model, ids)]
+
+
+def get_loader():
+    """Return the loader of the current request"""
+    if 'ref_loader' not in g:
+        g.ref_loader = RefLoader()
+    return g.ref_loader
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+"""
+Contains the Prometheus metrics of the API, served on /metrics.
+
+Requests are counted and timed by endpoint name (e.g. `like.like_create`,
+`community00.view_all_communities`), along with the requests in flight,
+the MongoDB commands each request sends (see utils/query_stats.py) and
+the connection pools of the MongoDB clients.
+
+Under gunicorn, web_flask/gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR
+at a directory where every worker keeps its values in memory-mapped
+files, which /metrics aggregates whichever worker answers. Without it,
+as under the development server, the values of the single process are
+served.
+"""
+
+import os
+import threading
+import time
+from flask import g, request
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+)
+from pymongo import monitoring
+from pymongo.common import MAX_POOL_SIZE
+from utils.query_stats import current_stats
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+if MULTIPROCESS:
+    # Only gunicorn creates it, and values cannot be recorded without it
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+REQUESTS = Counter(
+    'http_requests_total', 'Requests handled',
+    ['endpoint', 'method', 'status']
+)
+LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to handle a request',
+    ['endpoint', 'method'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled',
+    ['endpoint', 'method'], multiprocess_mode='livesum'
+)
+DB_COMMANDS = Histogram(
+    'db_commands_per_request', 'MongoDB commands sent by a request',
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_TIME = Histogram(
+    'db_time_per_request_seconds', 'Time a request spent on MongoDB',
+    ['endpoint'], buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, 1)
+)
+
+POOL_MAX_SIZE = Gauge(
+    'mongodb_pool_max_size', 'Maximum connections of the pool',
+    ['address'], multiprocess_mode='livesum'
+)
+POOL_CONNECTIONS = Gauge(
+    'mongodb_pool_connections', 'Open connections of the pool',
+    ['address'], multiprocess_mode='livesum'
+)
+POOL_CHECKED_OUT = Gauge(
+    'mongodb_pool_checked_out', 'Connections of the pool in use',
+    ['address'], multiprocess_mode='livesum'
+)
+POOL_WAIT = Histogram(
+    'mongodb_pool_checkout_seconds', 'Time to check out a connection',
+    ['address'], buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5)
+)
+POOL_CHECKOUT_FAILURES = Counter(
+    'mongodb_pool_checkout_failures_total',
+    'Connections that could not be checked out', ['address', 'reason']
+)
+
+
+def address_label(address):
+    return '{}:{}'.format(*address)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks the connection pools of the clients created after its
+    registration"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def pool_created(self, event):
+        POOL_MAX_SIZE.labels(address_label(event.address)).set(
+            event.options.get('maxPoolSize', MAX_POOL_SIZE)
+        )
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        POOL_MAX_SIZE.labels(address_label(event.address)).set(0)
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.labels(address_label(event.address)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.labels(address_label(event.address)).dec()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        address = address_label(event.address)
+        POOL_CHECKOUT_FAILURES.labels(address, event.reason).inc()
+        self._observe_wait(address)
+
+    def connection_checked_out(self, event):
+        address = address_label(event.address)
+        POOL_CHECKED_OUT.labels(address).inc()
+        self._observe_wait(address)
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.labels(address_label(event.address)).dec()
+
+    def _observe_wait(self, address):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            POOL_WAIT.labels(address).observe(time.perf_counter() - started)
+            self._local.started = None
+
+
+def registry():
+    """Return the registry to expose, aggregating every worker's values
+    in multiprocess mode"""
+    if not MULTIPROCESS:
+        return REGISTRY
+    aggregate = CollectorRegistry()
+    multiprocess.MultiProcessCollector(aggregate)
+    return aggregate
+
+
+def _start():
+    labels = (request.endpoint or 'unmatched', request.method)
+    g.metrics_started = (time.perf_counter(), labels)
+    IN_FLIGHT.labels(*labels).inc()
+
+
+def _finish(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown(exc):
+    started = g.pop('metrics_started', None)
+    if not started:
+        return
+    start, labels = started
+    # Requests whose exception propagates, as in testing, skip `_finish`
+    REQUESTS.labels(*labels, g.pop('metrics_status', 500)).inc()
+    LATENCY.labels(*labels).observe(time.perf_counter() - start)
+    IN_FLIGHT.labels(*labels).dec()
+
+    stats = current_stats()
+    if stats:
+        DB_COMMANDS.labels(labels[0]).observe(stats.count)
+        DB_TIME.labels(labels[0]).observe(stats.total_ms / 1000)
+
+
+def init_app(app):
+    """Collect the metrics of every request of `app`. Call it after
+    `query_stats.init_app`, so the commands of a request are still known
+    when its metrics are taken."""
+    monitoring.register(PoolMetricsListener())
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+"""
+Contains the helpers for keyset (cursor) pagination.
+
+A cursor is an opaque, URL-safe token encoding the sort key of the last
+document a client has seen. The next page is fetched with a range query
+on an index instead of skipping over every earlier document, so the cost
+of a page does not depend on how deep into the listing it is.
+"""
+
+import base64
+import json
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from mongoengine.queryset.visitor import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client supplies a cursor that cannot be decoded"""
+
+
+def encode_cursor(*key):
+    """Encode a sort key into an opaque cursor string"""
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in key
+    ]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string back into its list of key values"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def decode_key_cursor(cursor, parse):
+    """Decode a (value, id) cursor, converting the value with `parse`"""
+    values = decode_cursor(cursor)
+    try:
+        value, doc_id = values
+        return parse(value), str(doc_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def after_cursor(field, value, doc_id):
+    """Return the filter selecting documents that sort after a cursor
+    in descending (-field, -id) order"""
+    return (
+        Q(**{f'{field}__lt': value}) |
+        Q(**{field: value, 'id__lt': doc_id})
+    )
+
+
+def next_link(url, cursor):
+    """Return the `Link` header value pointing at the page after `url`,
+    which starts at `cursor`"""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != 'cursor']
+    query.append(('cursor', cursor))
+    return '<%s>; rel="next"' % urlunsplit(
+        parts._replace(query=urlencode(query))
+    )
+
+
+def encode_positions(positions):
+    """Encode a mapping of stream name to its (created_at, id) position
+    into one composite cursor"""
+    return encode_cursor(*[
+        [name, created_at.isoformat(), doc_id]
+        for name, (created_at, doc_id) in positions.items()
+    ])
+
+
+def decode_positions(cursor):
+    """Decode a composite cursor back into its mapping of positions"""
+    positions = {}
+    for entry in decode_cursor(cursor):
+        try:
+            name, created_at, doc_id = entry
+            positions[str(name)] = (
+                datetime.fromisoformat(created_at), str(doc_id)
+            )
+        except (ValueError, TypeError):
+            raise InvalidCursor("Invalid cursor")
+    return positions
+
+
+def keyset_page(queryset, cursor, limit, field='created_at',
+                parse=datetime.fromisoformat):
+    """Fetch one page of `queryset` after `cursor`, in descending order of
+    `field` with ties broken by id. `parse` converts the field value
+    of a cursor back from its JSON form.
+
+    `queryset` must yield raw documents (see `QuerySet.as_pymongo`).
+    Returns the documents of the page and the cursor of the next page,
+    which is None once the listing is exhausted. One extra document is
+    read to find out whether another page exists, so no count is needed.
+    """
+    if cursor:
+        queryset = queryset.filter(
+            after_cursor(field, *decode_key_cursor(cursor, parse))
+        )
+    docs = list(queryset.order_by(f'-{field}', '-id').limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last[field], last['_id'])
+    return docs, next_cursor
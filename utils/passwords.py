@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+Contains the password hashing helpers.
+
+Hashing is deliberately slow. Hashes are computed on a bounded pool of
+`PASSWORD_HASH_WORKERS` threads: hashlib releases the GIL while it runs
+pbkdf2 and scrypt, so the pool runs them in parallel while capping how
+much CPU a login storm can take from the other requests. Once
+`PASSWORD_HASH_MAX_QUEUE` more hashes are waiting for a worker, new ones
+are refused with `HashingBusy` instead of piling up.
+
+The method is `PASSWORD_HASH_METHOD` (pbkdf2 or scrypt) and its cost is
+`PASSWORD_HASH_COST`, the pbkdf2 iterations or the scrypt N. Hashes made
+with other settings still verify, and `needs_rehash` tells when to
+replace them.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_COSTS = {'pbkdf2': 600000, 'scrypt': 32768}
+
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2')
+if HASH_METHOD not in DEFAULT_COSTS:
+    raise ValueError(f"Unsupported PASSWORD_HASH_METHOD {HASH_METHOD!r}")
+HASH_COST = int(os.getenv('PASSWORD_HASH_COST', DEFAULT_COSTS[HASH_METHOD]))
+WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', WORKERS * 4))
+
+# The method string werkzeug stores in front of the salt and hash
+if HASH_METHOD == 'scrypt':
+    METHOD = f'scrypt:{HASH_COST}:8:1'
+else:
+    METHOD = f'pbkdf2:sha256:{HASH_COST}'
+
+
+class HashingBusy(Exception):
+    """Raised when too many hashes are already waiting for a worker"""
+
+
+class HashPool:
+    """A bounded pool of threads computing password hashes"""
+
+    def __init__(self, workers=WORKERS, max_queue=MAX_QUEUE):
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='password-hash'
+        )
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` on the pool and wait for its result"""
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Too many password hashes in progress")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    """Return this process' hash pool, created on first use so forked
+    workers do not share the threads of their parent"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = HashPool()
+        return _pool
+
+
+def hash_password(password):
+    """Return the hash of `password` with the configured method"""
+    return get_hash_pool().run(generate_password_hash, password, METHOD)
+
+
+def verify_password(password_hash, password):
+    """Return True if `password` matches `password_hash`"""
+    return get_hash_pool().run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Return True if `password_hash` was not made with the configured
+    method and cost"""
+    return password_hash.split('$', 1)[0] != METHOD
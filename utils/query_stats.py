@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+"""
+Contains the per-request accounting of MongoDB commands.
+
+A pymongo command listener records the commands each request sends:
+their number, their total time and the slowest one. In debug mode, or
+with QUERY_STATS_HEADERS=true, they are returned in the `X-DB-*`
+response headers, and the totals of every endpoint are kept for
+/api/v1/diagnostics/queries.
+
+Views declare how many commands a request may send with `query_budget`,
+counting those of their authorization decorators. A request over its
+budget is logged, or with QUERY_BUDGET_STRICT=true, as in tests, fails
+with QueryBudgetExceeded, so a number of queries that grows with the
+data cannot come back unnoticed.
+"""
+
+import logging
+import os
+import threading
+from functools import wraps
+from flask import current_app, g, has_app_context, request
+from pymongo import monitoring
+
+HEADERS = os.getenv('QUERY_STATS_HEADERS', 'false').lower() == 'true'
+STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request sends more commands than its budget"""
+
+
+class QueryStats:
+    """The commands sent by one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = None
+        self.budget = None
+        self.reported = False
+
+    def record(self, command, duration_ms):
+        self.count += 1
+        self.total_ms += duration_ms
+        if not self.slowest or duration_ms > self.slowest[1]:
+            self.slowest = (command, duration_ms)
+
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    def headers(self):
+        """Return the debug headers describing the commands"""
+        headers = {
+            'X-DB-Queries': str(self.count),
+            'X-DB-Time-Ms': f'{self.total_ms:.2f}'
+        }
+        if self.slowest:
+            headers['X-DB-Slowest'] = '{} {:.2f}ms'.format(*self.slowest)
+        if self.budget is not None:
+            headers['X-DB-Query-Budget'] = str(self.budget)
+        return headers
+
+
+class EndpointTotals:
+    """Totals of the commands sent by the requests of each endpoint, in
+    the serving process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def add(self, endpoint, stats):
+        with self._lock:
+            totals = self._totals.setdefault(endpoint, {
+                "requests": 0, "queries": 0, "db_ms": 0.0,
+                "max_queries": 0, "over_budget": 0
+            })
+            totals["requests"] += 1
+            totals["queries"] += stats.count
+            totals["db_ms"] += stats.total_ms
+            totals["max_queries"] = max(totals["max_queries"], stats.count)
+            if stats.over_budget():
+                totals["over_budget"] += 1
+
+    def metrics(self):
+        """Return the totals with the mean queries and time per request"""
+        with self._lock:
+            return {
+                endpoint: dict(
+                    totals,
+                    db_ms=round(totals["db_ms"], 3),
+                    mean_queries=round(
+                        totals["queries"] / totals["requests"], 2),
+                    mean_db_ms=round(
+                        totals["db_ms"] / totals["requests"], 3)
+                ) for endpoint, totals in self._totals.items()
+            }
+
+
+endpoint_totals = EndpointTotals()
+
+
+def current_stats():
+    """Return the stats of the current request, None outside requests"""
+    return g.get('query_stats') if has_app_context() else None
+
+
+def record(command, duration_ms):
+    """Count a command of the current request"""
+    stats = current_stats()
+    if stats:
+        stats.record(command, duration_ms)
+
+
+class QueryListener(monitoring.CommandListener):
+    """Records the commands of the clients created after its registration
+    against the request that sends them"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record(event.command_name, event.duration_micros / 1000)
+
+    def failed(self, event):
+        record(event.command_name, event.duration_micros / 1000)
+
+
+def query_budget(limit):
+    """Declare the number of commands a request of the decorated view may
+    send"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            stats = current_stats()
+            if stats:
+                stats.budget = limit
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _start():
+    g.query_stats = QueryStats()
+
+
+def _finish(response):
+    stats = g.get('query_stats')
+    if not stats:
+        return response
+    if current_app.debug or HEADERS:
+        response.headers.update(stats.headers())
+    # Only once, as the error response of a strict failure passes here too
+    if stats.over_budget() and not stats.reported:
+        stats.reported = True
+        message = (f"{request.endpoint} sent {stats.count} MongoDB "
+                   f"commands, over its budget of {stats.budget}")
+        if STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+
+def _teardown(exc):
+    # Streamed responses may still query after `_finish`, so the totals
+    # are only taken once the request is over
+    stats = g.pop('query_stats', None)
+    if stats:
+        endpoint_totals.add(request.endpoint or 'unknown', stats)
+
+
+def init_app(app):
+    """Account for the MongoDB commands of every request of `app`. The
+    listener only sees the clients created afterwards, which is all of
+    them since DBStorage connects on first use."""
+    monitoring.register(QueryListener())
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+"""
+Contains the sliding window rate limiter of the authentication endpoints.
+
+Each key (an IP address or a username) keeps a request count for the
+current fixed window and for the previous one. The number of requests
+in the sliding window ending now is estimated by weighting the previous
+count by how much of the previous window the sliding window still
+covers. That needs two integers per key instead of a timestamp per
+request.
+
+Every attempt counts, including rejected ones, so a client that keeps
+hammering stays blocked until it slows down.
+
+Counters live in process memory by default, which limits each worker
+separately. With `AUTH_RATE_LIMIT_STORE=mongo` they are kept in the
+`rate_limit` collection and shared by every worker. Each attempt is then
+one atomic update, and the server expires idle keys.
+"""
+
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import request
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+from models.rate_limit_model import RateLimit
+
+load_dotenv()
+
+STORE = os.getenv('AUTH_RATE_LIMIT_STORE', 'memory')
+WINDOW = int(os.getenv('AUTH_RATE_LIMIT_WINDOW', 300))
+PER_IP = int(os.getenv('AUTH_RATE_LIMIT_PER_IP', 50))
+PER_USERNAME = int(os.getenv('AUTH_RATE_LIMIT_PER_USERNAME', 10))
+
+# Past this many keys the memory store drops the idle ones
+MEMORY_STORE_MAX_KEYS = 100000
+
+
+class MemoryStore:
+    """Keeps the counters in this process"""
+
+    def __init__(self, max_keys=MEMORY_STORE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, bucket, window):
+        """Count a request of `key` in window number `bucket`.
+        Returns the counts of the previous and the current window."""
+        with self._lock:
+            last, count, prev = self._counters.get(key, (bucket, 0, 0))
+            if last != bucket:
+                prev = count if last == bucket - 1 else 0
+                count = 0
+            count += 1
+            if key not in self._counters and \
+                    len(self._counters) >= self.max_keys:
+                self._counters = {
+                    k: v for k, v in self._counters.items()
+                    if v[0] >= bucket - 1
+                }
+            self._counters[key] = (bucket, count, prev)
+            return prev, count
+
+
+class MongoStore:
+    """Keeps the counters in the `rate_limit` collection, shared by every
+    worker process"""
+
+    def incr(self, key, bucket, window):
+        """Count a request of `key` in window number `bucket`.
+        Returns the counts of the previous and the current window."""
+        same = {'$eq': ['$bucket', bucket]}
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=2 * window)
+        # One pipeline update rolls the windows over and counts the
+        # request; every expression reads the document before the update
+        doc = RateLimit._get_collection().find_one_and_update(
+            {'_id': key},
+            [{'$set': {
+                'prev': {'$cond': [same, '$prev', {'$cond': [
+                    {'$eq': ['$bucket', bucket - 1]}, '$count', 0
+                ]}]},
+                'count': {'$cond': [same, {'$add': ['$count', 1]}, 1]},
+                'bucket': bucket,
+                'expires_at': expires_at
+            }}],
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return doc['prev'], doc['count']
+
+
+class SlidingWindowLimiter:
+    """Allows `limit` requests per key in any `window` seconds"""
+
+    def __init__(self, store, limit, window=WINDOW):
+        self.store = store
+        self.limit = limit
+        self.window = window
+
+    def hit(self, key):
+        """Count a request of `key`. Returns 0 if it is allowed, otherwise
+        the number of seconds until the next one would be."""
+        now = time.time()
+        bucket, offset = divmod(now, self.window)
+        prev, count = self.store.incr(key, int(bucket), self.window)
+        weight = 1 - offset / self.window
+        if prev * weight + count <= self.limit:
+            return 0
+
+        # The wait lets one more request in, counted on top of `count`
+        if count >= self.limit:
+            # Blocked until the current window becomes the previous one
+            # and has slid far enough out
+            wait = self.window - offset + self.window * (
+                1 - (self.limit - 1) / count
+            )
+        else:
+            # Blocked until enough of the previous window slides out
+            wait = self.window * (
+                1 - (self.limit - count - 1) / prev
+            ) - offset
+        return max(1, math.ceil(wait))
+
+
+def get_store(name=STORE):
+    """Return the counter store called `name`"""
+    if name == 'mongo':
+        return MongoStore()
+    if name == 'memory':
+        return MemoryStore()
+    raise ValueError(f"Unsupported AUTH_RATE_LIMIT_STORE {name!r}")
+
+
+_store = get_store()
+ip_limiter = SlidingWindowLimiter(_store, PER_IP)
+username_limiter = SlidingWindowLimiter(_store, PER_USERNAME)
+
+
+def throttle(action, username=None):
+    """Count an attempt at `action` from the request's IP address and,
+    if given, on `username`. Returns the response rejecting the attempt,
+    or None if it may proceed."""
+    retry_after = ip_limiter.hit(f'{action}:ip:{request.remote_addr}')
+    if username is not None:
+        key = f'{action}:user:{str(username).strip().lower()}'
+        retry_after = max(retry_after, username_limiter.hit(key))
+    if retry_after:
+        return (
+            {'message': 'Too many attempts, try again later.'}, 429,
+            {'Retry-After': str(retry_after)}
+        )
+    return None
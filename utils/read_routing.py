@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""
+Contains the routing of reads to replica set secondaries.
+
+Routes opt in with `read_from_replicas`. Their querysets, wrapped in
+`replica(...)`, are then read through the `read` connection, whose
+`DB_READ_PREFERENCE` (e.g. `secondaryPreferred`) and
+`DB_READ_MAX_STALENESS_SECONDS` decide which members serve them. Such
+reads may lag the primary by up to the staleness bound, so they are only
+used for public listings. Writes always go to the primary, and so do the
+reads of every route that has not opted in, as well as any read a route
+sends back with `primary_reads()` because the client must see its own
+writes.
+
+Validators such as an ETag are not derived from replica reads, since
+the body may come from a member lagging the one that served the version.
+
+Without a replica connection (`DB_READ_PREFERENCE=primary`, the default)
+all of this is a no-op.
+"""
+
+from functools import wraps
+from flask import g
+from mongoengine.connection import get_db
+from models.engines.db_storage import READ_ALIAS, replica_storage
+
+
+def read_from_replicas(f):
+    """Let the decorated view read through the replica connection"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if replica_storage:
+            g.read_alias = READ_ALIAS
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def reads_from_replicas():
+    """Return whether the reads of the current request may go to
+    replicas. Successive reads may then be served by members lagging by
+    different amounts, so none can vouch for the freshness of another."""
+    return bool(g.get('read_alias'))
+
+
+def primary_reads():
+    """Send the rest of the request's reads back to the primary"""
+    g.pop('read_alias', None)
+
+
+def replica(queryset):
+    """Return `queryset` reading through the replica connection if the
+    current route reads from replicas, else `queryset` unchanged"""
+    alias = g.get('read_alias')
+    if not alias:
+        return queryset
+    # Like QuerySet.using, without switching the document class' alias,
+    # which other threads could observe
+    document = queryset._document
+    collection = get_db(alias)[document._get_collection_name()]
+    return queryset._clone_into(queryset.__class__(document, collection))
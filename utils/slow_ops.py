@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+"""
+Contains the opt-in recorder of slow MongoDB operations.
+
+With SLOW_OPS_THRESHOLD_MS set, every query a request sends that takes
+at least that long is kept with the route that sent it, the shape of the
+query (its filter, sort or pipeline with the values replaced by "?") and
+the plan MongoDB chose for it, e.g. `FETCH > IXSCAN(post_id_1)` or
+`COLLSCAN`. The plan comes from `explain`, sent through the connection
+that ran the query, so reads routed to secondaries are explained on a
+secondary. It runs in a background thread of each process, off the
+request, and is reused for the same shape for PLAN_TTL seconds. The last
+SLOW_OPS_CAPACITY operations of the serving process are served to
+superusers on /api/v1/diagnostics/slow-operations once explained.
+
+Only shapes are kept, never the values a query was sent with.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from flask import g, has_app_context, request
+from mongoengine.connection import get_db
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from models.engines.db_storage import storage, replica_storage
+
+THRESHOLD_MS = float(os.getenv('SLOW_OPS_THRESHOLD_MS', 0))
+CAPACITY = int(os.getenv('SLOW_OPS_CAPACITY', 100))
+PLAN_TTL = 60
+
+# Commands that `explain` accepts, with the fields that make their shape
+EXPLAINABLE = {
+    'find': ('filter', 'sort', 'projection', 'hint'),
+    'aggregate': ('pipeline', 'hint'),
+    'count': ('query', 'hint'),
+    'distinct': ('key', 'query'),
+    'findAndModify': ('query', 'sort'),
+    'update': ('updates',),
+    'delete': ('deletes',),
+}
+# Fields of a command that `explain` refuses or that tie it to a session
+NOT_EXPLAINED = frozenset((
+    'lsid', 'txnNumber', 'autocommit', 'startTransaction', 'readConcern',
+    'writeConcern', 'cursor', 'batchSize', 'singleBatch', 'maxTimeMS'
+))
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(value, key=None):
+    """Return the shape of a query, with its values replaced by "?" """
+    if key in ('sort', '$sort', 'projection', 'key', 'hint'):
+        return value
+    if isinstance(value, dict):
+        return {k: normalize(v, k) for k, v in value.items()}
+    if isinstance(value, list) and any(
+            isinstance(v, (dict, list)) for v in value):
+        return [normalize(v) for v in value]
+    return '?'
+
+
+def query_shape(command_name, command):
+    """Return the shape of the fields of a command that select documents"""
+    shape = {}
+    for field in EXPLAINABLE[command_name]:
+        if field in command:
+            value = command[field]
+            if field in ('updates', 'deletes'):
+                # Statements only differ by their filter, keep the first
+                value = {'q': value[0].get('q', {})} if value else {}
+            shape[field] = normalize(value, field)
+    return shape
+
+
+def summarize_plan(plan):
+    """Return the stages of a winning plan, from the last to the first,
+    e.g. `LIMIT > FETCH > IXSCAN(post_id_1)`"""
+    stages = []
+    while plan:
+        stage = plan.get('stage', '?')
+        if plan.get('indexName'):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        inputs = plan.get('inputStages')
+        if inputs:
+            stages.append(
+                '[' + ', '.join(summarize_plan(p) for p in inputs) + ']'
+            )
+            break
+        plan = plan.get('inputStage')
+    return ' > '.join(stages)
+
+
+def winning_plan(explained):
+    """Return the winning plan of an `explain` result"""
+    planner = explained.get('queryPlanner')
+    if not planner:
+        # Aggregations that are not pushed down whole explain each stage
+        for stage in explained.get('stages', []):
+            planner = stage.get('$cursor', {}).get('queryPlanner')
+            if planner:
+                break
+    if not planner:
+        return None
+    plan = planner.get('winningPlan', {})
+    # The slot based engine nests the plan under `queryPlan`
+    return plan.get('queryPlan', plan)
+
+
+class SlowOperationLog:
+    """Ring buffer of the last slow operations of the serving process"""
+
+    def __init__(self, capacity):
+        self._lock = threading.Lock()
+        self._operations = deque(maxlen=capacity)
+        self._plans = {}
+        # Operations dropped because the explain thread fell behind
+        self.unexplained = 0
+
+    def add(self, operation):
+        with self._lock:
+            self._operations.append(operation)
+
+    def cached_plan(self, key):
+        with self._lock:
+            cached = self._plans.get(key)
+        if cached and time.monotonic() - cached[0] < PLAN_TTL:
+            return cached[1]
+        return None
+
+    def cache_plan(self, key, plan):
+        with self._lock:
+            if len(self._plans) >= self._operations.maxlen:
+                self._plans.clear()
+            self._plans[key] = (time.monotonic(), plan)
+
+    def metrics(self):
+        """Return the settings and the operations, the newest first"""
+        with self._lock:
+            operations = list(reversed(self._operations))
+        return {
+            "enabled": THRESHOLD_MS > 0,
+            "threshold_ms": THRESHOLD_MS,
+            "capacity": self._operations.maxlen,
+            "unexplained": self.unexplained,
+            "operations": operations
+        }
+
+
+slow_operations = SlowOperationLog(CAPACITY)
+
+
+def explain(alias, database, command_name, command, shape):
+    """Return the summary of the plan MongoDB chooses for `command`, on
+    the members the connection `alias` reads from"""
+    key = json.dumps(
+        [alias, database, command_name, command[command_name], shape],
+        sort_keys=True, default=str
+    )
+    plan = slow_operations.cached_plan(key)
+    if plan:
+        return plan
+    if command_name in ('update', 'delete'):
+        field = command_name + 's'
+        command = dict(command, **{field: command[field][:1]})
+    db = get_db(alias).client[database]
+    try:
+        explained = db.command(
+            'explain', command, verbosity='queryPlanner',
+            read_preference=db.read_preference
+        )
+    except PyMongoError as e:
+        return f"explain failed: {e}"
+    plan = winning_plan(explained)
+    plan = summarize_plan(plan) if plan else 'unknown'
+    slow_operations.cache_plan(key, plan)
+    return plan
+
+
+class SlowOperationListener(monitoring.CommandListener):
+    """Keeps the queries of the current request sent through the
+    connection `alias` that take at least THRESHOLD_MS, to be explained
+    when the request is over"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def started(self, event):
+        pending = g.get('slow_ops') if has_app_context() else None
+        if pending is None or event.command_name not in EXPLAINABLE:
+            return
+        # The command is only valid during the callback, keep a copy
+        pending['started'][event.request_id] = {
+            k: v for k, v in event.command.items()
+            if not k.startswith('$') and k not in NOT_EXPLAINED
+        }
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event, event.failure)
+
+    def _finished(self, event, failure=None):
+        pending = g.get('slow_ops') if has_app_context() else None
+        if pending is None:
+            return
+        command = pending['started'].pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        if command is None or duration_ms < THRESHOLD_MS:
+            return
+        # Not the event, whose reply may hold a whole batch of documents
+        pending['slow'].append((
+            self.alias, event.database_name, event.command_name, command,
+            duration_ms, failure
+        ))
+
+
+_explain_queue = None
+_explain_lock = threading.Lock()
+
+
+def explain_queue():
+    """Return this process' queue of operations to explain, starting the
+    thread that explains them on first use, so worker processes forked
+    from a preloaded app each get their own"""
+    global _explain_queue
+    with _explain_lock:
+        if _explain_queue is None or _explain_queue[0] != os.getpid():
+            pending = queue.Queue(maxsize=CAPACITY)
+            threading.Thread(
+                target=_explain_forever, args=(pending,),
+                name='slow-ops-explain', daemon=True
+            ).start()
+            _explain_queue = (os.getpid(), pending)
+        return _explain_queue[1]
+
+
+def _explain_forever(pending):
+    while True:
+        operation, alias, database, command = pending.get()
+        try:
+            operation["plan"] = explain(
+                alias, database, operation["command"], command,
+                operation["shape"]
+            )
+        except Exception:
+            logger.exception("Could not explain a slow operation")
+            operation["plan"] = None
+        slow_operations.add(operation)
+        logger.warning("Slow %(command)s on %(collection)s from "
+                       "%(endpoint)s (%(duration_ms)sms): %(plan)s", operation)
+
+
+def _start():
+    g.slow_ops = {'started': {}, 'slow': []}
+
+
+def _teardown(exc):
+    pending = g.pop('slow_ops', None)
+    if not pending or not pending['slow']:
+        return
+    route = request.url_rule.rule if request.url_rule else None
+    explain_later = explain_queue()
+    for alias, database, name, command, duration_ms, failure in (
+            pending['slow']):
+        operation = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "endpoint": request.endpoint,
+            "route": route,
+            "method": request.method,
+            "command": name,
+            "collection": command[name],
+            "shape": query_shape(name, command),
+            "duration_ms": round(duration_ms, 3)
+        }
+        if failure:
+            operation["error"] = failure.get('errmsg')
+        try:
+            explain_later.put_nowait((operation, alias, database, command))
+        except queue.Full:
+            slow_operations.unexplained += 1
+
+
+def init_app(app):
+    """Record the slow MongoDB operations of the requests of `app` when
+    SLOW_OPS_THRESHOLD_MS is set. The `explain` commands are sent outside
+    of any request, so they do not count against one."""
+    if THRESHOLD_MS <= 0:
+        return
+    for connection in (storage, replica_storage):
+        if connection:
+            connection.add_listener(SlowOperationListener(connection.alias))
+    app.before_request(_start)
+    app.teardown_request(_teardown)
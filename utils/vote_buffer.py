@@ -0,0 +1,418 @@
+#!/usr/bin/python3
+"""
+Contains the write-behind buffer for votes.
+
+When `VOTE_WRITE_BEHIND=true`, votes cast in `set` mode are acknowledged
+as soon as they are buffered. The buffer keeps the latest vote per
+(user, target), so repeated votes of a user on a trending post coalesce
+into a single write, and a background thread flushes it as one bulk
+write of likes plus one bulk write of counters per target type, when it
+holds `VOTE_BUFFER_MAX_SIZE` votes or every `VOTE_BUFFER_FLUSH_INTERVAL`
+seconds.
+
+Crash safety:
+
+* Without a journal, the votes buffered since the last flush (at most
+  one interval, or one full buffer) are lost if the process dies. They
+  are flushed on a clean interpreter exit.
+* With `VOTE_BUFFER_JOURNAL_DIR` set, every vote is appended to a
+  per-process journal (and fsynced unless `VOTE_BUFFER_FSYNC=false`)
+  before it is acknowledged. The journal is only cut back once a flush
+  has been written, so it always holds every unflushed vote. Journals
+  are locked by their process; a process that finds an unlocked journal
+  left by a dead one replays it. Replay is idempotent: a buffered vote
+  is the final value of a (user, target) vote, and counter deltas are
+  computed against the stored like when it is flushed.
+* Counter deltas whose bulk write fails after their likes were written
+  are kept in memory and retried on the next flushes, as the likes
+  they come from are no longer pending. They are not journaled: if the
+  process dies before they are written, or between writing the likes
+  and the counters of a flush, or if a bulk write of likes fails
+  part-way without reporting which likes it wrote, the counters drift
+  until management/reconcile_vote_counts.py runs.
+* Within a process, votes written synchronously (`create` and `toggle`
+  votes, `set` votes the buffer refused, and like updates and deletes
+  by id) first `settle` the buffered votes of their user: those are
+  written right away, after any flush in progress, so a later
+  synchronous vote is never overwritten by an older buffered one.
+* Votes of one user on one target made through different processes are
+  ordered by flush time, not by the time they were cast. Each like is
+  written on the condition that it still holds the value read when the
+  batch was prepared, so a vote written by another process in between
+  makes the write fail and be retried against the new value, and the
+  counters stay exact.
+"""
+
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from dotenv import load_dotenv
+from models.like_model import Like, TARGET_MODELS
+
+load_dotenv()
+
+WRITE_BEHIND = os.getenv('VOTE_WRITE_BEHIND', 'false').lower() == 'true'
+MAX_SIZE = int(os.getenv('VOTE_BUFFER_MAX_SIZE', 1000))
+FLUSH_INTERVAL = float(os.getenv('VOTE_BUFFER_FLUSH_INTERVAL', 1.0))
+JOURNAL_DIR = os.getenv('VOTE_BUFFER_JOURNAL_DIR')
+FSYNC = os.getenv('VOTE_BUFFER_FSYNC', 'true').lower() == 'true'
+
+# Times `settle` retries the votes whose like changed while it wrote them
+SETTLE_ATTEMPTS = 3
+
+# Past this many pending votes (e.g. while the database is unreachable)
+# new votes are refused and written synchronously by the caller
+HARD_LIMIT_FACTOR = 10
+
+
+class VoteBuffer:
+    """Coalesces votes per (user, target) and writes them in bulk"""
+
+    def __init__(self, max_size=MAX_SIZE, flush_interval=FLUSH_INTERVAL,
+                 journal_dir=None, fsync=FSYNC):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.pid = os.getpid()
+        self._votes = {}
+        # Counter deltas of written likes, by (field, target id), whose
+        # write failed
+        self._counter_deltas = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._journal = None
+        self.stats = {
+            'flushes': 0,
+            'failed_flushes': 0,
+            'failed_counter_writes': 0,
+            'flushed_votes': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0
+        }
+        if journal_dir:
+            self._open_journal(journal_dir)
+
+    # Journal
+
+    def _open_journal(self, journal_dir):
+        """Open and lock this process' journal, then adopt the journals
+        left behind by dead processes"""
+        os.makedirs(journal_dir, exist_ok=True)
+        path = os.path.join(journal_dir, f'votes-{self.pid}.log')
+        self._journal = open(path, 'a+')
+        fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        # A process restarted with the same pid, as after a container
+        # restart, finds the votes of its predecessor in its own journal
+        self._journal.seek(0)
+        self._replay(self._journal)
+
+        for orphan in glob.glob(os.path.join(journal_dir, 'votes-*.log')):
+            if orphan == path:
+                continue
+            with open(orphan) as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # still owned by a live process
+                self._replay(f)
+            os.unlink(orphan)
+        self._rewrite_journal()
+
+    def _replay(self, journal):
+        """Buffer the votes of a journal, the latest per (user, target)"""
+        for line in journal:
+            try:
+                user_id, field, target_id, value = json.loads(line)
+            except ValueError:
+                continue  # torn last line of a crashed write
+            self._votes[(user_id, field, target_id)] = value
+
+    def _append_journal(self, key, value):
+        """Durably record a vote before it is acknowledged"""
+        self._journal.write(json.dumps([*key, value]) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _rewrite_journal(self):
+        """Cut the journal back to the votes still pending"""
+        self._journal.seek(0)
+        self._journal.truncate()
+        for key, value in self._votes.items():
+            self._journal.write(json.dumps([*key, value]) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # Buffering
+
+    def submit(self, user_id, field, target_id, value):
+        """Buffer the vote of a user on a target (None removes the vote).
+        Returns False if the buffer is full and the vote was refused."""
+        key = (user_id, field, target_id)
+        with self._lock:
+            if (key not in self._votes and
+                    len(self._votes) >= self.max_size * HARD_LIMIT_FACTOR):
+                return False
+            if self._journal:
+                self._append_journal(key, value)
+            self._votes[key] = value
+            full = len(self._votes) >= self.max_size
+        if full:
+            self._wakeup.set()
+        return True
+
+    def depth(self):
+        """Return the number of votes waiting to be flushed"""
+        return len(self._votes)
+
+    def metrics(self):
+        """Return the buffer depth and the flush statistics"""
+        return dict(
+            self.stats, depth=self.depth(),
+            pending_counters=len(self._counter_deltas)
+        )
+
+    # Flushing
+
+    def settle(self, user_id, field=None, target_id=None):
+        """Write now the buffered votes of a user, on one target if given,
+        so that a synchronous write that follows reads and changes the
+        latest vote. Waits for a flush in progress, which may hold them."""
+        with self._flush_lock:
+            with self._lock:
+                if field:
+                    keys = [(user_id, field, target_id)]
+                else:
+                    keys = [key for key in self._votes if key[0] == user_id]
+                batch = {
+                    key: self._votes.pop(key)
+                    for key in keys if key in self._votes
+                }
+            if not batch:
+                return
+
+            pending = batch
+            try:
+                for _ in range(SETTLE_ATTEMPTS):
+                    pending = self._write(pending)
+                    if not pending:
+                        break
+            finally:
+                with self._lock:
+                    for key, value in pending.items():
+                        self._votes.setdefault(key, value)
+                    if self._journal and len(pending) < len(batch):
+                        self._rewrite_journal()
+            self.stats['flushed_votes'] += len(batch) - len(pending)
+
+    def flush(self):
+        """Write the buffered votes. Returns the number of votes written.
+
+        Votes that could not be written go back in the buffer, unless a
+        newer vote on the same (user, target) arrived in the meantime.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._votes = self._votes, {}
+            if not batch:
+                self._write_counters()
+                return 0
+
+            start = time.perf_counter()
+            try:
+                failed = self._write(batch)
+            except Exception:
+                # Keep the votes, they are retried on the next flush
+                failed = batch
+                self.stats['failed_flushes'] += 1
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                for key, value in failed.items():
+                    self._votes.setdefault(key, value)
+                if self._journal and len(failed) < len(batch):
+                    self._rewrite_journal()
+
+            written = len(batch) - len(failed)
+            self.stats['flushes'] += 1
+            self.stats['flushed_votes'] += written
+            self.stats['last_flush_seconds'] = elapsed
+            self.stats['total_flush_seconds'] += elapsed
+            self.stats['max_flush_seconds'] = max(
+                self.stats['max_flush_seconds'], elapsed
+            )
+            return written
+
+    def _write(self, batch):
+        """Write a batch of votes and their counter deltas in bulk.
+        Returns the votes that failed to be written."""
+        likes = Like._get_collection()
+        now = datetime.now(timezone.utc)
+        writes, keys, deltas, removals = [], [], [], []
+
+        by_field = defaultdict(dict)
+        for (user_id, field, target_id), value in batch.items():
+            by_field[field][(user_id, target_id)] = value
+
+        for field, votes in by_field.items():
+            # One read of the stored votes of the batch per target type
+            stored = {
+                (doc['user_id'], doc[field]): doc['value']
+                for doc in likes.find(
+                    {
+                        'user_id': {'$in': list({u for u, _ in votes})},
+                        field: {'$in': list({t for _, t in votes})}
+                    },
+                    projection={'user_id': True, field: True, 'value': True}
+                )
+            }
+            for (user_id, target_id), value in votes.items():
+                previous = stored.get((user_id, target_id))
+                if previous == value:
+                    continue
+                # Only write over the value the delta is computed from
+                query = {
+                    'user_id': user_id, field: target_id,
+                    'value': {'$exists': False} if previous is None
+                    else previous
+                }
+                key = (user_id, field, target_id)
+                if value is None:
+                    removals.append((key, query, -previous))
+                    continue
+                inserted = Like._new_vote(value)
+                del inserted['value'], inserted['updated_at']
+                # A like written meanwhile no longer matches, and the
+                # upsert then fails on the unique (user, target) index
+                writes.append(UpdateOne(query, {
+                    '$set': {'value': value, 'updated_at': now},
+                    '$setOnInsert': inserted
+                }, upsert=True))
+                keys.append(key)
+                deltas.append(value - (previous or 0))
+
+        failed = set()
+        if writes:
+            try:
+                likes.bulk_write(writes, ordered=False)
+            except BulkWriteError as e:
+                # Retry those votes against the new state on the next
+                # flush
+                failed = {
+                    error['index'] for error in e.details['writeErrors']
+                }
+        failed = {keys[index] for index in failed}
+
+        written = [
+            (key, delta) for key, delta in zip(keys, deltas)
+            if key not in failed
+        ]
+        # Removals are rare (none of the views buffers one), and a delete
+        # that matches nothing is no error, so each is checked on its own
+        for key, query, delta in removals:
+            if likes.delete_one(query).deleted_count:
+                written.append((key, delta))
+            else:
+                failed.add(key)
+
+        # The likes are written, so from here on their deltas must not be
+        # lost with a failed flush: they wait for the counter writes
+        for key, delta in written:
+            if delta:
+                self._counter_deltas[(key[1], key[2])] += delta
+        self._write_counters()
+
+        return {key: batch[key] for key in failed}
+
+    def _write_counters(self):
+        """Write the pending counter deltas with one bulk write per target
+        type, keeping those that failed for the next flush"""
+        by_field = defaultdict(list)
+        for key, delta in list(self._counter_deltas.items()):
+            if delta:
+                by_field[key[0]].append((key[1], delta))
+            else:
+                del self._counter_deltas[key]  # votes that cancelled out
+        for field, targets in by_field.items():
+            model = TARGET_MODELS[field]
+            failed = set()
+            try:
+                model._get_collection().bulk_write([
+                    UpdateOne({'_id': target_id}, model.vote_update(delta))
+                    for target_id, delta in targets
+                ], ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index'] for error in e.details['writeErrors']}
+                self.stats['failed_counter_writes'] += 1
+            except PyMongoError:
+                failed = set(range(len(targets)))
+                self.stats['failed_counter_writes'] += 1
+            for index, (target_id, _) in enumerate(targets):
+                if index not in failed:
+                    del self._counter_deltas[(field, target_id)]
+
+    # Background flushing
+
+    def start(self):
+        """Start flushing in a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, name='vote-buffer', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        """Stop the background thread and flush what is left"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """Return this process' vote buffer, or None if write-behind is off.
+
+    The buffer is created on first use in each process, so worker
+    processes forked from a preloaded app each get their own thread and
+    journal.
+    """
+    global _buffer
+    if not WRITE_BEHIND:
+        return None
+    with _buffer_lock:
+        if _buffer is None or _buffer.pid != os.getpid():
+            _buffer = VoteBuffer(journal_dir=JOURNAL_DIR)
+            _buffer.start()
+        return _buffer
+
+
+def settle_votes(user_id):
+    """Write the buffered votes of a user, if write-behind is on, before
+    one of their likes is changed or deleted by id"""
+    buffer = get_vote_buffer()
+    if buffer:
+        buffer.settle(user_id)
@@ -2,6 +2,7 @@ from flask import request
 from flask_restful import Resource
 from decorators.super_user import superuser_required
 from models.user_model import User
+from utils.auth_context import invalidate_auth
 from flask import Blueprint
 
 role_management_bp = Blueprint('roles', __name__)
@@ -71,8 +72,9 @@ class UserRoleUpdateResource(Resource):
         if new_role not in ["admin", "user"]:
             return {"error": "Invalid role provided"}, 400
 
-        user.role = new_role
+        user.role = [new_role]
         user.save()
+        invalidate_auth(user.id)
         return {"message": f"User role updated successfully"}, 200
 
 
@@ -3,11 +3,20 @@
 from flask import Blueprint, request
 from flask_restful import Resource
 from flask_jwt_extended import create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
 from models.user_model import User  # Import your User model
+from utils.rate_limit import throttle
+from utils.passwords import (
+    HashingBusy, hash_password, needs_rehash, verify_password
+)
 
 auth_blueprint = Blueprint('auth', __name__)
 
+# Returned when the password hashing pool is saturated
+BUSY_RESPONSE = (
+    {'message': 'Too many requests, try again later.'}, 503,
+    {'Retry-After': '1'}
+)
+
 
 class RegistrationResource(Resource):
     """Handles user registration."""
@@ -43,13 +52,24 @@ class RegistrationResource(Resource):
                 message:
                   type: string
                   example: "User created successfully!"
+          429:
+            description: Too many attempts, retry after Retry-After seconds
+          503:
+            description: Too many password hashes in progress
         """
+        limited = throttle('register')
+        if limited:
+            return limited
+
         data = request.get_json()
 
         # Registration logic
         if 'username' in data and 'password' in data and 'email' in data:
             # Hash the password
-            password_hash = generate_password_hash(data['password'])
+            try:
+                password_hash = hash_password(data['password'])
+            except HashingBusy:
+                return BUSY_RESPONSE
             user = User(
                 username=data['username'],
                 email=data['email'],  # Include email here
@@ -61,6 +81,18 @@ class RegistrationResource(Resource):
         return {'message': 'Missing required fields.'}, 400
 
 
+def upgrade_password_hash(user, password):
+    """Replace the outdated hash of a user who just proved their
+    password, unless the password was changed in the meantime"""
+    try:
+        password_hash = hash_password(password)
+    except HashingBusy:
+        return  # Upgraded on a later login instead
+    User.objects(
+        id=user.id, password_hash=user.password_hash
+    ).update_one(set__password_hash=password_hash)
+
+
 class LoginResource(Resource):
     """Handles user login."""
 
@@ -100,19 +132,33 @@ class LoginResource(Resource):
                 message:
                   type: string
                   example: "Invalid credentials"
+          429:
+            description: Too many attempts, retry after Retry-After seconds
+          503:
+            description: Too many password hashes in progress
         """
         data = request.get_json()
 
         # Login logic
         if 'username' in data and 'password' in data:
+            # Throttle before spending a lookup and a hash on the attempt
+            limited = throttle('login', data['username'])
+            if limited:
+                return limited
+
             user = User.objects(
                 username=data['username']
-            ).first()
-            if user and check_password_hash(
-                user.password_hash, data['password']
-            ):
-                access_token = create_access_token(identity=user.id)
-                return {'access_token': access_token}, 200
+            ).only('id', 'password_hash').first()
+            try:
+                if user and verify_password(
+                    user.password_hash, data['password']
+                ):
+                    if needs_rehash(user.password_hash):
+                        upgrade_password_hash(user, data['password'])
+                    access_token = create_access_token(identity=user.id)
+                    return {'access_token': access_token}, 200
+            except HashingBusy:
+                return BUSY_RESPONSE
 
         return {'message': 'Invalid credentials'}, 401
 
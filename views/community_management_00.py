@@ -3,8 +3,13 @@ from flask import Blueprint
 from flask_restful import Resource
 from models.community_model import Community
 from models.user_model import User
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 from decorators.super_user import superuser_required
+from utils.auth_context import current_user
+from utils.conditional import make_etag, not_modified, validator_headers
+from utils.dataloader import get_loader
+from utils.read_routing import read_from_replicas, replica
+from utils.query_stats import query_budget
 
 community_blueprint00 = Blueprint('community00', __name__)
 
@@ -52,10 +57,9 @@ class CreateCommunityResource(Resource):
             return {"error": "Community name is required"}, 400
 
         # Get the current user (who is creating the community)
-        current_user_id = get_jwt_identity()
-        current_user = User.objects(id=current_user_id).first()
+        user = current_user()
 
-        if not current_user:
+        if not user:
             return {"error": "User not found"}, 404
 
         # Create a new community
@@ -64,7 +68,7 @@ class CreateCommunityResource(Resource):
             description=description,
             moderators=moderators
         )
-        community.save(created_by=current_user, updated_by=current_user)
+        community.save(created_by=user, updated_by=user)
 
         # Return response with created_by and updated_by
         def get_user_id(user):
@@ -83,8 +87,33 @@ class CreateCommunityResource(Resource):
         return response, 201
 
 
+def serialize_community(community, loader):
+    """Return the raw `community` with its user references resolved
+    through the request's loader"""
+    return {
+        "name": community['name'],
+        "description": community.get('description'),
+        "moderators": loader.ref_ids(User, community.get('moderators', [])),
+        "created_by": loader.ref_id(User, community.get('created_by')),
+        "updated_by": loader.ref_id(User, community.get('updated_by')),
+        "created_at": community['created_at'].isoformat(),
+        "updated_at": community['updated_at'].isoformat()
+    }
+
+
+def user_refs(community):
+    """Return the ids of the users the raw `community` refers to"""
+    return [
+        community.get('created_by'),
+        community.get('updated_by'),
+        *community.get('moderators', [])
+    ]
+
+
 class ReadAllCommunitiesResource(Resource):
 
+    @query_budget(2)
+    @read_from_replicas
     def get(self):
         """Get all communities.
         ---
@@ -94,23 +123,16 @@ class ReadAllCommunitiesResource(Resource):
           200:
             description: A list of communities
         """
-        communities = Community.objects()
+        communities = list(replica(Community.objects().exclude(
+            'feed_version', 'feed_updated_at'
+        ).as_pymongo()))
 
-        # Build the response with created_by,
-        # updated_by, created_at, and updated_at
-        response = []
+        # Resolve the users referenced by every community in one query
+        loader = get_loader()
         for c in communities:
-            response.append({
-                "name": c.name,
-                "description": c.description,
-                "moderators": [str(m.id) for m in c.moderators],
-                "created_by": str(c.created_by.id) if c.created_by else None,
-                "updated_by": str(c.updated_by.id) if c.updated_by else None,
-                "created_at": c.created_at.isoformat(),
-                "updated_at": c.updated_at.isoformat()
-            })
+            loader.prime(User, user_refs(c))
 
-        return response, 200
+        return [serialize_community(c, loader) for c in communities], 200
 
 
 class ReadOneCommunityResource(Resource):
@@ -129,27 +151,28 @@ class ReadOneCommunityResource(Resource):
         responses:
           200:
             description: Community details
+          304:
+            description: Not modified, the cached copy is current
           404:
             description: Community not found
         """
-        community = Community.objects(id=community_id).first()
+        community = Community.objects(id=community_id).exclude(
+            'feed_version', 'feed_updated_at'
+        ).as_pymongo().first()
         if not community:
             return {"error": "Community not found"}, 404
 
-        def get_user_id(user):
-            return str(user.id) if user else None
+        updated_at = community['updated_at']
+        etag = make_etag(community['_id'], updated_at)
+        cached = not_modified(etag, updated_at)
+        if cached:
+            return cached
 
-        response = {
-            "name": community.name,
-            "description": community.description,
-            "moderators": [str(m.id) for m in community.moderators],
-            "created_by": get_user_id(community.created_by),
-            "updated_by": get_user_id(community.updated_by),
-            "created_at": community.created_at.isoformat(),
-            "updated_at": community.updated_at.isoformat()
-        }
+        loader = get_loader()
+        loader.prime(User, user_refs(community))
+        response = serialize_community(community, loader)
 
-        return response, 200
+        return response, 200, validator_headers(etag, updated_at)
 
 
 community_blueprint00.add_url_rule(
@@ -1,13 +1,67 @@
+from datetime import datetime, timezone
 from flask import request
 from flask_restful import Resource
 from flask import Blueprint
+from pymongo import ReturnDocument, UpdateOne
 from models.community_model import Community
 from models.user_model import User
 from flask_jwt_extended import get_jwt_identity
 from decorators.super_user import superuser_required
+from utils.auth_context import current_user
 
 community_blueprint01 = Blueprint('community01', __name__)
 
+MAX_BULK_MODERATOR_CHANGES = 500
+
+
+def without(array, excluded):
+    """Return the aggregation expression of the items of `array` that
+    are not in `excluded`, in their order"""
+    return {'$filter': {
+        'input': array,
+        'as': 'item',
+        'cond': {'$eq': [{'$in': ['$$item', excluded]}, False]}
+    }}
+
+
+def moderator_update(add_moderators, remove_moderators, user_id):
+    """Return the pipeline update applying a moderator change to a
+    community in one atomic write: the added moderators that are not
+    moderators yet are appended, then the removed ones are filtered out,
+    and who made the change is recorded"""
+    moderators = {'$ifNull': ['$moderators', []]}
+    if add_moderators:
+        moderators = {'$concatArrays': [
+            moderators, without({'$literal': add_moderators}, moderators)
+        ]}
+    if remove_moderators:
+        moderators = without(moderators, {'$literal': remove_moderators})
+    return [{'$set': {
+        'moderators': moderators,
+        'updated_by': user_id,
+        'updated_at': datetime.now(timezone.utc)
+    }}]
+
+
+def is_id_list(value):
+    """Return whether a value from a request body is a list of ids, which
+    go into raw queries where an object would be an operator"""
+    return isinstance(value, list) and all(isinstance(i, str) for i in value)
+
+
+def has_moderator_lists(change):
+    """Return whether the moderator lists of a change are lists of ids"""
+    return (is_id_list(change.get('add_moderators', [])) and
+            is_id_list(change.get('remove_moderators', [])))
+
+
+def existing_user_ids(user_ids):
+    """Return the ids among `user_ids` that belong to a user, read
+    from the _id index only"""
+    if not user_ids:
+        return set()
+    return set(User.objects(id__in=list(user_ids)).distinct('id'))
+
 
 class UpdateCommunityResource(Resource):
     @superuser_required
@@ -45,8 +99,7 @@ class UpdateCommunityResource(Resource):
         if not community:
             return {"error": "Community not found"}, 404
 
-        current_user = get_jwt_identity()  # Get the currently logged-in user
-        user = User.objects(id=current_user).first()  # Fetch the User object
+        user = current_user()
 
         if not user:
             return {"error": "User not found"}, 404
@@ -122,41 +175,144 @@ class ManageModeratorsResource(Resource):
         responses:
           200:
             description: Moderators updated successfully
+          400:
+            description: Invalid input
           404:
             description: Community not found
         """
-        data = request.get_json()
-        add_moderators = data.get('add_moderators', [])
-        remove_moderators = data.get('remove_moderators', [])
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not has_moderator_lists(data):
+            return {
+                "error": "add_moderators and remove_moderators must be "
+                         "lists of user ids"
+            }, 400
+        add_moderators = list(dict.fromkeys(data.get('add_moderators', [])))
+        remove_moderators = list(dict.fromkeys(
+            data.get('remove_moderators', [])
+        ))
 
-        community = Community.objects(id=community_id).first()
+        # Only existing users can become moderators
+        known = existing_user_ids(add_moderators)
+        add_moderators = [m for m in add_moderators if m in known]
+
+        # A single atomic update of the moderators array, so concurrent
+        # edits never overwrite each other
+        current_user_id = get_jwt_identity()
+        community = Community._get_collection().find_one_and_update(
+            {'_id': community_id},
+            moderator_update(
+                add_moderators, remove_moderators, current_user_id
+            ),
+            projection={'name': True},
+            return_document=ReturnDocument.AFTER
+        )
         if not community:
             return {"error": "Community not found"}, 404
 
-        current_user_id = get_jwt_identity()
-        user = User.objects(id=current_user_id).first()
+        return {
+            "message": f"Moderators updated for {community['name']}",
+            "updated_by": str(current_user_id)
+        }, 200
 
-        if not user:
-            return {"error": "User not found"}, 404
 
-        # Add moderators
-        if add_moderators:
-            moderators_to_add = User.objects(id__in=add_moderators)
-            community.moderators.extend(moderators_to_add)
+class BulkManageModeratorsResource(Resource):
+    @superuser_required
+    def put(self):
+        """Add or remove moderators across many communities at once.
+        ---
+        tags:
+          - Community
+        parameters:
+          - in: body
+            name: body
+            schema:
+              type: object
+              properties:
+                changes:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      community_id:
+                        type: string
+                        example: "community_id1"
+                      add_moderators:
+                        type: array
+                        items:
+                          type: string
+                          example: "user_id1"
+                      remove_moderators:
+                        type: array
+                        items:
+                          type: string
+                          example: "user_id2"
+        responses:
+          200:
+            description: Moderators updated successfully
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  example: "Moderators updated"
+                matched:
+                  type: integer
+                  description: Number of updates that found their community
+                  example: 3
+                modified:
+                  type: integer
+                  description: Number of updates that changed a community
+                  example: 2
+          400:
+            description: Invalid or too many changes
+        """
+        data = request.get_json(silent=True)
+        changes = data.get('changes') if isinstance(data, dict) else None
+        if not isinstance(changes, list) or not changes:
+            return {"error": "changes is required"}, 400
+        if len(changes) > MAX_BULK_MODERATOR_CHANGES:
+            return {
+                "error": f"at most {MAX_BULK_MODERATOR_CHANGES} changes"
+            }, 400
+        if not all(isinstance(c, dict) and c.get('community_id') and
+                   isinstance(c['community_id'], str) for c in changes):
+            return {"error": "every change needs a community_id"}, 400
+        if not all(has_moderator_lists(c) for c in changes):
+            return {
+                "error": "add_moderators and remove_moderators must be "
+                         "lists of user ids"
+            }, 400
 
-        # Remove moderators
-        if remove_moderators:
-            moderators_to_remove = set(User.objects(id__in=remove_moderators))
-            community.moderators = [
-                mod for mod in community.moderators
-                if mod not in moderators_to_remove
-            ]
+        # One lookup validates the added moderators of every change
+        known = existing_user_ids({
+            m for c in changes for m in c.get('add_moderators', [])
+        })
 
-        community.updated_by = user  # Set the updated_by field
-        community.save()
+        current_user_id = get_jwt_identity()
+        writes = []
+        for change in changes:
+            add_moderators = list(dict.fromkeys(
+                m for m in change.get('add_moderators', []) if m in known
+            ))
+            remove_moderators = list(dict.fromkeys(
+                change.get('remove_moderators', [])
+            ))
+            if add_moderators or remove_moderators:
+                writes.append(UpdateOne(
+                    {'_id': change['community_id']},
+                    moderator_update(
+                        add_moderators, remove_moderators, current_user_id
+                    )
+                ))
+
+        if not writes:
+            return {"message": "Moderators updated", "matched": 0,
+                    "modified": 0}, 200
+        result = Community._get_collection().bulk_write(writes)
         return {
-            "message": f"Moderators updated for {community.name}",
-            "updated_by": str(user.id)
+            "message": "Moderators updated",
+            "matched": result.matched_count,
+            "modified": result.modified_count
         }, 200
 
 
@@ -172,3 +328,7 @@ community_blueprint01.add_url_rule(
     '/api/v1/community/manage-community-moderators/<string:community_id>',
     view_func=ManageModeratorsResource.as_view('manage_community_moderators')
 )
+community_blueprint01.add_url_rule(
+    '/api/v1/community/manage-moderators-bulk',
+    view_func=BulkManageModeratorsResource.as_view('bulk_manage_moderators')
+)
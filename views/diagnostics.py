@@ -0,0 +1,139 @@
+from flask import Blueprint
+from flask_restful import Resource
+from decorators.super_user import superuser_required
+from utils.query_stats import endpoint_totals
+from utils.slow_ops import slow_operations
+
+diagnostics_blueprint = Blueprint('diagnostics', __name__)
+
+
+# Class to report the database commands sent per endpoint
+class QueryStatsResource(Resource):
+    """Handles reporting the MongoDB commands of each endpoint."""
+
+    @superuser_required
+    def get(self):
+        """Get the MongoDB commands sent by the requests of each endpoint.
+        ---
+        tags:
+          - Diagnostics
+        responses:
+          200:
+            description: >
+              Totals of the serving process since it started, by endpoint
+            schema:
+              type: object
+              additionalProperties:
+                type: object
+                properties:
+                  requests:
+                    type: integer
+                    example: 120
+                  queries:
+                    type: integer
+                    example: 240
+                  db_ms:
+                    type: number
+                    example: 310.5
+                  max_queries:
+                    type: integer
+                    example: 2
+                  over_budget:
+                    type: integer
+                    description: Requests over the endpoint's query budget
+                    example: 0
+                  mean_queries:
+                    type: number
+                    example: 2.0
+                  mean_db_ms:
+                    type: number
+                    example: 2.588
+        """
+        return endpoint_totals.metrics(), 200
+
+
+# Class to report the slow database operations
+class SlowOperationsResource(Resource):
+    """Handles reporting the slow MongoDB operations."""
+
+    @superuser_required
+    def get(self):
+        """Get the last slow MongoDB operations and their query plans.
+        ---
+        tags:
+          - Diagnostics
+        description: >
+          Operations of the serving process that took at least
+          SLOW_OPS_THRESHOLD_MS, the newest first, listed once their plan
+          has been explained in the background. Recording is off when the
+          threshold is not set.
+        responses:
+          200:
+            description: The recorder settings and the operations
+            schema:
+              type: object
+              properties:
+                enabled:
+                  type: boolean
+                  example: true
+                threshold_ms:
+                  type: number
+                  example: 100
+                capacity:
+                  type: integer
+                  example: 100
+                unexplained:
+                  type: integer
+                  description: >
+                    Operations dropped because they came faster than they
+                    could be explained
+                  example: 0
+                operations:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      at:
+                        type: string
+                        format: date-time
+                      endpoint:
+                        type: string
+                        example: like.post_like
+                      route:
+                        type: string
+                        example: /api/v1/like/post-like/<string:post_id>
+                      method:
+                        type: string
+                        example: GET
+                      command:
+                        type: string
+                        example: find
+                      collection:
+                        type: string
+                        example: like
+                      shape:
+                        type: object
+                        description: The query, with its values replaced
+                        example: {"filter": {"post_id": "?"}}
+                      duration_ms:
+                        type: number
+                        example: 250.4
+                      plan:
+                        type: string
+                        description: Stages of the winning plan
+                        example: COLLSCAN
+                      error:
+                        type: string
+                        description: The error of a failed operation
+        """
+        return slow_operations.metrics(), 200
+
+
+diagnostics_blueprint.add_url_rule(
+    '/api/v1/diagnostics/queries',
+    view_func=QueryStatsResource.as_view('queries')
+)
+diagnostics_blueprint.add_url_rule(
+    '/api/v1/diagnostics/slow-operations',
+    view_func=SlowOperationsResource.as_view('slow_operations')
+)
@@ -1,77 +1,285 @@
-# from flask import Blueprint, request, jsonify
-# from flask_restful import Resource, Api
-# from models.post_model import Post  # Assuming Post is a model in your system
-
-# # Create a Blueprint for post-related endpoints
-# fetch_post_blueprint = Blueprint('fetch_post', __name__)
-# api = Api(fetch_post_blueprint)
-
-# # Class to fetch all posts in a specific community by community ID
-# class PostsByCommunityResource(Resource):
-#     def get(self, community_id):
-#         page = request.args.get('page', 1, type=int)
-#         per_page = request.args.get('per_page', 10, type=int)
-
-#         # Fetch posts by community ID
-#         posts = Post.objects(community_id=community_id).paginate(page=page, per_page=per_page)
-#         return jsonify({
-#             "posts": [{"id": str(post.id), "title": post.title, "content": post.content, "created_at": post.created_at}
-#                       for post in posts.items],
-#             "total": posts.total,
-#             "pages": posts.pages,
-#             "current_page": posts.page,
-#             "per_page": posts.per_page
-#         }), 200
-
-# # Class to fetch a specific post by community ID and post ID
-# class PostByCommunityAndPostResource(Resource):
-#     def get(self, community_id, post_id):
-#         # Fetch the post by community and post ID
-#         post = Post.objects(community_id=community_id, id=post_id).first()
-#         if post:
-#             return jsonify({
-#                 "id": str(post.id),
-#                 "title": post.title,
-#                 "content": post.content,
-#                 "created_at": post.created_at,
-#                 "community_id": str(post.community_id)
-#             }), 200
-#         return {"error": "Post not found"}, 404
-
-# # Class to fetch all posts by a specific user
-# class PostsByUserResource(Resource):
-#     def get(self, user_id):
-#         page = request.args.get('page', 1, type=int)
-#         per_page = request.args.get('per_page', 10, type=int)
-
-#         # Fetch posts by user ID
-#         posts = Post.objects(user_id=user_id).paginate(page=page, per_page=per_page)
-#         return jsonify({
-#             "posts": [{"id": str(post.id), "title": post.title, "content": post.content, "created_at": post.created_at}
-#                       for post in posts.items],
-#             "total": posts.total,
-#             "pages": posts.pages,
-#             "current_page": posts.page,
-#             "per_page": posts.per_page
-#         }), 200
-
-# # Add URL rules for the resources (endpoints)
-# api.add_resource(PostsByCommunityResource, '/api/v1/posts/community/<string:community_id>')
-# api.add_resource(PostByCommunityAndPostResource, '/api/v1/posts/community/<string:community_id>/post/<string:post_id>')
-# api.add_resource(PostsByUserResource, '/api/v1/posts/user/<string:user_id>')
-
-
-
-from flask import Blueprint, request, jsonify
+import heapq
+from datetime import datetime
+from itertools import islice
+from flask import Blueprint, request
 from flask_restful import Resource, Api
-from models.post_model import Post  # Assuming Post is a model in your system
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from models.post_model import Post
+from models.like_model import Like
+from models.community_model import Community
+from utils.read_routing import (
+    primary_reads, read_from_replicas, reads_from_replicas, replica
+)
+from utils.conditional import make_etag, not_modified, validator_headers
+from utils.pagination import (
+    InvalidCursor, after_cursor, decode_positions, encode_positions,
+    keyset_page
+)
 
 # Create a Blueprint for post-related endpoints
 fetch_post_blueprint = Blueprint('fetch_post', __name__)
 api = Api(fetch_post_blueprint)
 
+MAX_PER_PAGE = 100
+MAX_FEED_COMMUNITIES = 50
+
+# Fields read from the database to build a post's listing representation.
+# Posts are read as raw documents with only these fields, so listing a
+# page never builds Post documents or touches their references.
+POST_LIST_FIELDS = ('id', 'title', 'body', 'created_at')
+
+# Listing orders: the field posts are sorted on (newest/highest first,
+# ties broken by id) and how to parse its value back from a cursor
+SORT_ORDERS = {
+    'new': ('created_at', datetime.fromisoformat),
+    'hot': ('hot_score', float)
+}
+
+
+def serialize_post(doc):
+    """Return the listing representation of a raw post document"""
+    return {
+        "id": doc['_id'],
+        "title": doc.get('title'),
+        "content": doc.get('body'),
+        "created_at": doc['created_at'].isoformat()
+    }
+
+
+def wants_my_vote():
+    """Return whether the request asks for the user's vote on each post"""
+    return 'my_vote' in request.args.get('include', '').split(',')
+
+
+def requester_id():
+    """Return the id of the requesting user, None for anonymous requests
+    and requests with an invalid access token"""
+    try:
+        verify_jwt_in_request(optional=True)
+    except (JWTExtendedException, PyJWTError):
+        return None
+    return get_jwt_identity()
+
+
+def add_my_votes(posts):
+    """Add the current user's vote to each serialized post, looked up
+    with a single query. Anonymous requests and requests with an invalid
+    access token get a null vote."""
+    user_id = requester_id()
+    votes = Like.votes_of(
+        user_id, 'post_id', [post["id"] for post in posts]
+    ) if user_id else {}
+    for post in posts:
+        post["my_vote"] = votes.get(post["id"])
+
+
+def list_posts(queryset, sort='new'):
+    """Return one page of `queryset` in the `sort` order.
+
+    With a `cursor` query argument (empty for the first page) the page is
+    read by keyset pagination and the response carries `next_cursor`;
+    otherwise the classic `page`/`per_page` offset pagination is used.
+    """
+    per_page = request.args.get('per_page', 10, type=int)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    field, parse = SORT_ORDERS[sort]
+    queryset = replica(queryset.only(*POST_LIST_FIELDS, field).as_pymongo())
+
+    if 'cursor' in request.args:
+        try:
+            posts, next_cursor = keyset_page(
+                queryset, request.args.get('cursor'), per_page,
+                field=field, parse=parse
+            )
+        except InvalidCursor as e:
+            return {"error": str(e)}, 400
+        posts = [serialize_post(post) for post in posts]
+        if wants_my_vote():
+            add_my_votes(posts)
+        return {
+            "posts": posts,
+            "next_cursor": next_cursor,
+            "per_page": per_page
+        }, 200
+
+    page = max(1, request.args.get('page', 1, type=int))
+    total = queryset.count()
+    posts = [serialize_post(post) for post in queryset.order_by(
+        f'-{field}', '-id'
+    ).skip((page - 1) * per_page).limit(per_page)]
+    if wants_my_vote():
+        add_my_votes(posts)
+    return {
+        "posts": posts,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page,
+        "current_page": page,
+        "per_page": per_page
+    }, 200
+
+
+def feed_stream(community_id, position, limit):
+    """Return the newest `limit` posts of a community after `position`,
+    newest first, read through the community feed index"""
+    queryset = replica(Post.objects(community_id=community_id))
+    if position:
+        queryset = queryset.filter(after_cursor('created_at', *position))
+    return list(
+        queryset.only(*POST_LIST_FIELDS, 'community_id').as_pymongo()
+        .order_by('-created_at', '-id').limit(limit)
+    )
+
+
+def merge_feeds(community_ids, positions, limit):
+    """Merge the newest posts of several communities into one page.
+
+    Reads at most `limit` posts per community and merges the sorted
+    streams with a heap. Returns the page and the composite cursor of the
+    next page, which holds the position of every community.
+    """
+    streams = {
+        community_id: feed_stream(
+            community_id, positions.get(community_id), limit
+        )
+        for community_id in community_ids
+    }
+    return merge_streams(streams, positions, limit)
+
+
+def merge_streams(streams, positions, limit):
+    """Merge the posts read for each community (see `merge_feeds`)"""
+    community_ids = list(streams)
+
+    def sort_key(doc):
+        return doc['created_at'], doc['_id']
+
+    posts = list(islice(
+        heapq.merge(*streams.values(), key=sort_key, reverse=True), limit
+    ))
+
+    next_positions = {
+        community_id: positions[community_id]
+        for community_id in community_ids if community_id in positions
+    }
+    for doc in posts:
+        next_positions[doc['community_id']] = sort_key(doc)
+
+    # A community has more posts if some of its posts were not used, or
+    # if all of them were used but the read was cut off at `limit`
+    used = len(posts)
+    has_more = sum(len(s) for s in streams.values()) > used or any(
+        len(s) == limit for s in streams.values()
+    )
+    next_cursor = encode_positions(next_positions) if has_more else None
+    return posts, next_cursor
+
+
+# Class to fetch the merged feed of several communities
+class FeedResource(Resource):
+    @read_from_replicas
+    def get(self):
+        """
+        Fetch the newest posts of several communities as one feed
+        ---
+        tags:
+          - Posts
+        parameters:
+          - name: communities
+            in: query
+            type: string
+            required: true
+            description: Comma separated IDs of the communities
+            example: "community_id1,community_id2"
+          - name: limit
+            in: query
+            type: integer
+            description: Number of posts per page
+            default: 10
+          - name: cursor
+            in: query
+            type: string
+            description: The `next_cursor` of the previous page
+          - name: include
+            in: query
+            type: string
+            enum: ["my_vote"]
+            description: >
+              `my_vote` adds the current user's vote (1, -1 or null) to
+              each post, for requests with an access token
+        responses:
+          200:
+            description: The newest posts of the communities
+            schema:
+              type: object
+              properties:
+                posts:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: string
+                        example: "60c72b2f9f1b2c5b5d8b5d2e"
+                      title:
+                        type: string
+                        example: "A post title"
+                      content:
+                        type: string
+                        example: "Some content here"
+                      created_at:
+                        type: string
+                        example: "2024-10-15T10:00:00Z"
+                      community_id:
+                        type: string
+                        example: "60c72b2f9f1b2c5b5d8b5d2f"
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last
+                limit:
+                  type: integer
+                  example: 10
+          400:
+            description: Missing communities or invalid cursor
+        """
+        community_ids = list(dict.fromkeys(
+            c for c in request.args.get('communities', '').split(',') if c
+        ))
+        if not community_ids:
+            return {"error": "communities is required"}, 400
+        if len(community_ids) > MAX_FEED_COMMUNITIES:
+            return {
+                "error": f"at most {MAX_FEED_COMMUNITIES} communities"
+            }, 400
+
+        limit = request.args.get('limit', 10, type=int)
+        limit = max(1, min(limit, MAX_PER_PAGE))
+
+        try:
+            cursor = request.args.get('cursor')
+            positions = decode_positions(cursor) if cursor else {}
+        except InvalidCursor as e:
+            return {"error": str(e)}, 400
+
+        posts, next_cursor = merge_feeds(community_ids, positions, limit)
+        response = []
+        for doc in posts:
+            post = serialize_post(doc)
+            post["community_id"] = doc['community_id']
+            response.append(post)
+        if wants_my_vote():
+            add_my_votes(response)
+        return {
+            "posts": response,
+            "next_cursor": next_cursor,
+            "limit": limit
+        }, 200
+
+
 # Class to fetch all posts in a specific community by community ID
 class PostsByCommunityResource(Resource):
+    @read_from_replicas
     def get(self, community_id):
         """
         Fetch all posts in a community
@@ -94,6 +302,28 @@ class PostsByCommunityResource(Resource):
             type: integer
             description: Number of posts per page (for pagination)
             default: 10
+          - name: sort
+            in: query
+            type: string
+            enum: ["new", "hot"]
+            description: >
+              `new` lists the newest posts first, `hot` ranks posts by
+              votes decayed by age
+            default: new
+          - name: include
+            in: query
+            type: string
+            enum: ["my_vote"]
+            description: >
+              `my_vote` adds the current user's vote (1, -1 or null) to
+              each post, for requests with an access token
+          - name: cursor
+            in: query
+            type: string
+            description: >
+              Opaque cursor for keyset pagination. Pass it empty for the
+              first page, then the `next_cursor` of the previous response.
+              Replaces `page`, `total` and `pages` in the response.
         responses:
           200:
             description: A list of posts in the community
@@ -129,20 +359,51 @@ class PostsByCommunityResource(Resource):
                 per_page:
                   type: integer
                   example: 10
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page (cursor mode only)
+                  example: "WyIyMDI0LTEwLTE1VDEwOjAwOjAwIiwiYWJjIl0"
+          304:
+            description: >
+              Not modified, the `ETag` given in `If-None-Match` (or the
+              `Last-Modified` date given in `If-Modified-Since`) is current
         """
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        sort = request.args.get('sort', 'new')
+        if sort not in SORT_ORDERS:
+            return {"error": "sort must be one of: new, hot"}, 400
+
+        # The newest-first feed only changes when a post is created,
+        # edited or deleted, which bumps the community's feed version.
+        # The hot ranking and the user's votes change with every vote
+        # and are not validated. Neither are replica reads: the posts may
+        # come from a secondary lagging the one that served the version,
+        # and a stale body would then be revalidated with the new ETag.
+        validators = None
+        if (sort == 'new' and not wants_my_vote() and
+                not reads_from_replicas()):
+            community = Community.objects(id=community_id).only(
+                'feed_version', 'feed_updated_at'
+            ).as_pymongo().first()
+            if community:
+                validators = (
+                    make_etag(
+                        community_id, community.get('feed_version', 0),
+                        request.query_string.decode()
+                    ),
+                    community.get('feed_updated_at') or
+                    Community.start_feed(community_id)
+                )
+                cached = not_modified(*validators)
+                if cached:
+                    return cached
 
         # Fetch posts by community ID
-        posts = Post.objects(community_id=community_id).paginate(page=page, per_page=per_page)
-        return jsonify({
-            "posts": [{"id": str(post.id), "title": post.title, "content": post.content, "created_at": post.created_at}
-                      for post in posts.items],
-            "total": posts.total,
-            "pages": posts.pages,
-            "current_page": posts.page,
-            "per_page": posts.per_page
-        }), 200
+        body, status = list_posts(
+            Post.objects(community_id=community_id), sort
+        )
+        if validators and status == 200:
+            return body, status, validator_headers(*validators)
+        return body, status
 
 
 # Class to fetch a specific post by community ID and post ID
@@ -185,24 +446,32 @@ class PostByCommunityAndPostResource(Resource):
                 community_id:
                   type: string
                   example: "60c72b2f9f1b2c5b5d8b5d2f"
+          304:
+            description: Not modified, the cached copy is current
           404:
             description: Post not found
         """
         # Fetch the post by community and post ID
-        post = Post.objects(community_id=community_id, id=post_id).first()
+        post = Post.objects(
+            community_id=community_id, id=post_id
+        ).only(*POST_LIST_FIELDS, 'updated_at').as_pymongo().first()
         if post:
-            return jsonify({
-                "id": str(post.id),
-                "title": post.title,
-                "content": post.content,
-                "created_at": post.created_at,
-                "community_id": str(post.community_id)
-            }), 200
+            etag = make_etag(post_id, post.get('updated_at'))
+            cached = not_modified(etag, post.get('updated_at'))
+            if cached:
+                return cached
+
+            response = serialize_post(post)
+            response["community_id"] = community_id
+            return response, 200, validator_headers(
+                etag, post.get('updated_at')
+            )
         return {"error": "Post not found"}, 404
 
 
 # Class to fetch all posts by a specific user
 class PostsByUserResource(Resource):
+    @read_from_replicas
     def get(self, user_id):
         """
         Fetch all posts by a specific user
@@ -225,6 +494,20 @@ class PostsByUserResource(Resource):
             type: integer
             description: Number of posts per page (for pagination)
             default: 10
+          - name: include
+            in: query
+            type: string
+            enum: ["my_vote"]
+            description: >
+              `my_vote` adds the current user's vote (1, -1 or null) to
+              each post, for requests with an access token
+          - name: cursor
+            in: query
+            type: string
+            description: >
+              Opaque cursor for keyset pagination. Pass it empty for the
+              first page, then the `next_cursor` of the previous response.
+              Replaces `page`, `total` and `pages` in the response.
         responses:
           200:
             description: A list of posts by the user
@@ -260,23 +543,27 @@ class PostsByUserResource(Resource):
                 per_page:
                   type: integer
                   example: 10
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page (cursor mode only)
+                  example: "WyIyMDI0LTEwLTE1VDEwOjAwOjAwIiwiYWJjIl0"
         """
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        # Users listing their own posts must see the ones they just wrote
+        if requester_id() == user_id:
+            primary_reads()
 
         # Fetch posts by user ID
-        posts = Post.objects(user_id=user_id).paginate(page=page, per_page=per_page)
-        return jsonify({
-            "posts": [{"id": str(post.id), "title": post.title, "content": post.content, "created_at": post.created_at}
-                      for post in posts.items],
-            "total": posts.total,
-            "pages": posts.pages,
-            "current_page": posts.page,
-            "per_page": posts.per_page
-        }), 200
+        return list_posts(Post.objects(user_id=user_id))
 
 
 # Add URL rules for the resources (endpoints)
-api.add_resource(PostsByCommunityResource, '/api/v1/posts/community/<string:community_id>')
-api.add_resource(PostByCommunityAndPostResource, '/api/v1/posts/community/<string:community_id>/post/<string:post_id>')
+api.add_resource(
+    PostsByCommunityResource,
+    '/api/v1/posts/community/<string:community_id>'
+)
+api.add_resource(
+    PostByCommunityAndPostResource,
+    '/api/v1/posts/community/<string:community_id>/post/<string:post_id>'
+)
 api.add_resource(PostsByUserResource, '/api/v1/posts/user/<string:user_id>')
+api.add_resource(FeedResource, '/api/v1/posts/feed')
@@ -0,0 +1,53 @@
+from flask import Blueprint, current_app
+from flask_restful import Resource
+from pymongo.errors import PyMongoError
+from models.engines.db_storage import storage
+
+health_blueprint = Blueprint('health', __name__)
+
+
+# Class to report that the process is up (liveness)
+class HealthResource(Resource):
+    """Answers as long as the worker can serve requests."""
+
+    def get(self):
+        """Liveness check.
+        ---
+        tags:
+          - Health
+        responses:
+          200:
+            description: The worker is up
+        """
+        return {"status": "ok"}, 200
+
+
+# Class to report whether the process can serve traffic (readiness)
+class ReadinessResource(Resource):
+    """Answers 200 only when the database is reachable."""
+
+    def get(self):
+        """Readiness check, pings the database.
+        ---
+        tags:
+          - Health
+        responses:
+          200:
+            description: The database answers
+          503:
+            description: The database cannot be reached
+        """
+        try:
+            storage.ping()
+        except PyMongoError as e:
+            current_app.logger.warning("Database ping failed: %s", e)
+            return {"status": "unavailable"}, 503
+        return {"status": "ok"}, 200
+
+
+health_blueprint.add_url_rule(
+    '/api/v1/health', view_func=HealthResource.as_view('health')
+)
+health_blueprint.add_url_rule(
+    '/api/v1/ready', view_func=ReadinessResource.as_view('ready')
+)
@@ -1,17 +1,109 @@
-from flask import Blueprint, request
+import json
+from datetime import datetime
+from flask import Blueprint, Response, request, stream_with_context
 from flask_restful import Resource
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from decorators.owner_user import owner_required
-from models.like_model import Like
+from models.like_model import Like, TARGET_FIELDS
 from decorators.super_user import superuser_required
+from utils.vote_buffer import get_vote_buffer, settle_votes
+from utils.query_stats import query_budget
 
 like_blueprint = Blueprint('like', __name__)
 
+NDJSON = 'application/x-ndjson'
+VOTE_MODES = ('create', 'set', 'toggle')
+MAX_VOTE_LOOKUP = 200
+STREAM_BATCH_SIZE = 1000
+LIKE_EXPORT_FIELDS = ('id', 'created_at', 'value') + TARGET_FIELDS + (
+    'user_id',
+)
+
+
+def is_vote_value(value):
+    """Return whether a value from a request body is a vote"""
+    return not isinstance(value, bool) and value in (1, -1)
+
+
+def like_export_filters():
+    """Build the like filters of an export request from its query string.
+    Raises ValueError on an invalid filter."""
+    filters = {}
+    if request.args.get('since'):
+        filters['created_at__gte'] = datetime.fromisoformat(
+            request.args['since']
+        )
+    if request.args.get('until'):
+        filters['created_at__lt'] = datetime.fromisoformat(
+            request.args['until']
+        )
+    target_type = request.args.get('target_type')
+    if target_type:
+        if f'{target_type}_id' not in TARGET_FIELDS:
+            raise ValueError(
+                "target_type must be one of: post, comment, therapist"
+            )
+        filters[f'{target_type}_id__exists'] = True
+    if request.args.get('after'):
+        filters['id__gt'] = request.args['after']
+    return filters
+
+
+def serialize_raw_like(doc):
+    """Return the export representation of a raw like document"""
+    line = {"id": doc['_id'], "user_id": doc.get('user_id')}
+    for field in TARGET_FIELDS:
+        line[field] = doc.get(field)
+    line["value"] = doc.get('value')
+    line["created_at"] = doc['created_at'].isoformat()
+    return line
+
+
+def serialize_target_like(doc):
+    """Return the representation of a raw like in the likes of a target"""
+    return {"user_id": doc.get('user_id'), "value": doc.get('value')}
+
+
+def serialize_user_like(doc):
+    """Return the representation of a raw like in the likes of a user"""
+    line = {field: doc.get(field) for field in TARGET_FIELDS}
+    line["value"] = doc.get('value')
+    return line
+
+
+def target_likes(field, target_id):
+    """Return the likes of a target, read raw through the index on
+    `field` without dereferencing their users"""
+    likes = Like.objects(**{field: target_id}).only('user_id', 'value')
+    return [serialize_target_like(doc) for doc in likes.as_pymongo()]
+
+
+def stream_likes(filters):
+    """Yield the matching likes as NDJSON, one batch of lines at a time.
+
+    Likes are read in id order through an uncached, batched cursor, so
+    memory use does not grow with the size of the export and an export
+    can resume after the id of the last line received (`after`).
+    """
+    likes = Like.objects(**filters).only(*LIKE_EXPORT_FIELDS).order_by(
+        'id'
+    ).as_pymongo().no_cache().batch_size(STREAM_BATCH_SIZE)
+
+    lines = []
+    for doc in likes:
+        lines.append(json.dumps(serialize_raw_like(doc)))
+        if len(lines) == STREAM_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
 
 # Class to add a like
 class LikeCreateResource(Resource):
     """Handles creating a new like."""
 
+    @jwt_required()
     def post(self):
         """Create a new like.
         ---
@@ -38,9 +130,33 @@ class LikeCreateResource(Resource):
                   type: integer
                   enum: [1, -1]
                   example: 1
+                mode:
+                  type: string
+                  enum: ["create", "set", "toggle"]
+                  default: "create"
+                  description: >
+                    `create` fails if the user already voted on the target,
+                    `set` creates or changes the vote, `toggle` removes
+                    the vote if it has the same value and sets it otherwise
         responses:
+          200:
+            description: Vote changed or removed (set and toggle modes)
+            schema:
+              type: object
+              properties:
+                message:
+                  type: string
+                  example: "Like updated successfully"
+                value:
+                  type: integer
+                  description: The vote now recorded, null if removed
+                  example: -1
           201:
             description: Like created successfully
+          202:
+            description: >
+              Vote buffered for a bulk write (set mode with write-behind
+              enabled)
             schema:
               type: object
               properties:
@@ -56,53 +172,117 @@ class LikeCreateResource(Resource):
                   type: string
                   example: "Invalid input"
         """
-        data = request.get_json()
-        user_id = request.user.id  # Get the logged-in user ID
-
-        # Check if at least one ID is provided
-        if not (
-            data.get('post_id') or
-            data.get('comment_id') or
-            data.get('therapist_id')
-        ):
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {"error": "Invalid input"}, 400
+        user_id = get_jwt_identity()  # Get the logged-in user ID
+
+        # Check that exactly one target ID is provided
+        targets = [field for field in TARGET_FIELDS if data.get(field)]
+        if not targets:
             return {
                 "error": "post_id, comment_id, or therapist_id is required"
             }, 400
-
-        # Check if the user has already liked the post/comment/therapist
-        existing_like = Like.objects(
-            user_id=user_id,
-            post_id=data.get('post_id'),
-            comment_id=data.get('comment_id'),
-            therapist_id=data.get('therapist_id')
-        ).first()
-
-        if existing_like:
+        if len(targets) > 1:
             return {
-                "error": "like a post, comment, or therapist only once."
+                "error": "only one of post_id, comment_id, or therapist_id"
             }, 400
-
-        like = Like(
-            user_id=user_id,
-            post_id=data.get('post_id'),
-            comment_id=data.get('comment_id'),
-            therapist_id=data.get('therapist_id'),
-            value=data.get('value')
-        )
-        like.save()
-        return {"message": "Like created successfully"}, 201
+        field = targets[0]
+        target_id = data[field]
+        # The id goes into raw queries, where an object would be an operator
+        if not isinstance(target_id, str):
+            return {"error": f"{field} must be a string"}, 400
+
+        value = data.get('value')
+        if not is_vote_value(value):
+            return {"error": "value must be 1 or -1"}, 400
+
+        mode = data.get('mode', 'create')
+        if not isinstance(mode, str) or mode not in VOTE_MODES:
+            return {"error": "mode must be one of: create, set, toggle"}, 400
+
+        # With write-behind on, a vote that sets a value is acknowledged
+        # once buffered and written in bulk shortly after. Other votes are
+        # written now, after the buffered vote of the same target, which
+        # would otherwise overwrite them when flushed.
+        buffer = get_vote_buffer()
+        if mode == 'set' and buffer and buffer.submit(
+            user_id, field, target_id, value
+        ):
+            return {"message": "Vote accepted", "value": value}, 202
+        if buffer:
+            buffer.settle(user_id, field, target_id)
+
+        # Each write is a single upsert on the unique (user, target) index
+        if mode == 'create':
+            if not Like.insert_vote(user_id, field, target_id, value):
+                return {
+                    "error": "like a post, comment, or therapist only once."
+                }, 400
+            Like.apply_vote_delta(field, target_id, value)
+            return {"message": "Like created successfully"}, 201
+
+        if mode == 'toggle':
+            # Voting the same value again takes the vote back
+            removed = Like.remove_vote(
+                {'user_id': user_id, field: target_id, 'value': value}
+            )
+            if removed:
+                Like.apply_vote_delta(field, target_id, -value)
+                return {
+                    "message": "Like removed successfully", "value": None
+                }, 200
+
+        previous = Like.set_vote(user_id, field, target_id, value)
+        Like.apply_vote_delta(field, target_id, value - (previous or 0))
+        if previous is None:
+            return {
+                "message": "Like created successfully", "value": value
+            }, 201
+        return {"message": "Like updated successfully", "value": value}, 200
 
 
 # Class to fetch all likes (superuser required)
 class LikeListResource(Resource):
     """Handles fetching all likes (restricted to superusers)."""
 
+    @query_budget(2)
     @superuser_required
     def get(self):
         """Fetch all likes.
+        Send `Accept: application/x-ndjson` or `stream=1` to stream the
+        likes as newline-delimited JSON instead of one array.
         ---
         tags:
           - Likes
+        produces:
+          - application/json
+          - application/x-ndjson
+        parameters:
+          - in: query
+            name: stream
+            type: integer
+            enum: [0, 1]
+            description: Stream the likes as NDJSON, ordered by id
+          - in: query
+            name: after
+            type: string
+            description: Resume a stream after this like id
+          - in: query
+            name: since
+            type: string
+            format: date-time
+            description: Only likes created at or after this time
+          - in: query
+            name: until
+            type: string
+            format: date-time
+            description: Only likes created before this time
+          - in: query
+            name: target_type
+            type: string
+            enum: ["post", "comment", "therapist"]
+            description: Only likes of this type of target
         responses:
           200:
             description: List of all likes
@@ -111,6 +291,9 @@ class LikeListResource(Resource):
               items:
                 type: object
                 properties:
+                  id:
+                    type: string
+                    example: "fedcba"
                   user_id:
                     type: string
                     example: "123456"
@@ -126,20 +309,90 @@ class LikeListResource(Resource):
                   value:
                     type: integer
                     example: 1
+                  created_at:
+                    type: string
+                    format: date-time
+                    example: "2024-10-15T10:00:00"
+          400:
+            description: Invalid filter
         """
-        likes = Like.objects()
-        return [{"user_id": str(like.user_id),
-                 "post_id": str(like.post_id),
-                 "comment_id": str(like.comment_id),
-                 "therapist_id": str(like.therapist_id),
-                 "value": like.value} for like in likes
-                ], 200
+        try:
+            filters = like_export_filters()
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        accept = request.accept_mimetypes
+        best = accept.best_match(['application/json', NDJSON])
+        if request.args.get('stream') == '1' or best == NDJSON:
+            return Response(
+                stream_with_context(stream_likes(filters)), mimetype=NDJSON
+            )
+
+        # Read raw, without dereferencing the user and target of each like
+        likes = Like.objects(**filters).only(*LIKE_EXPORT_FIELDS)
+        return [serialize_raw_like(doc) for doc in likes.as_pymongo()], 200
+
+
+# Class to inspect the write-behind vote buffer (superuser required)
+class VoteBufferResource(Resource):
+    """Handles reporting the state of the vote buffer."""
+
+    @superuser_required
+    def get(self):
+        """Get the depth and flush statistics of the vote buffer.
+        ---
+        tags:
+          - Likes
+        responses:
+          200:
+            description: Vote buffer metrics of the serving process
+            schema:
+              type: object
+              properties:
+                enabled:
+                  type: boolean
+                  example: true
+                depth:
+                  type: integer
+                  example: 120
+                flushes:
+                  type: integer
+                  example: 42
+                failed_flushes:
+                  type: integer
+                  example: 0
+                failed_counter_writes:
+                  type: integer
+                  example: 0
+                pending_counters:
+                  type: integer
+                  description: >
+                    Counters of written likes still to be updated
+                  example: 0
+                flushed_votes:
+                  type: integer
+                  example: 5310
+                last_flush_seconds:
+                  type: number
+                  example: 0.012
+                max_flush_seconds:
+                  type: number
+                  example: 0.087
+                total_flush_seconds:
+                  type: number
+                  example: 0.91
+        """
+        buffer = get_vote_buffer()
+        if not buffer:
+            return {"enabled": False}, 200
+        return dict(buffer.metrics(), enabled=True), 200
 
 
 # Class to fetch likes by user ID
 class LikeByUserResource(Resource):
     """Handles fetching likes for a specific user."""
 
+    @query_budget(2)
     @owner_required
     def get(self, user_id):
         """Fetch all likes by a specific user.
@@ -173,12 +426,64 @@ class LikeByUserResource(Resource):
                     type: integer
                     example: 1
         """
-        likes = Like.objects(user_id=user_id)
-        return [{"post_id": str(like.post_id),
-                 "comment_id": str(like.comment_id),
-                 "therapist_id": str(like.therapist_id),
-                 "value": like.value} for like in likes
-                ], 200
+        likes = Like.objects(user_id=user_id).only(*TARGET_FIELDS, 'value')
+        return [serialize_user_like(doc) for doc in likes.as_pymongo()], 200
+
+
+# Class to fetch the current user's votes on a set of targets
+class MyVotesResource(Resource):
+    """Handles fetching the current user's votes on given targets."""
+
+    @jwt_required()
+    def get(self):
+        """Fetch the current user's vote on each of the given targets.
+        ---
+        tags:
+          - Likes
+        parameters:
+          - in: query
+            name: post_ids
+            type: string
+            description: Comma separated post IDs
+            example: "post_id1,post_id2"
+          - in: query
+            name: comment_ids
+            type: string
+            description: Comma separated comment IDs
+          - in: query
+            name: therapist_ids
+            type: string
+            description: Comma separated therapist IDs
+        responses:
+          200:
+            description: >
+              The vote on each requested target by type, null where the
+              user has not voted
+            schema:
+              type: object
+              properties:
+                post_id:
+                  type: object
+                  additionalProperties:
+                    type: integer
+                  example: {"post_id1": 1, "post_id2": null}
+          400:
+            description: Too many IDs
+        """
+        user_id = get_jwt_identity()
+        response = {}
+        for field in TARGET_FIELDS:
+            ids = request.args.get(f'{field}s', '')
+            target_ids = list(dict.fromkeys(i for i in ids.split(',') if i))
+            if not target_ids:
+                continue
+            if len(target_ids) > MAX_VOTE_LOOKUP:
+                return {
+                    "error": f"at most {MAX_VOTE_LOOKUP} {field}s"
+                }, 400
+            votes = Like.votes_of(user_id, field, target_ids)
+            response[field] = {i: votes.get(i) for i in target_ids}
+        return response, 200
 
 
 # Class to fetch likes for a specific post
@@ -211,10 +516,7 @@ class LikeByPostResource(Resource):
                     type: integer
                     example: 1
         """
-        likes = Like.objects(post_id=post_id)
-        return [{"user_id": str(like.user_id),
-                 "value": like.value} for like in likes
-                ], 200
+        return target_likes('post_id', post_id), 200
 
 
 # Class to fetch likes for a specific comment
@@ -247,10 +549,7 @@ class LikeByCommentResource(Resource):
                     type: integer
                     example: 1
         """
-        likes = Like.objects(comment_id=comment_id)
-        return [{"user_id": str(like.user_id),
-                 "value": like.value} for like in likes
-                ], 200
+        return target_likes('comment_id', comment_id), 200
 
 
 # Class to fetch likes for a specific therapist
@@ -283,17 +582,14 @@ class LikeByTherapistResource(Resource):
                     type: integer
                     example: 1
         """
-        likes = Like.objects(therapist_id=therapist_id)
-        return [{"user_id": str(like.user_id),
-                 "value": like.value} for like in likes
-                ], 200
+        return target_likes('therapist_id', therapist_id), 200
 
 
 # Class to update a like by ID
 class LikeUpdateResource(Resource):
     """Handles updating an existing like."""
 
-    @owner_required
+    @jwt_required()
     def put(self, like_id):
         """Update an existing like.
         ---
@@ -334,14 +630,23 @@ class LikeUpdateResource(Resource):
                   type: string
                   example: "Like not found"
         """
-        data = request.get_json()
-        like = Like.objects(id=like_id).first()
-        if not like:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {"error": "Invalid input"}, 400
+        value = data.get('value')
+        if not is_vote_value(value):
+            return {"error": "value must be 1 or -1"}, 400
+
+        # Update the value, after the user's buffered votes are written
+        user_id = get_jwt_identity()
+        settle_votes(user_id)
+        before = Like.change_vote({'_id': like_id, 'user_id': user_id}, value)
+        if not before:
             return {"error": "Like not found"}, 404
 
-        # Update the value
-        like.value = data.get('value', like.value)
-        like.save()
+        Like.apply_vote_delta(
+            *Like.raw_target(before), value - before['value']
+        )
         return {"message": "Like updated successfully"}, 200
 
 
@@ -349,7 +654,7 @@ class LikeUpdateResource(Resource):
 class LikeDeleteResource(Resource):
     """Handles deleting a like."""
 
-    @owner_required
+    @jwt_required()
     def delete(self, like_id):
         """Delete a like.
         ---
@@ -379,11 +684,14 @@ class LikeDeleteResource(Resource):
                   type: string
                   example: "Like not found"
         """
-        like = Like.objects(id=like_id).first()
+        # The like may have a vote still buffered, which would bring it back
+        user_id = get_jwt_identity()
+        settle_votes(user_id)
+        like = Like.remove_vote({'_id': like_id, 'user_id': user_id})
         if not like:
             return {"error": "Like not found"}, 404
 
-        like.delete()
+        Like.apply_vote_delta(*Like.raw_target(like), -like['value'])
         return {"message": "Like deleted successfully"}, 200
 
 
@@ -399,6 +707,14 @@ like_blueprint.add_url_rule(
     '/api/v1/like/user-like/<string:user_id>',
     view_func=LikeByUserResource.as_view('like_by_user')
 )
+like_blueprint.add_url_rule(
+    '/api/v1/like/vote-buffer',
+    view_func=VoteBufferResource.as_view('vote_buffer')
+)
+like_blueprint.add_url_rule(
+    '/api/v1/like/my-votes',
+    view_func=MyVotesResource.as_view('my_votes')
+)
 like_blueprint.add_url_rule(
     '/api/v1/like/post-like/<string:post_id>',
     view_func=LikeByPostResource.as_view('like_by_post')
@@ -0,0 +1,34 @@
+from flask import Blueprint, Response
+from flask_restful import Resource
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from utils.metrics import registry
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+# Class to expose the Prometheus metrics
+class MetricsResource(Resource):
+    """Serves the metrics of every worker process."""
+
+    def get(self):
+        """Prometheus metrics, in the text exposition format.
+        ---
+        tags:
+          - Health
+        produces:
+          - text/plain
+        responses:
+          200:
+            description: >
+              Request counts, latency histograms and requests in flight by
+              endpoint, MongoDB commands per request and connection pool
+              metrics
+        """
+        return Response(
+            generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST
+        )
+
+
+metrics_blueprint.add_url_rule(
+    '/metrics', view_func=MetricsResource.as_view('metrics')
+)
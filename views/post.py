@@ -57,6 +57,7 @@ class PostResource(Resource):
                 community_id=data['community_id']
             )
             post.save()  # Save the post to the database
+            Community.bump_feed(data['community_id'])
             return {'message': 'Post created successfully!'}, 201
 
         return {'message': 'Missing required fields.'}, 400
@@ -109,6 +110,7 @@ class PostResource(Resource):
             if 'body' in data:
                 post.body = data['body']
             post.save()
+            Community.bump_feed(post.to_mongo()['community_id'])
             return {'message': 'Post updated successfully!'}, 200
 
         return {'message': 'Post not found.'}, 404
@@ -141,7 +143,7 @@ class PostResource(Resource):
         post = Post.objects(id=post_id, user_id=user_id).first()
 
         if post:
-            post.delete()
+            post.delete()  # Bumps the community feed
             return {'message': 'Post deleted successfully!'}, 200
 
         return {'message': 'Post not found.'}, 404
@@ -1,16 +1,89 @@
 from flask import Blueprint, request
 from flask_restful import Resource
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models.user_model import User
 from models.therapist_model import Therapist
 from decorators.super_user import superuser_required
+from utils.auth_context import current_user
+from utils.conditional import make_etag, not_modified, validator_headers
+from utils.dataloader import get_loader
+from utils.pagination import InvalidCursor, keyset_page, next_link
+from utils.read_routing import read_from_replicas, replica
+from utils.query_stats import query_budget
 
 therapist_blueprint = Blueprint('therapist', __name__)
 
+MAX_PER_PAGE = 100
+DIRECTORY_FIELDS = (
+    'id', 'first_name', 'last_name', 'specialty', 'fees', 'availability',
+    'created_at', 'created_by', 'updated_by'
+)
+PROFILE_FIELDS = (
+    'id', 'first_name', 'last_name', 'specialty', 'fees', 'rmdc_ref_no',
+    'qualification', 'availability', 'created_by', 'updated_by',
+    'updated_at'
+)
+
+
+def user_refs(therapist):
+    """Return the ids of the users the raw `therapist` refers to"""
+    return [therapist.get('created_by'), therapist.get('updated_by')]
+
+
+def serialize_profile(therapist, loader):
+    """Return the profile of a raw therapist document, with its user
+    references resolved through `loader`"""
+    return {
+        "first_name": therapist['first_name'],
+        "last_name": therapist['last_name'],
+        "specialty": therapist.get('specialty'),
+        "fees": therapist.get('fees'),
+        "rmdc_ref_no": therapist.get('rmdc_ref_no'),
+        "qualification": therapist.get('qualification'),
+        "availability": therapist.get('availability', []),
+        "created_by": loader.ref_id(User, therapist.get('created_by')),
+        "updated_by": loader.ref_id(User, therapist.get('updated_by'))
+    }
+
+
+def serialize_entry(therapist, loader):
+    """Return the directory entry of a raw therapist document"""
+    return {
+        "id": therapist['_id'],
+        "first_name": therapist['first_name'],
+        "last_name": therapist['last_name'],
+        "specialty": therapist.get('specialty'),
+        "fees": therapist.get('fees'),
+        "availability": therapist.get('availability', []),
+        "created_by": loader.ref_id(User, therapist.get('created_by')),
+        "updated_by": loader.ref_id(User, therapist.get('updated_by'))
+    }
+
+
+def directory_filters(args):
+    """Return the query selecting the therapists matching the directory
+    filters in `args`, or raise ValueError for an invalid filter.
+
+    Every filter combination is served by one of the
+    (acceptance_status, ..., -created_at, -id) indexes.
+    """
+    filters = {'acceptance_status': args.get('acceptance_status', 'accepted')}
+    if filters['acceptance_status'] not in \
+            Therapist.acceptance_status.choices:
+        raise ValueError("Invalid acceptance_status")
+    if args.get('specialty'):
+        filters['specialty'] = args['specialty']
+    if args.get('availability'):
+        if args['availability'] not in Therapist.availability.field.choices:
+            raise ValueError("Invalid availability")
+        filters['availability'] = args['availability']
+    return filters
+
 
 class CreateTherapistResource(Resource):
     """Handles creating a new therapist profile."""
 
+    @jwt_required()
     def post(self):
         """Create a therapist profile.
         ---
@@ -58,14 +131,13 @@ class CreateTherapistResource(Resource):
                   example: "Therapist profile created successfully"
         """
         data = request.get_json()
-        current_user_id = get_jwt_identity()
-        current_user = User.objects(id=current_user_id).first()
+        user = current_user()
 
-        if not current_user:
+        if not user:
             return {"error": "User not found"}, 404
 
         therapist = Therapist(
-            user_id=current_user,
+            user_id=user,
             first_name=data['first_name'],
             last_name=data['last_name'],
             specialty=data.get('specialty'),
@@ -73,8 +145,8 @@ class CreateTherapistResource(Resource):
             rmdc_ref_no=data.get('rmdc_ref_no'),
             qualification=data.get('qualification'),
             availability=data.get('availability'),
-            created_by=current_user,
-            updated_by=current_user
+            created_by=user,
+            updated_by=user
         )
         therapist.save()
         return {"message": "Therapist profile created successfully"}, 201
@@ -123,58 +195,138 @@ class ReadTherapistResource(Resource):
                   items:
                     type: string
                     example: "available"
+          304:
+            description: Not modified, the cached copy is current
         """
-        therapist = Therapist.objects(id=therapist_id).first()
+        therapist = Therapist.objects(id=therapist_id).only(
+            *PROFILE_FIELDS
+        ).as_pymongo().first()
         if not therapist:
             return {"error": "Therapist not found"}, 404
 
-        return {
-            "first_name": therapist.first_name,
-            "last_name": therapist.last_name,
-            "specialty": therapist.specialty,
-            "fees": therapist.fees,
-            "rmdc_ref_no": therapist.rmdc_ref_no,
-            "qualification": therapist.qualification,
-            "availability": therapist.availability,
-            "created_by": str(therapist.created_by.id),
-            "updated_by": str(therapist.updated_by.id)
-        }, 200
+        updated_at = therapist['updated_at']
+        etag = make_etag(therapist['_id'], updated_at)
+        cached = not_modified(etag, updated_at)
+        if cached:
+            return cached
+
+        # Resolve the creator and last editor in one query, without
+        # failing on references to deleted users
+        loader = get_loader()
+        loader.prime(User, user_refs(therapist))
+        response = serialize_profile(therapist, loader)
+
+        return response, 200, validator_headers(etag, updated_at)
 
 
 class ListTherapistsResource(Resource):
-    """Handles listing all therapists."""
+    """Handles listing the therapist directory."""
 
+    @query_budget(2)
+    @read_from_replicas
     def get(self):
-        """Get a list of all therapists.
+        """Get one page of the therapist directory, newest first.
         ---
         tags:
           - Therapists
+        parameters:
+          - in: query
+            name: specialty
+            type: string
+            description: Only list therapists with this specialty
+          - in: query
+            name: acceptance_status
+            type: string
+            enum: [accepted, suspended, pending]
+            default: accepted
+            description: Only list therapists with this status
+          - in: query
+            name: availability
+            type: string
+            enum: [available, not available]
+            description: Only list therapists with this availability
+          - in: query
+            name: cursor
+            type: string
+            description: >
+              The next_cursor of the previous page, empty for the first
+              page. Without it the first page is returned as an array,
+              with a `Link` header to the next page.
+          - in: query
+            name: per_page
+            type: integer
+            default: 10
         responses:
           200:
-            description: A list of therapists
+            description: >
+              A page of therapists. Without a `cursor` argument, the
+              `therapists` array alone.
             schema:
-              type: array
-              items:
-                type: object
-                properties:
-                  first_name:
-                    type: string
-                    example: "John"
-                  last_name:
-                    type: string
-                    example: "Doe"
+              type: object
+              properties:
+                therapists:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      id:
+                        type: string
+                      first_name:
+                        type: string
+                        example: "John"
+                      last_name:
+                        type: string
+                        example: "Doe"
+                      specialty:
+                        type: string
+                        example: "Psychology"
+                      availability:
+                        type: array
+                        items:
+                          type: string
+                          example: "available"
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last
+                per_page:
+                  type: integer
+          400:
+            description: Invalid filter or cursor
         """
-        therapists = Therapist.objects()
-        return [
-            {
-                "first_name": t.first_name,
-                "last_name": t.last_name,
-                "specialty": t.specialty,
-                "fees": t.fees,
-                "created_by": str(t.created_by.id),
-                "updated_by": str(t.updated_by.id)
-            } for t in therapists
-        ], 200
+        per_page = request.args.get('per_page', 10, type=int)
+        per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+        try:
+            filters = directory_filters(request.args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        queryset = replica(Therapist.objects(**filters).only(
+            *DIRECTORY_FIELDS
+        ).as_pymongo())
+        try:
+            therapists, next_cursor = keyset_page(
+                queryset, request.args.get('cursor'), per_page
+            )
+        except InvalidCursor as e:
+            return {"error": str(e)}, 400
+
+        loader = get_loader()
+        for t in therapists:
+            loader.prime(User, user_refs(t))
+
+        entries = [serialize_entry(t, loader) for t in therapists]
+        if 'cursor' not in request.args:
+            # Clients of the original endpoint get a bare array, with the
+            # next page in a `Link` header
+            headers = {'Link': next_link(request.url, next_cursor)} \
+                if next_cursor else {}
+            return entries, 200, headers
+        return {
+            "therapists": entries,
+            "next_cursor": next_cursor,
+            "per_page": per_page
+        }, 200
 
 
 class DeleteTherapistResource(Resource):
@@ -269,7 +421,7 @@ class UpdateAcceptanceStatus(Resource):
             return {"error": "Therapist not found"}, 404
 
         therapist.acceptance_status = acceptance_status
-        therapist.updated_by = User.objects(id=get_jwt_identity()).first()
+        therapist.updated_by = current_user()
         therapist.save()
 
         return {"message": "Acceptance status updated successfully"}, 200
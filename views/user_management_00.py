@@ -3,6 +3,7 @@ from flask_restful import Resource
 from decorators.super_user import superuser_required
 from models.user_model import User
 from flask_jwt_extended import jwt_required
+from utils.conditional import make_etag, not_modified, validator_headers
 
 user_blueprint = Blueprint('user', __name__)
 
@@ -75,6 +76,8 @@ class SingleUserListResource(Resource):
                 email:
                   type: string
                   example: "john@example.com"
+          304:
+            description: Not modified, the cached copy is current
           404:
             description: User not found
             schema:
@@ -86,12 +89,17 @@ class SingleUserListResource(Resource):
         """
         user = User.objects(id=user_id).first()
         if user:
+            etag = make_etag(user.id, user.updated_at)
+            cached = not_modified(etag, user.updated_at)
+            if cached:
+                return cached
+
             return {
                 'user_id': user.id,
                 'username': user.username,
                 'email': user.email,
                 'role': user.role
-                }, 200
+                }, 200, validator_headers(etag, user.updated_at)
         return {'message': 'User not found'}, 404
 
 
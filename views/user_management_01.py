@@ -1,9 +1,9 @@
 from flask import Blueprint, request
 from flask_restful import Resource
 from decorators.owner_user import owner_required
-from models.user_model import User
-from werkzeug.security import generate_password_hash
 from flask_jwt_extended import jwt_required
+from utils.auth_context import current_user, invalidate_auth
+from utils.passwords import HashingBusy, hash_password
 
 user_blueprint2 = Blueprint('user02', __name__)
 
@@ -60,7 +60,7 @@ class UserUpdateResource(Resource):
         """
         data = request.get_json()
 
-        user = User.objects(id=user_id).first()
+        user = current_user()
         if not user:
             return {"error": "User not found"}, 404
 
@@ -71,9 +71,14 @@ class UserUpdateResource(Resource):
         # Update password if provided
         new_password = data.get('password')
         if new_password:
-            user.password_hash = generate_password_hash(new_password)
+            try:
+                user.password_hash = hash_password(new_password)
+            except HashingBusy:
+                return {"error": "Too many requests, try again later"}, \
+                    503, {'Retry-After': '1'}
 
         user.save()
+        invalidate_auth(user.id)
         return {"message": f"User {user.username} updated successfully"}, 200
 
 
@@ -111,11 +116,12 @@ class UserDeleteResource(Resource):
                   type: string
                   example: "User not found"
         """
-        user = User.objects(id=user_id).first()
+        user = current_user()
         if not user:
             return {"error": "User not found"}, 404
 
         user.delete()
+        invalidate_auth(user.id)
         return {"message": f"User {user.username} deleted successfully"}, 200
 
 
@@ -0,0 +1,466 @@
+"""
+Contains the optional asynchronous read-only API.
+
+It serves the public GET routes of the post, community, therapist and
+like endpoints with the same paths, parameters and response bodies as
+web_flask/app.py, but reads through the motor driver, so a worker keeps
+serving other requests while it waits on MongoDB. It reuses the field
+lists, serializers and pagination helpers of the Flask views. Writes
+and authenticated routes stay on the Flask app; a reverse proxy sends
+these GET paths here.
+
+    uvicorn web_asgi.app:app --workers 4
+"""
+
+import asyncio
+import contextlib
+from datetime import datetime
+from os import getenv
+import jwt
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from werkzeug.http import parse_date, parse_etags
+from models.community_model import Community, start_feed_update
+from models.like_model import Like
+from models.post_model import Post
+from models.therapist_model import Therapist
+from models.user_model import User
+from utils.conditional import _to_utc, make_etag, validator_headers
+from utils.pagination import (
+    InvalidCursor, decode_key_cursor, decode_positions, encode_cursor,
+    next_link
+)
+from views.community_management_00 import serialize_community, user_refs
+from views.fetch_post import (
+    MAX_FEED_COMMUNITIES, MAX_PER_PAGE, POST_LIST_FIELDS, SORT_ORDERS,
+    merge_streams, serialize_post
+)
+from views.like_management import serialize_target_like
+from views.therapist_management00 import (
+    DIRECTORY_FIELDS, PROFILE_FIELDS, directory_filters, serialize_entry,
+    serialize_profile
+)
+from views.therapist_management00 import user_refs as therapist_refs
+from web_asgi.storage import AsyncDBStorage, AsyncRefLoader, projection
+
+load_dotenv()
+
+JWT_SECRET_KEY = getenv('JWT_SECRET_KEY')
+
+
+# Request helpers
+
+def int_arg(request, name, default):
+    """Return an integer query argument, `default` if missing or invalid"""
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def error(message, status=400):
+    """Return the error response of the Flask views"""
+    return JSONResponse({"error": message}, status)
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 response if the client's cached copy is current,
+    otherwise None (see utils/conditional.py)"""
+    if_none_match = request.headers.get('if-none-match')
+    if_modified_since = parse_date(request.headers.get('if-modified-since'))
+    if if_none_match:
+        fresh = parse_etags(if_none_match).contains(etag)
+    elif last_modified and if_modified_since:
+        fresh = _to_utc(last_modified) <= if_modified_since
+    else:
+        fresh = False
+    if fresh:
+        return Response(
+            status_code=304, headers=validator_headers(etag, last_modified)
+        )
+    return None
+
+
+def token_identity(request):
+    """Return the user id of the request's access token, None without
+    one. Raises jwt.InvalidTokenError for an invalid token."""
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme != 'Bearer' or not token:
+        return None
+    claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+    if claims.get('type') != 'access':
+        raise jwt.InvalidTokenError("Only access tokens are allowed")
+    return claims['sub']
+
+
+def wants_my_vote(request):
+    """Return whether the request asks for the user's vote on each post"""
+    return 'my_vote' in request.query_params.get('include', '').split(',')
+
+
+async def add_my_votes(request, posts):
+    """Add the current user's vote to each serialized post, looked up
+    with a single query. Anonymous requests get a null vote."""
+    user_id = token_identity(request)
+    votes = {}
+    if user_id and posts:
+        cursor = request.app.state.storage.collection(Like).find(
+            {'user_id': user_id,
+             'post_id': {'$in': [post["id"] for post in posts]}},
+            projection={'post_id': True, 'value': True, '_id': False}
+        )
+        votes = {doc['post_id']: doc['value'] async for doc in cursor}
+    for post in posts:
+        post["my_vote"] = votes.get(post["id"])
+
+
+# Queries
+
+def after_cursor(field, value, doc_id):
+    """Return the raw filter selecting documents that sort after a
+    cursor in descending (-field, -id) order"""
+    return {'$or': [
+        {field: {'$lt': value}},
+        {field: value, '_id': {'$lt': doc_id}}
+    ]}
+
+
+async def keyset_page(collection, query, fields, cursor, limit,
+                      field='created_at', parse=datetime.fromisoformat):
+    """Fetch one page of raw documents after `cursor`, like
+    utils.pagination.keyset_page"""
+    if cursor:
+        position = decode_key_cursor(cursor, parse)
+        query = {'$and': [query, after_cursor(field, *position)]}
+    docs = await collection.find(query, fields).sort(
+        [(field, -1), ('_id', -1)]
+    ).limit(limit + 1).to_list(None)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1][field], docs[-1]['_id'])
+    return docs, next_cursor
+
+
+async def list_posts(request, query, sort='new'):
+    """Return one page of the posts matching `query`, like
+    views.fetch_post.list_posts"""
+    per_page = max(1, min(int_arg(request, 'per_page', 10), MAX_PER_PAGE))
+    field, parse = SORT_ORDERS[sort]
+    posts = request.app.state.storage.collection(Post)
+    fields = projection(Post, POST_LIST_FIELDS + (field,))
+
+    if 'cursor' in request.query_params:
+        try:
+            docs, next_cursor = await keyset_page(
+                posts, query, fields, request.query_params['cursor'],
+                per_page, field=field, parse=parse
+            )
+        except InvalidCursor as e:
+            return {"error": str(e)}, 400
+        body = {
+            "posts": [serialize_post(doc) for doc in docs],
+            "next_cursor": next_cursor,
+            "per_page": per_page
+        }
+    else:
+        page = max(1, int_arg(request, 'page', 1))
+        total, docs = await asyncio.gather(
+            posts.count_documents(query),
+            posts.find(query, fields).sort([(field, -1), ('_id', -1)])
+            .skip((page - 1) * per_page).limit(per_page).to_list(None)
+        )
+        body = {
+            "posts": [serialize_post(doc) for doc in docs],
+            "total": total,
+            "pages": (total + per_page - 1) // per_page,
+            "current_page": page,
+            "per_page": per_page
+        }
+    if wants_my_vote(request):
+        await add_my_votes(request, body["posts"])
+    return body, 200
+
+
+# Posts
+
+async def feed(request):
+    community_ids = list(dict.fromkeys(
+        c for c in request.query_params.get('communities', '').split(',')
+        if c
+    ))
+    if not community_ids:
+        return error("communities is required")
+    if len(community_ids) > MAX_FEED_COMMUNITIES:
+        return error(f"at most {MAX_FEED_COMMUNITIES} communities")
+
+    limit = max(1, min(int_arg(request, 'limit', 10), MAX_PER_PAGE))
+    try:
+        cursor = request.query_params.get('cursor')
+        positions = decode_positions(cursor) if cursor else {}
+    except InvalidCursor as e:
+        return error(str(e))
+
+    # Read the streams of all the communities concurrently
+    posts = request.app.state.storage.collection(Post)
+    fields = projection(Post, POST_LIST_FIELDS + ('community_id',))
+
+    async def stream(community_id):
+        query = {'community_id': community_id}
+        if community_id in positions:
+            query.update(after_cursor('created_at', *positions[community_id]))
+        return await posts.find(query, fields).sort(
+            [('created_at', -1), ('_id', -1)]
+        ).limit(limit).to_list(None)
+
+    streams = dict(zip(community_ids, await asyncio.gather(
+        *(stream(community_id) for community_id in community_ids)
+    )))
+    docs, next_cursor = merge_streams(streams, positions, limit)
+
+    response = []
+    for doc in docs:
+        post = serialize_post(doc)
+        post["community_id"] = doc['community_id']
+        response.append(post)
+    if wants_my_vote(request):
+        await add_my_votes(request, response)
+    return JSONResponse({
+        "posts": response,
+        "next_cursor": next_cursor,
+        "limit": limit
+    })
+
+
+async def posts_by_community(request):
+    community_id = request.path_params['community_id']
+    sort = request.query_params.get('sort', 'new')
+    if sort not in SORT_ORDERS:
+        return error("sort must be one of: new, hot")
+
+    validators = None
+    if sort == 'new' and not wants_my_vote(request):
+        communities = request.app.state.storage.collection(Community)
+        fields = projection(Community, ('feed_version', 'feed_updated_at'))
+        community = await communities.find_one({'_id': community_id}, fields)
+        if community and not community.get('feed_updated_at'):
+            community = await communities.find_one_and_update(
+                {'_id': community_id}, start_feed_update(),
+                projection=fields, return_document=ReturnDocument.AFTER
+            )
+        if community:
+            validators = (
+                make_etag(
+                    community_id, community.get('feed_version', 0),
+                    request.url.query
+                ),
+                community.get('feed_updated_at')
+            )
+            cached = not_modified(request, *validators)
+            if cached:
+                return cached
+
+    body, status = await list_posts(
+        request, {'community_id': community_id}, sort
+    )
+    headers = validator_headers(*validators) \
+        if validators and status == 200 else None
+    return JSONResponse(body, status, headers)
+
+
+async def post_by_community_and_post(request):
+    community_id = request.path_params['community_id']
+    post_id = request.path_params['post_id']
+    post = await request.app.state.storage.collection(Post).find_one(
+        {'_id': post_id, 'community_id': community_id},
+        projection(Post, POST_LIST_FIELDS + ('updated_at',))
+    )
+    if not post:
+        return error("Post not found", 404)
+
+    etag = make_etag(post_id, post.get('updated_at'))
+    cached = not_modified(request, etag, post.get('updated_at'))
+    if cached:
+        return cached
+
+    response = serialize_post(post)
+    response["community_id"] = community_id
+    return JSONResponse(
+        response, headers=validator_headers(etag, post.get('updated_at'))
+    )
+
+
+async def posts_by_user(request):
+    body, status = await list_posts(
+        request, {'user_id': request.path_params['user_id']}
+    )
+    return JSONResponse(body, status)
+
+
+# Communities
+
+COMMUNITY_FIELDS = (
+    'id', 'name', 'description', 'moderators', 'created_by', 'updated_by',
+    'created_at', 'updated_at'
+)
+
+
+async def view_all_communities(request):
+    storage = request.app.state.storage
+    communities = await storage.collection(Community).find(
+        {}, projection(Community, COMMUNITY_FIELDS)
+    ).to_list(None)
+
+    loader = AsyncRefLoader(storage)
+    for c in communities:
+        loader.prime(User, user_refs(c))
+    await loader.resolve()
+
+    return JSONResponse([serialize_community(c, loader) for c in communities])
+
+
+async def view_single_community(request):
+    storage = request.app.state.storage
+    community = await storage.collection(Community).find_one(
+        {'_id': request.path_params['community_id']},
+        projection(Community, COMMUNITY_FIELDS)
+    )
+    if not community:
+        return error("Community not found", 404)
+
+    updated_at = community['updated_at']
+    etag = make_etag(community['_id'], updated_at)
+    cached = not_modified(request, etag, updated_at)
+    if cached:
+        return cached
+
+    loader = AsyncRefLoader(storage)
+    loader.prime(User, user_refs(community))
+    await loader.resolve()
+    return JSONResponse(
+        serialize_community(community, loader),
+        headers=validator_headers(etag, updated_at)
+    )
+
+
+# Therapists
+
+async def read_therapist(request):
+    storage = request.app.state.storage
+    therapist = await storage.collection(Therapist).find_one(
+        {'_id': request.path_params['therapist_id']},
+        projection(Therapist, PROFILE_FIELDS)
+    )
+    if not therapist:
+        return error("Therapist not found", 404)
+
+    updated_at = therapist['updated_at']
+    etag = make_etag(therapist['_id'], updated_at)
+    cached = not_modified(request, etag, updated_at)
+    if cached:
+        return cached
+
+    loader = AsyncRefLoader(storage)
+    loader.prime(User, therapist_refs(therapist))
+    await loader.resolve()
+    return JSONResponse(
+        serialize_profile(therapist, loader),
+        headers=validator_headers(etag, updated_at)
+    )
+
+
+async def view_all_therapists(request):
+    per_page = max(1, min(int_arg(request, 'per_page', 10), MAX_PER_PAGE))
+    try:
+        filters = directory_filters(request.query_params)
+    except ValueError as e:
+        return error(str(e))
+
+    storage = request.app.state.storage
+    try:
+        therapists, next_cursor = await keyset_page(
+            storage.collection(Therapist), filters,
+            projection(Therapist, DIRECTORY_FIELDS),
+            request.query_params.get('cursor'), per_page
+        )
+    except InvalidCursor as e:
+        return error(str(e))
+
+    loader = AsyncRefLoader(storage)
+    for t in therapists:
+        loader.prime(User, therapist_refs(t))
+    await loader.resolve()
+
+    entries = [serialize_entry(t, loader) for t in therapists]
+    if 'cursor' not in request.query_params:
+        headers = {'Link': next_link(str(request.url), next_cursor)} \
+            if next_cursor else None
+        return JSONResponse(entries, headers=headers)
+    return JSONResponse({
+        "therapists": entries,
+        "next_cursor": next_cursor,
+        "per_page": per_page
+    })
+
+
+# Likes
+
+def target_likes(field):
+    """Return the handler listing the likes of a target"""
+    async def handler(request):
+        cursor = request.app.state.storage.collection(Like).find(
+            {field: request.path_params[field]},
+            projection(Like, ('user_id', 'value'))
+        )
+        return JSONResponse(
+            [serialize_target_like(doc) async for doc in cursor]
+        )
+    return handler
+
+
+async def invalid_token(request, exc):
+    """Reject invalid access tokens like flask_jwt_extended does"""
+    status = 401 if isinstance(exc, jwt.ExpiredSignatureError) else 422
+    return JSONResponse({"msg": str(exc)}, status)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    app.state.storage = AsyncDBStorage()
+    yield
+    app.state.storage.close()
+
+
+routes = [
+    Route('/api/v1/posts/feed', feed),
+    Route('/api/v1/posts/community/{community_id}', posts_by_community),
+    Route(
+        '/api/v1/posts/community/{community_id}/post/{post_id}',
+        post_by_community_and_post
+    ),
+    Route('/api/v1/posts/user/{user_id}', posts_by_user),
+    Route('/api/v1/community/view-all-communities', view_all_communities),
+    Route(
+        '/api/v1/community/view-single-communities/{community_id}',
+        view_single_community
+    ),
+    Route(
+        '/api/v1/therapists/view-single-therapist/{therapist_id}',
+        read_therapist
+    ),
+    Route('/api/v1/therapists/view-all-therapist', view_all_therapists),
+    Route('/api/v1/like/post-like/{post_id}', target_likes('post_id')),
+    Route('/api/v1/like/comment-like/{comment_id}',
+          target_likes('comment_id')),
+    Route('/api/v1/like/therapist-like/{therapist_id}',
+          target_likes('therapist_id')),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    exception_handlers={jwt.InvalidTokenError: invalid_token}
+)
@@ -0,0 +1,74 @@
+"""
+Contains the AsyncDBStorage class for asynchronous MongoDB connections.
+"""
+
+from os import getenv
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.dataloader import RefLoader
+
+# Load environment variables from the .env file
+load_dotenv()
+
+
+class AsyncDBStorage:
+    """Interacts with the MongoDB database through the motor driver,
+    configured from the same environment as DBStorage"""
+
+    def __init__(self, client_class=AsyncIOMotorClient):
+        """Instantiate an AsyncDBStorage object. The client connects on
+        its first operation, in the running event loop."""
+        self.db_name = getenv('DB_NAME')
+        self.client = client_class(
+            host=getenv('DB_HOST', 'localhost'),
+            port=int(getenv('DB_PORT', 27017)),
+            username=getenv('DB_USERNAME'),
+            password=getenv('DB_PASSWORD')
+        )
+        self.db = self.client[self.db_name]
+
+    def collection(self, model):
+        """Return the collection of a mongoengine model"""
+        return self.db[model._get_collection_name()]
+
+    def close(self):
+        """Close the connections of the client"""
+        self.client.close()
+
+
+def projection(model, fields):
+    """Return the projection reading `fields` of `model`, by their
+    mongoengine names, so both tiers read the same fields"""
+    return {model._fields[name].db_field: True for name in fields}
+
+
+class AsyncRefLoader(RefLoader):
+    """A RefLoader whose primed references are fetched asynchronously.
+
+    Prime every reference, await `resolve`, then read them with the
+    synchronous `load`, `ref_id` and `ref_ids` of RefLoader.
+    """
+
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+
+    async def resolve(self):
+        """Fetch every pending reference, one query per model"""
+        for model in list(self._pending):
+            ids = self._pending.pop(model)
+            if not ids:
+                continue
+            cursor = self.storage.collection(model).find(
+                {'_id': {'$in': list(ids)}},
+                projection(model, model.loader_fields)
+                if model.loader_fields else None
+            )
+            found = {doc['_id']: doc async for doc in cursor}
+            cache = self._cache[model]
+            for ref_id in ids:
+                cache[ref_id] = found.get(ref_id)
+
+    def _fetch(self, model):
+        if self._pending.get(model):
+            raise RuntimeError("References must be resolved before loading")
@@ -1,4 +1,5 @@
-from flask import Flask
+from functools import partial
+from flask import Flask, send_file
 from flask_restful import Api
 from flask_jwt_extended import JWTManager
 from flasgger import Swagger
@@ -11,9 +12,13 @@ from views.admin_role_management import role_management_bp
 from views.therapist_management00 import therapist_blueprint
 from views.like_management import like_blueprint
 from views.fetch_post import fetch_post_blueprint
+from views.health import health_blueprint
+from views.diagnostics import diagnostics_blueprint
+from views.metrics import metrics_blueprint
 from dotenv import load_dotenv
-from os import getenv
+from os import getenv, path
 from views.post import post_blueprint
+from utils import metrics, query_stats, slow_ops
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,12 +33,31 @@ app.secret_key = getenv('FLASK_SECRET_KEY')
 app.config['JWT_SECRET_KEY'] = getenv('JWT_SECRET_KEY')
 jwt = JWTManager(app)
 
+# Record the slow MongoDB operations when enabled
+slow_ops.init_app(app)
+
+# Account for the MongoDB commands of every request, then collect the
+# metrics of every request, which include these commands
+query_stats.init_app(app)
+metrics.init_app(app)
+
 # Initialize Flask-RESTful API
 api = Api(app)
 
 # Initialize Flasgger
 swagger = Swagger(app)
 
+# Serve the spec built by management/build_openapi.py as-is when there is
+# one, instead of parsing every view docstring to build it
+OPENAPI_SPEC = path.abspath(getenv(
+    'OPENAPI_SPEC_FILE',
+    path.join(path.dirname(__file__), 'static', 'apispec_1.json')
+))
+if path.isfile(OPENAPI_SPEC):
+    app.view_functions['flasgger.apispec_1'] = partial(
+        send_file, OPENAPI_SPEC, mimetype='application/json'
+    )
+
 # Register the authentication routes
 app.register_blueprint(auth_blueprint)
 app.register_blueprint(user_blueprint)
@@ -44,6 +68,9 @@ app.register_blueprint(community_blueprint01)
 app.register_blueprint(therapist_blueprint)
 app.register_blueprint(like_blueprint)
 app.register_blueprint(fetch_post_blueprint)
+app.register_blueprint(health_blueprint)
+app.register_blueprint(diagnostics_blueprint)
+app.register_blueprint(metrics_blueprint)
 
 
 app.register_blueprint(post_blueprint)
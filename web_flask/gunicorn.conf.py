@@ -0,0 +1,68 @@
+"""
+Contains the gunicorn configuration of the production server:
+
+    gunicorn -c web_flask/gunicorn.conf.py web_flask.app:app
+
+The app is loaded once in the master process and forked into threaded
+workers. Every setting can be overridden through the environment.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from os import getenv
+
+bind = getenv('GUNICORN_BIND', f"0.0.0.0:{getenv('PORT', 5000)}")
+workers = int(getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(getenv('GUNICORN_THREADS', 4))
+timeout = int(getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then to bound the effect of any leak
+max_requests = int(getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+# Import the app before forking, so workers start fast and share memory
+preload_app = True
+
+accesslog = getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Workers keep their Prometheus metrics in files of this directory, for
+# /metrics to aggregate. It must be set before the app is loaded.
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'kozzy-metrics')
+)
+
+
+def on_starting(server):
+    """Start the metrics from zero"""
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def post_fork(server, worker):
+    """Give each worker its own MongoDB client and connection pool,
+    instead of the one created in the master when the app was loaded"""
+    from models.engines.db_storage import storage, replica_storage
+    storage.reconnect()
+    if replica_storage:
+        replica_storage.reconnect()
+
+
+def child_exit(server, worker):
+    """Drop the in-flight and pool gauges of a worker that stopped"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    """Close the worker's connections when it stops"""
+    from models.engines.db_storage import storage, replica_storage
+    storage.close()
+    if replica_storage:
+        replica_storage.close()